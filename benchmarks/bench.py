@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+# micro and end-to-end benchmarks. Results are appended to a history file so runs can be compared.
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import corpus
+import gcode_parser
+import spline
+import discretize
+import move
+from motion_profiles import s_curve_profile, s_curve_profiles
+import numpy as np
+
+DEFAULT_HISTORY = os.path.join(ROOT, 'benchmarks', 'history.jsonl')
+
+dynamic_model = [
+    move.spring_damper_parameters(f_n = 60.5, zeta = 0),
+    move.spring_damper_parameters(f_n = 52, zeta = 0.025),
+    move.spring_damper_parameters(),
+    move.pressure_advance_parameters(k = 0.08),
+]
+axis_limits = [move.axis_limits(speed = 500), move.axis_limits(speed = 500), move.axis_limits(speed = 24, accel = 1000, jerk = 1000000), None]
+tolerances = [0.002, 0.002, 0.05, 0.1]
+
+# seconds per call of fn, best of a few timeit runs
+def _time(fn):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat = 3, number = number)) / number
+
+def micro_benchmarks():
+    positions = move.generate_move([0, 0, 0.2, 0], [20, 10, 0.2, 1], 100, 10000, 2000000, dynamic_model, axis_limits)
+    kinked = spline.kinked_line(0.8, 1.2)
+    accel = s_curve_profile(20, 100, 10000, 2000000)
+    signal = accel + accel.integrate() * 0.05
+    lines = corpus.gyroid(1)[:2000]
+    distances = np.linspace(0.1, 50, 1000)
+
+    return {
+        's_curve_profile': _time(lambda: s_curve_profile(20, 100, 10000, 2000000)),
+        's_curve_profiles (per move)': _time(lambda: s_curve_profiles(distances, 100, 10000, 2000000)) / len(distances),
+        'generate_move': _time(lambda: move.generate_move([0, 0, 0.2, 0], [20, 10, 0.2, 1], 100, 10000, 2000000, dynamic_model, axis_limits)),
+        'linear_interpolate': _time(lambda: discretize.linear_interpolate(positions, tolerances, 1/200)),
+        'spline.composite': _time(lambda: spline.composite(kinked, signal)),
+        'spline.kinked_composite': _time(lambda: spline.kinked_composite([signal], 0.8, 1.2)),
+        'gcode_parser.parse (per line)': _time(lambda: [gcode_parser.parse(line) for line in lines]) / len(lines),
+    }
+
+# run process.py on a file, returns wall time, output line count and peak RSS (bytes, None if unavailable)
+def _run_process(path, jobs):
+    command = [sys.executable, os.path.join(ROOT, 'process.py'), '--jobs', str(jobs)]
+    with open(path) as stdin, tempfile.TemporaryFile('w+') as stdout:
+        start = time.perf_counter()
+        child = subprocess.Popen(command, stdin = stdin, stdout = stdout, stderr = subprocess.DEVNULL, cwd = ROOT)
+        peak_rss = None
+        if hasattr(os, 'wait4'):
+            _, status, usage = os.wait4(child.pid, 0)
+            child.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+            # ru_maxrss is in kilobytes on Linux and bytes on macOS
+            peak_rss = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        else:
+            child.wait()
+        elapsed = time.perf_counter() - start
+        if child.returncode != 0:
+            raise RuntimeError(f'process.py failed on {path}')
+        stdout.seek(0)
+        output_lines = sum(1 for _ in stdout)
+    return elapsed, output_lines, peak_rss
+
+def end_to_end_benchmarks(scale, jobs):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in sorted(corpus.CORPUS):
+            lines = corpus.generate(name, scale)
+            path = os.path.join(directory, name + '.gcode')
+            with open(path, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+            elapsed, output_lines, peak_rss = _run_process(path, jobs)
+            results[name] = {
+                'input_lines': len(lines),
+                'output_lines': output_lines,
+                'seconds': elapsed,
+                'input_lines_per_s': len(lines) / elapsed,
+                'output_lines_per_s': output_lines / elapsed,
+                'peak_rss_mb': peak_rss / 2**20 if peak_rss is not None else None,
+            }
+    return results
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = ROOT, capture_output = True, text = True).stdout.strip() or None
+    except OSError:
+        return None
+
+def _load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def _ratio(new, old):
+    return f'{new / old:6.2f}x' if old else '      '
+
+def report(run, previous = None):
+    print(f"micro benchmarks ({run['revision']}, {run['time']})")
+    for name, seconds in run['micro'].items():
+        old = previous['micro'].get(name) if previous else None
+        print(f'  {name:32s} {seconds * 1e6:12.2f} µs  {_ratio(seconds, old)}')
+    if run['end_to_end']:
+        print(f"end to end (scale {run['scale']}, jobs {run['jobs']})")
+        for name, r in run['end_to_end'].items():
+            old = previous['end_to_end'].get(name) if previous else None
+            rss = f"{r['peak_rss_mb']:8.1f} MB" if r['peak_rss_mb'] is not None else '       - MB'
+            print(f"  {name:16s} {r['input_lines']:8d} -> {r['output_lines']:8d} lines  {r['input_lines_per_s']:10.0f} in/s  "
+                  f"{r['output_lines_per_s']:10.0f} out/s  {rss}  {_ratio(r['seconds'], old['seconds'] if old else None)}")
+    if previous:
+        print(f"  (ratios are times relative to {previous['revision']}, {previous['time']})")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the G-code processing pipeline')
+    parser.add_argument('--scale', type=float, default=1.0, help='scale of the synthetic G-code corpus (default: 1)')
+    parser.add_argument('--jobs', type=int, default=1, help='worker processes for the end-to-end runs (default: 1)')
+    parser.add_argument('--micro-only', action='store_true', help='skip the end-to-end runs')
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help=f'file the results are appended to (default: {os.path.relpath(DEFAULT_HISTORY, ROOT)})')
+    parser.add_argument('--no-save', action='store_true', help="don't append the results to the history")
+    args = parser.parse_args()
+
+    history = _load_history(args.history)
+    run = {
+        'time': datetime.now(timezone.utc).isoformat(timespec = 'seconds'),
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'scale': args.scale,
+        'jobs': args.jobs,
+        'micro': micro_benchmarks(),
+        'end_to_end': {} if args.micro_only else end_to_end_benchmarks(args.scale, args.jobs),
+    }
+    comparable = [r for r in history if r['scale'] == run['scale'] and r['jobs'] == run['jobs']]
+    report(run, comparable[-1] if comparable else None)
+
+    if not args.no_save:
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(run) + '\n')
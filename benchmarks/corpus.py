@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+# deterministic synthetic G-code for benchmarking, each generator returns a list of lines
+
+import argparse
+import random
+import sys
+from math import pi, sin, cos, hypot
+
+FILAMENT_AREA = pi * (1.75/2)**2
+
+def _header(e_relative = False):
+    return ['; synthetic benchmark G-code', 'G21', 'G90', 'M83' if e_relative else 'M82', 'G92 E0', 'M106 S255']
+
+class _printer:
+    def __init__(self, e_relative = False, layer_height = 0.2, width = 0.45):
+        self.lines = _header(e_relative)
+        self.e_relative = e_relative
+        self.section = layer_height * width / FILAMENT_AREA # mm of filament per mm of extrusion
+        self.x = self.y = 0
+        self.e = 0
+
+    def travel(self, x, y, z = None, f = 9000):
+        z_word = f' Z{z:.3f}' if z is not None else ''
+        self.lines.append(f'G0 X{x:.3f} Y{y:.3f}{z_word} F{f}')
+        self.x, self.y = x, y
+
+    def extrude(self, x, y, f = None, z = None):
+        e = hypot(x - self.x, y - self.y) * self.section
+        self.e += e
+        z_word = f' Z{z:.3f}' if z is not None else ''
+        f_word = f' F{f}' if f is not None else ''
+        self.lines.append(f'G1 X{x:.3f} Y{y:.3f}{z_word} E{e if self.e_relative else self.e:.5f}{f_word}')
+        self.x, self.y = x, y
+
+    def retract(self, length = 0.8):
+        self.e -= length
+        self.lines.append(f'G1 E{-length if self.e_relative else self.e:.5f} F2400')
+        self.e += length
+        self.lines.append(f'G1 E{length if self.e_relative else self.e:.5f} F2400')
+
+    def layer(self, z):
+        self.lines.append(';LAYER_CHANGE')
+        self.lines.append(f'G1 Z{z:.3f} F600')
+
+# a hollow cube, perimeters only
+def cube(layers = 50, size = 20, perimeters = 2, e_relative = False):
+    p = _printer(e_relative)
+    for layer in range(layers):
+        p.layer(0.2 * (layer + 1))
+        for i in range(perimeters):
+            a, b = 100 - size/2 + 0.45*i, 100 + size/2 - 0.45*i
+            p.travel(a, a)
+            p.extrude(b, a, f = 3600)
+            p.extrude(b, b)
+            p.extrude(a, b)
+            p.extrude(a, a)
+            p.retract()
+    return p.lines
+
+# dense, gyroid-style infill: short wavy segments filling a square
+def gyroid(layers = 5, size = 40, spacing = 1.0, segment = 0.4):
+    p = _printer()
+    for layer in range(layers):
+        z = 0.2 * (layer + 1)
+        p.layer(z)
+        phase = z * 2
+        rows = int(size / spacing)
+        for row in range(rows):
+            y0 = 100 - size/2 + row * spacing
+            xs = [100 - size/2 + i * segment for i in range(int(size / segment) + 1)]
+            if row % 2:
+                xs.reverse()
+            p.travel(xs[0], y0 + 0.4 * sin(xs[0] + phase))
+            for k, x in enumerate(xs[1:]):
+                p.extrude(x, y0 + 0.4 * sin(x + phase), f = 6000 if k == 0 else None)
+    return p.lines
+
+# circles made of tiny segments, as slicers output for curved perimeters
+def tiny_segments(layers = 10, radius = 15, segment = 0.1):
+    p = _printer()
+    n = int(2 * pi * radius / segment)
+    for layer in range(layers):
+        p.layer(0.2 * (layer + 1))
+        p.travel(100 + radius, 100)
+        for i in range(1, n + 1):
+            a = 2 * pi * i / n
+            p.extrude(100 + radius * cos(a), 100 + radius * sin(a), f = 3000 if i == 1 else None)
+        p.retract()
+    return p.lines
+
+# spiral vase: a single continuous perimeter with Z rising along every segment
+def vase(turns = 20, radius = 20, sides = 120):
+    p = _printer()
+    p.layer(0.2)
+    p.travel(100 + radius, 100)
+    for i in range(1, turns * sides + 1):
+        a = 2 * pi * i / sides
+        p.extrude(100 + radius * cos(a), 100 + radius * sin(a), z = 0.2 + 0.2 * i / sides, f = 2400 if i == 1 else None)
+    return p.lines
+
+# randomly placed short features with relative extrusion
+def relative_e(moves = 2000, seed = 1):
+    rng = random.Random(seed)
+    p = _printer(e_relative = True)
+    p.layer(0.2)
+    p.travel(100, 100)
+    for i in range(moves):
+        x = min(max(p.x + rng.uniform(-5, 5), 50), 150)
+        y = min(max(p.y + rng.uniform(-5, 5), 50), 150)
+        p.extrude(x, y, f = rng.choice([1800, 3600, 6000]))
+        if i % 50 == 49:
+            p.retract()
+    return p.lines
+
+CORPUS = {
+    'cube': cube,
+    'gyroid': gyroid,
+    'tiny_segments': tiny_segments,
+    'vase': vase,
+    'relative_e': relative_e,
+}
+
+def generate(name, scale = 1.0):
+    generator = CORPUS[name]
+    defaults = generator.__defaults__
+    # scale the first (size) parameter of each generator
+    return generator(max(1, int(defaults[0] * scale)), *defaults[1:])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic benchmark G-code file to stdout')
+    parser.add_argument('name', choices=sorted(CORPUS))
+    parser.add_argument('--scale', type=float, default=1.0, help='scale the number of layers/moves (default: 1)')
+    args = parser.parse_args()
+    sys.stdout.write('\n'.join(generate(args.name, args.scale)) + '\n')
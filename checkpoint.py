@@ -0,0 +1,46 @@
+# checkpoints of a run of process.py over large files: the input and output byte offsets at a point where all
+# output for the input so far has been written, along with the parser state. An interrupted run resumes from the
+# last checkpoint, truncating the output to its offset and reading the input from there.
+
+import json
+import os
+
+# iterates the lines of a binary stream as text, keeping track of the byte offset of the next line
+class line_reader:
+    def __init__(self, stream, encoding = 'utf-8', errors = 'strict', offset = 0):
+        self.stream = stream
+        self.encoding = encoding
+        self.errors = errors
+        self.offset = offset
+
+    def __iter__(self):
+        for raw in self.stream:
+            self.offset += len(raw)
+            line = raw.decode(self.encoding, self.errors)
+            if line.endswith('\r\n'):
+                line = line[:-2] + '\n' # as in text mode
+            yield line
+
+# write the checkpoint (a dict) to path, atomically replacing the previous one
+def save(path, checkpoint):
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+# make the output file end at the checkpoint's offset, and position the input at it
+def rewind(checkpoint, input_fd, output_fd):
+    input_size = os.fstat(input_fd).st_size
+    output_size = os.fstat(output_fd).st_size
+    if checkpoint['input_offset'] > input_size or checkpoint['output_offset'] > output_size:
+        raise ValueError(f"checkpoint at input byte {checkpoint['input_offset']}, output byte {checkpoint['output_offset']} "
+                         f"is past the end of the input ({input_size} bytes) or output ({output_size} bytes)")
+    os.lseek(input_fd, checkpoint['input_offset'], os.SEEK_SET)
+    os.ftruncate(output_fd, checkpoint['output_offset'])
+    os.lseek(output_fd, checkpoint['output_offset'], os.SEEK_SET)
@@ -49,7 +49,40 @@ class curve_parameters:
         0.100, # e (0.1mm) # low tolerance to prevent pressure advance from adding nodes at the potential detriment of the xy spring-damper control
     ]
     min_dt = 1/200
+    max_segments = None # optional cap on the number of segments per move, the worst errors are refined first
     
+# moves with the same shape (delta vector, speed and parameters) reuse a cached, discretized profile
+class cache_parameters:
+    max_bytes = 64 * 1024**2 # memory cap of the profile cache (per worker process), 0 disables the cache
+    quantum = 1e-6           # mm, resolution of the move delta vectors that are considered the same shape
+
+# moves are planned over a window of upcoming moves, so that consecutive moves are joined at speed where the change
+# in direction allows it, instead of stopping at every junction. The velocity step of an axis at a junction is kept
+# within its curve tolerance (residual vibration and correction); max_velocity_step applies to axes without a model.
+class junction_parameters:
+    window = 16 # moves of look ahead, 0 stops at every junction
+    max_velocity_step = [1, 1, 0.5, 1] # mm/s, x y z e
+
+# runs of short, low angle moves (e.g. arcs and curves exported as many tiny segments) are smoothed into one path:
+# a natural cubic spline fit to their vertices, that is run through as one move with a single feedrate profile and
+# spring-damper correction. The knots are refined until the path is within tolerance of the moves, moves it can't
+# be fit to are left as single moves.
+class chain_parameters:
+    min_moves = 4             # shortest run that is smoothed, 0 disables smoothing
+    max_moves = 256           # longest run smoothed as one path
+    max_segment_length = 1.0  # mm, longer moves are never part of a chain
+    max_angle = 10            # degrees, largest change in direction between consecutive moves of a chain
+    tolerance = 0.01          # mm, largest deviation of the smoothed path from the original moves, per axis
+    knot_spacing = 2.0        # mm, initial distance between the knots of the spline
+
+# throughput of the firmware, used to predict when the output would starve its motion planner. Moves that would
+# are written with locally relaxed tolerances (fewer segments). Set max_segments_per_s to None to disable.
+class planner_parameters:
+    max_segments_per_s = 1000 # segments the firmware can plan per second
+    buffer_depth = 40         # segments in the firmware's look-ahead queue
+    serial_cost = 0           # seconds to transmit one line, e.g. 0.0025 for ~30 bytes at 115200 baud (0 when printing from SD)
+    max_relaxation = 8        # largest factor the tolerances may be relaxed by
+
 def disable_acceleration_control():
     print('M566 P1') # RRF Jerk Policy 1
     print('M572 D0 S0') #  disable pressure advance
@@ -10,7 +10,7 @@ def plot_spline(spline):
 	right = spline.knots[-1]
 	o = 0# 0.02 * (right-left)
 	xx = np.linspace(left-o, right+o, 1000)
-	yy = [spline[x] for x in xx]
+	yy = spline.evaluate(xx)
 	
 	plt.plot(xx,yy)
 	#plt.plot([left, right],[spline[left],spline[right]],'o')
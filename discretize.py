@@ -1,56 +1,87 @@
 import spline
 import polynomial as poly
+import stats
 from math import nan
 import numpy as np
-from heapq import merge
-
-# find an optimal discretization point to (if necessary) refine the linear interpolation of curve in the open interval (a,b)
-def _find_subdivision_point(polynomials, tolerances, a, b):
-    assert b > a
-    
-    worst_x = nan
-    worst_re = 1 # error relative to cordial tolerance
-
-    for i in range(len(polynomials)):
-        polynomial = polynomials[i]
-        # calculate the equation for the line approximation
-        line = poly.line_from_to(a, poly.eval(polynomial,a), b, poly.eval(polynomial,b))
-
-        error = poly.sub(polynomial, line)
-        extremes = poly.find_roots(poly.differentiate(error), a, b)
-
-        if extremes:
-            errors = [abs(poly.eval(error,e)) for e in extremes]
-            worst_index = np.argmax(errors)
-            worst_relative_magnitude = errors[worst_index] / tolerances[i]
-            if worst_relative_magnitude > worst_re:
-                worst_re = worst_relative_magnitude
-                worst_x = extremes[worst_index]
-
-    if worst_re > 1:
-        return worst_x
-    else:
-        return None
+from heapq import heappush, heappop
+from itertools import count
+
+# find optimal discretization points to (if necessary) refine the linear interpolation of a batch of intervals
+# coeffs = (m, axes, degree+1) polynomials of the axes valid on the open intervals (a, b), for m intervals
+# returns (worst error relative to the tolerance, point) per interval, the error is <= 1 for intervals within tolerance
+def _find_subdivision_points(coeffs, tolerances, a, b):
+    assert np.all(b > a)
+    m, axes, width = coeffs.shape
+    if width < 2:
+        return np.zeros(m), np.full(m, nan)
+
+    # error of the line approximation of every axis, and its extremes
+    flat = coeffs.reshape(m * axes, width)
+    a_flat = np.repeat(a, axes)
+    b_flat = np.repeat(b, axes)
+    y_a = poly.eval_batch(flat, a_flat[:,np.newaxis])[:,0]
+    y_b = poly.eval_batch(flat, b_flat[:,np.newaxis])[:,0]
+    slope = (y_b - y_a) / (b_flat - a_flat)
+
+    error_derivative = poly.differentiate_batch(flat)
+    error_derivative[:,0] -= slope
+    extremes = poly.find_roots_batch(error_derivative, a_flat, b_flat)
+    if extremes.shape[1] == 0:
+        return np.zeros(m), np.full(m, nan)
+
+    errors = np.abs(poly.eval_batch(flat, extremes) - (y_a[:,np.newaxis] + slope[:,np.newaxis] * (extremes - a_flat[:,np.newaxis])))
+    relative = errors / np.repeat(np.tile(tolerances, m), extremes.shape[1]).reshape(errors.shape)
+    relative = np.where(np.isnan(relative), 0, relative).reshape(m, -1)
+    extremes = extremes.reshape(m, -1)
+
+    worst = np.argmax(relative, axis=1)
+    rows = np.arange(m)
+    return relative[rows, worst], extremes[rows, worst]
 
 import sys # tmp
 
-# find a set of internal discretization points for a linear interpolation of a polynomial subject to tolerances
-def _recursive_find_points(polynomials, tolerances, min_dt, a, b):
-    assert b >= a
-    if b-a < min_dt:
-        return []
+# refine a set of intervals by repeatedly splitting the one with the largest relative error
+# intervals = (a, b, coeffs) arrays where coeffs are the per-axis pieces valid on [a,b], see _knot_intervals
+# stops when every interval is within tolerance (or narrower than min_dt), or when the total number
+# of segments reaches max_segments. Returns the sorted internal points added to each interval.
+def _refine_intervals(intervals, tolerances, min_dt, max_segments = None):
+    a, b, coeffs = intervals
+    points = [[] for _ in a]
+    segments = len(a)
+    order = count() # tie breaker for equal errors
+    heap = []
+    max_depth = 0
 
-    x = _find_subdivision_point(polynomials, tolerances, a, b)
-    if x is not None:
-        return _recursive_find_points(polynomials, tolerances, min_dt, a, x) + [x] + _recursive_find_points(polynomials, tolerances, min_dt, x, b)
-    else:
-        return []
+    # split the intervals [(index, a, b)] that are wide enough and not within tolerance
+    def push(candidates, depth):
+        candidates = [c for c in candidates if c[2] - c[1] >= min_dt]
+        if not candidates:
+            return
+        index, lo, hi = (np.array(c) for c in zip(*candidates))
+        relative_errors, xs = _find_subdivision_points(coeffs[index], tolerances, lo, hi)
+        for i, relative_error, x, l, h in zip(index.tolist(), relative_errors.tolist(), xs.tolist(), lo.tolist(), hi.tolist()):
+            if relative_error > 1:
+                heappush(heap, (-relative_error, next(order), i, l, h, x, depth))
 
-# find a set of discretization points to jointly linearly approximate a set of spline curves
-def _find_discretization_points(curves, tolerances, min_dt):
-    if not curves:
-        return []
-    
+    push(list(zip(range(len(a)), a, b)), 1)
+
+    while heap and (max_segments is None or segments < max_segments):
+        _, _, index, lo, hi, x, depth = heappop(heap)
+        points[index].append(x)
+        segments += 1
+        max_depth = max(max_depth, depth)
+        push([(index, lo, x), (index, x, hi)], depth + 1)
+
+    stats.record('subdivision_depth', max_depth)
+    if max_segments is not None and heap:
+        stats.count('segment_budget_reached')
+
+    for p in points:
+        p.sort()
+    return points
+
+# split a set of curves with equal knots into intervals, as arrays (a, b, coeffs), coeffs[i] = (axes, degree+1) polynomials on [a[i], b[i]]
+def _knot_intervals(curves):
     # assert all curves have the same knots
     for i in range(len(curves)-1):
         if not np.array_equal(curves[i].knots, np.array(curves[i+1].knots)):
@@ -60,27 +91,66 @@ def _find_discretization_points(curves, tolerances, min_dt):
         assert np.array_equal(curves[i].knots, np.array(curves[i+1].knots))
 
     points = curves[0].knots
-    additional = []
-    for i in range(len(points)-1):
-        a = points[i]
-        b = points[i+1]
-        polys = [curves[j].polys[i+1] for j in range(len(curves))]
-        additional.extend(_recursive_find_points(polys, tolerances, min_dt, a, b))
-    
-    return list(merge(points, additional))
-    
-# input n curves, output n+1 lists of points, the last one being the t coordinate for the discretized points
-# tolerances = list of n cordial tolerances
-# min_dt = smallest discretization in t
+    width = max(c.coeffs.shape[1] for c in curves)
+    coeffs = np.stack([poly.pad_batch(c.coeffs[1:-1], width) for c in curves], axis=1)
+    return points[:-1], points[1:], coeffs
+
+# find a set of discretization points for each of a batch of moves (each a set of spline curves)
+# max_segments is shared by the whole batch, so the worst intervals across all moves are refined first
+def _find_batch_discretization_points(moves, tolerances, min_dt, max_segments = None):
+    intervals = [_knot_intervals(curves) for curves in moves if curves]
+    if not intervals:
+        return [[] for _ in moves]
+    if len(intervals) == 1:
+        intervals = intervals[0]
+    else:
+        width = max(coeffs.shape[2] for _, _, coeffs in intervals)
+        intervals = (np.concatenate([a for a, _, _ in intervals]), np.concatenate([b for _, b, _ in intervals]),
+                     np.concatenate([poly.pad_batch(coeffs, width) for _, _, coeffs in intervals]))
 
-def linear_interpolate(curves, tolerances, min_dt):
+    additional = _refine_intervals(intervals, tolerances, min_dt, max_segments)
 
-    pts = _find_discretization_points(curves, tolerances, min_dt)
+    ret = []
+    i = 0
+    for curves in moves:
+        if not curves:
+            ret.append([])
+            continue
+        knots = curves[0].knots
+        points = list(knots[:1])
+        for k in range(1, len(knots)):
+            points.extend(additional[i])
+            points.append(knots[k])
+            i += 1
+        ret.append(points)
+    return ret
 
+# find a set of discretization points to jointly linearly approximate a set of spline curves
+def _find_discretization_points(curves, tolerances, min_dt, max_segments = None):
+    if not curves:
+        return []
+
+    return _find_batch_discretization_points([curves], tolerances, min_dt, max_segments)[0]
+
+def _interpolate(curves, pts):
     out = np.zeros((len(curves)+1, len(pts)))
     for i in range(len(curves)):
-        for j in range(len(pts)):
-            out[i,j] = curves[i][pts[j]]
+        out[i,:] = curves[i].evaluate(pts)
     out[-1,:] = pts
-
     return out
+
+# input n curves, output n+1 lists of points, the last one being the t coordinate for the discretized points
+# tolerances = list of n cordial tolerances
+# min_dt = smallest discretization in t
+# max_segments = optional cap on the number of output segments, the worst intervals are refined first
+
+def linear_interpolate(curves, tolerances, min_dt, max_segments = None):
+
+    pts = _find_discretization_points(curves, tolerances, min_dt, max_segments)
+
+    return _interpolate(curves, pts)
+
+# linear_interpolate for a batch of moves, with a segment budget shared by the whole batch
+def linear_interpolate_batch(moves, tolerances, min_dt, max_segments = None):
+    pts = _find_batch_discretization_points(moves, tolerances, min_dt, max_segments)
+    return [_interpolate(moves[m], pts[m]) if moves[m] else None for m in range(len(moves))]
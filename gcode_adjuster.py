@@ -1,6 +1,11 @@
-from math import sqrt, isnan
+from math import sqrt
+from collections import Counter
 import move
+import smoothing
 import discretize
+import move_cache
+import gcode_writer
+import stats
 
 def norm(vector):
     return sqrt(sum([x**2 for x in vector]))
@@ -8,8 +13,25 @@ def norm(vector):
 def distance(p1, p2):
     return norm([p2[i]-p1[i] for i in range(len(p1))])
 
-# return True if the move was processed
-def process(source, destination, target_speed, e_relative, motion_parameters, curve_parameters, calibration_adjustment):
+# generate and discretize a move, returns None for a zero move
+def _generate_points(source, destination, target_speed, target_accel, target_jerk, motion_parameters, curve_parameters, junction_speeds = (0, 0), events = move.throttle_events):
+    with stats.stage('generate_move'):
+        move_profile = move.generate_move(source, destination, max_speed = target_speed, max_accel = target_accel, max_jerk = target_jerk, dynamic_model = motion_parameters.dynamic_model, axis_limits = motion_parameters.axis_limits,
+                                          start_speed = junction_speeds[0], end_speed = junction_speeds[1], events = events)
+
+    if not move_profile:
+        return None
+
+    with stats.stage('discretize'):
+        return discretize.linear_interpolate(move_profile, curve_parameters.tolerances, curve_parameters.min_dt, curve_parameters.max_segments)
+
+# return the discretized move as (points, e_offset), or None if the move should be left unmodified.
+# points (see discretize.linear_interpolate) are centered around zero extrusion, add e_offset for the absolute E
+# position. points is None if the move is consumed without any output.
+# cache = optional move_cache.profile_cache, reusing the profiles of moves with the same shape
+# junction_speeds = (start, end) speeds of the move, see lookahead.junction_planner
+# events = the Counter of axis limit throttling (see move.throttle)
+def adjust(source, destination, target_speed, e_relative, motion_parameters, curve_parameters, calibration_adjustment, cache = None, junction_speeds = (0, 0), events = move.throttle_events):
 
     calibration_adjustment(destination[2])
 
@@ -22,9 +44,9 @@ def process(source, destination, target_speed, e_relative, motion_parameters, cu
     if move_distance == 0:
         # extruder-only move
         if distance(source, destination) == 0:
-            return True # a non-move, ignore
+            return None, e_offset # a non-move, ignore
 
-        return False # optional: don't adjust extruder-only moves
+        return None # optional: don't adjust extruder-only moves
 
         target_speed = min(target_speed, motion_parameters.non_motion_max_speed)
         target_accel = motion_parameters.non_motion_accel
@@ -34,35 +56,68 @@ def process(source, destination, target_speed, e_relative, motion_parameters, cu
         target_accel = motion_parameters.accel
         target_jerk = motion_parameters.jerk
 
-    move_profile = move.generate_move(source, destination, max_speed = target_speed, max_accel = target_accel, max_jerk = target_jerk, dynamic_model = motion_parameters.dynamic_model, axis_limits = motion_parameters.axis_limits)
-    
-    if not move_profile:
-        # A zero move. Skip it and continue.
-        return True
-
-    points = discretize.linear_interpolate(move_profile, curve_parameters.tolerances, curve_parameters.min_dt)
-        
-    for j in range(1, len(points[0])):
-        last = points[:,j-1]
-        curr = points[:,j]
-        # how long is the move in time
-        dt = curr[-1] - last[-1]
-        # and in distance
-        ds = distance(last[:3], curr[:3])
-        
-        if ds == 0:
-            ds = distance(last, curr)
-
-        feedrate = ds / dt
-
-        if e_relative:
-            e_value = curr[3] - last[3]
-        else:
-            e_value = curr[3] + e_offset
-
-        if isnan(norm(curr)) or isnan(e_value) or isnan(feedrate):
-            assert False, "Sanity Check Failed: NaN encountered in output, aborting"
-
-        print(f'G1 X{curr[0]:.4f} Y{curr[1]:.4f} Z{curr[2]:.4f} E{e_value:.5f} F{60 * feedrate:.3f}')
-    
+    generate = lambda source, destination: _generate_points(source, destination, target_speed, target_accel, target_jerk, motion_parameters, curve_parameters, junction_speeds, events)
+    if cache is not None:
+        parameters = (target_speed, target_accel, target_jerk, tuple(junction_speeds),
+                      move_cache.parameters_key(motion_parameters.dynamic_model), move_cache.parameters_key(motion_parameters.axis_limits),
+                      tuple(curve_parameters.tolerances), curve_parameters.min_dt, curve_parameters.max_segments)
+        points = cache.get(source, destination, parameters, generate)
+    else:
+        points = generate(source, destination)
+
+    return points, e_offset
+
+# return a chain of moves smoothed into one path (a smoothing.chain_fit, see smoothing.chain_detector), discretized
+# as (points, e_offset) like adjust
+def adjust_chain(fit, target_speed, e_relative, motion_parameters, curve_parameters, calibration_adjustment, junction_speeds = (0, 0), events = move.throttle_events):
+
+    calibration_adjustment(fit.vertices[-1,2])
+
+    with stats.stage('generate_move'):
+        move_profile = smoothing.generate_chain(fit, min(target_speed, motion_parameters.max_speed), motion_parameters.accel, motion_parameters.jerk,
+                                                motion_parameters.dynamic_model, motion_parameters.axis_limits, curve_parameters.tolerances, *junction_speeds, events = events)
+
+    with stats.stage('discretize'):
+        return discretize.linear_interpolate(move_profile, curve_parameters.tolerances, curve_parameters.min_dt, curve_parameters.max_segments), fit.e_offset
+
+# adjust a path, either a single move as [source, destination] or a smoothing.chain_fit
+def adjust_path(path, target_speed, e_relative, motion_parameters, curve_parameters, calibration_adjustment, cache = None, junction_speeds = (0, 0), events = move.throttle_events):
+    if isinstance(path, smoothing.chain_fit):
+        return adjust_chain(path, target_speed, e_relative, motion_parameters, curve_parameters, calibration_adjustment, junction_speeds, events)
+    return adjust(*path, target_speed, e_relative, motion_parameters, curve_parameters, calibration_adjustment, cache, junction_speeds, events)
+
+# return True if the move was processed
+def process(source, destination, target_speed, e_relative, motion_parameters, curve_parameters, calibration_adjustment):
+    result = adjust(source, destination, target_speed, e_relative, motion_parameters, curve_parameters, calibration_adjustment)
+    if result is None:
+        return False
+    points, e_offset = result
+    if points is not None:
+        print(gcode_writer.g1_writer(curve_parameters.tolerances).format(points, e_offset, e_relative), end='')
     return True
+
+_worker_cache = None
+
+# counters of a worker process (or an output, see process.ordered_output): profile cache hits/misses and the axis limit
+# throttle events
+def counters(cache = None, events = move.throttle_events):
+    ret = Counter({'throttle_' + kind: n for kind, n in events.items()})
+    if cache is not None:
+        ret['cache_hits'] = cache.hits
+        ret['cache_misses'] = cache.misses
+    return ret
+
+# adjust a chunk of moves given as tuples of (path, target_speed, e_relative, junction_speeds), used by worker processes
+# each worker process keeps its own profile cache (if cache_parameters enable it). Returns the adjusted moves along
+# with the change in counters() during this chunk, and the change in stats.totals and stats.maxima if collect_stats
+def adjust_chunk(moves, motion_parameters, curve_parameters, calibration_adjustment, cache_parameters = None, collect_stats = False):
+    global _worker_cache
+    if _worker_cache is None and cache_parameters is not None and cache_parameters.max_bytes > 0:
+        _worker_cache = move_cache.profile_cache(cache_parameters.max_bytes, cache_parameters.quantum)
+
+    stats.enabled = collect_stats
+    before = counters(_worker_cache)
+    stats_before, _ = stats.snapshot()
+    out = [adjust_path(*m[:3], motion_parameters, curve_parameters, calibration_adjustment, _worker_cache, *m[3:]) for m in moves]
+    stats_after, maxima = stats.snapshot()
+    return out, counters(_worker_cache) - before, (stats_after - stats_before, maxima)
@@ -1,18 +1,54 @@
+import re
+import numpy as np
+from types import MappingProxyType
 
+# a word is a letter followed by a number, e.g. G1 or X-1.25. Spaces between words are optional (G1X10Y20).
+# Exponents are not allowed, since E is the extruder axis (X1E5 is X1 E5).
+_WORD = re.compile(r'([A-Za-z])([-+]?(?:\d+\.?\d*|\.\d+))')
+
+# blank and comment-only lines
+_EMPTY_LINE = re.compile(r'\s*(?:;|$)')
+
+_EMPTY = MappingProxyType({}) # shared (read-only) result for lines without words
+
+# parse a line into a dict of {letter: value}. Comments, checksums and anything that is not a word
+# (e.g. the message of an M117) are ignored.
 def parse(line):
+    if _EMPTY_LINE.match(line):
+        return _EMPTY
+
     comment = line.find(';')
     if comment > -1:
         line = line[:comment]
-    
+
+    words = _WORD.findall(line)
+    if not words:
+        return _EMPTY
+    return {letter.upper(): float(value) for letter, value in words}
+
+# parse a chunk of lines into columns, returns {letter: np.array} with one entry per line and nan where a
+# line doesn't have the letter. If a letter appears more than once on a line, the last one is used.
+def parse_chunk(lines, letters = 'GMXYZEF'):
+    code = [line.split(';', 1)[0] for line in lines]
+    starts = np.cumsum([0] + [len(c) + 1 for c in code[:-1]])
+    text = '\n'.join(code)
+
+    positions = []
+    words = []
+    values = []
+    for m in _WORD.finditer(text):
+        positions.append(m.start())
+        words.append(m.group(1))
+        values.append(m.group(2))
+
+    line_index = np.searchsorted(starts, positions, side='right') - 1
+    words = np.char.upper(np.array(words, dtype=str))
+    values = np.array(values, dtype=str).astype(np.float64) if values else np.zeros(0)
+
     out = {}
-    ls = line.split(' ')
-    for l in ls:
-        l = l.strip()
-        if len(l) > 0:
-            cmd = l[0]
-            if cmd < 'A' or cmd > 'Z':
-                raise Exception(f'Parse error: {line}')
-            val = float(l[1:])
-            out[cmd] = val
-    
+    for letter in letters:
+        column = np.full(len(lines), np.nan)
+        mask = words == letter
+        column[line_index[mask]] = values[mask]
+        out[letter] = column
     return out
@@ -0,0 +1,89 @@
+import numpy as np
+from math import ceil, log10, nan
+
+OUTPUT_RESOLUTION = 1/20 # output resolution relative to the curve tolerance of each axis
+FEEDRATE_DECIMALS = 1    # mm/min
+
+# number of decimals needed to write an axis with the given cordial tolerance
+def output_decimals(tolerance):
+    return max(0, ceil(-log10(tolerance * OUTPUT_RESOLUTION) - 1e-9))
+
+# writes discretized moves as compact G1 lines: per-axis precision, no trailing zeros and no words for axes that
+# didn't change since the previous line (modal X/Y/Z/E/F). Keeps track of the last written values, call reset()
+# whenever something else is written that may change the machine state.
+class g1_writer:
+    def __init__(self, tolerances):
+        self.decimals = [output_decimals(t) for t in tolerances[:4]] + [FEEDRATE_DECIMALS]
+        self.scale = 10.0 ** np.array(self.decimals)
+        self.templates = [f' {letter}%.*f' for letter in 'XYZEF']
+        self.e_residual = 0 # relative extrusion that was lost to rounding, carried over to the next move
+        self.reset()
+
+    def reset(self):
+        self.last = np.full(5, nan) # last written X Y Z E F in units of the output resolution, nan if unknown
+
+    # format the points of a move (see discretize.linear_interpolate, rows x, y, z, e, t) as G1 lines
+    def format(self, points, e_offset, e_relative):
+        if points.shape[1] < 2:
+            return ''
+
+        if np.isnan(points[:4]).any():
+            assert False, "Sanity Check Failed: NaN encountered in output, aborting"
+
+        # positions in units of the output resolution
+        values = np.empty((points.shape[1]-1, 5))
+        values[:,:3] = np.rint(points[:3,1:].T * self.scale[:3])
+        if e_relative:
+            # round the accumulated extrusion, so that rounding errors don't add up over the move
+            e = points[3,1:] - points[3,0] + self.e_residual
+            e_total = np.rint(e * self.scale[3])
+            self.e_residual = e[-1] - e_total[-1] / self.scale[3]
+            values[:,3] = np.diff(e_total, prepend=0)
+        else:
+            values[:,3] = np.rint((points[3,1:] + e_offset) * self.scale[3])
+        values[values == 0] = 0 # no negative zeros
+
+        # points that don't move any axis at the output resolution are merged into the next segment, a line
+        # that only changes the feedrate would cost a planner line for nothing
+        moved = values[:,:4] != np.vstack((self.last, values[:-1]))[:,:4]
+        if e_relative:
+            moved[:,3] = values[:,3] != 0
+        kept = np.flatnonzero(moved.any(axis=1))
+        if len(kept) == 0:
+            return ''
+        values = values[kept]
+        points = points[:,np.concatenate(([0], kept + 1))]
+
+        delta = np.diff(points, axis=1)
+        # how long is each segment in time, and in distance
+        dt = delta[-1]
+        ds = np.linalg.norm(delta[:3], axis=0)
+        ds = np.where(ds == 0, np.linalg.norm(delta, axis=0), ds)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            feedrate = 60 * ds / dt
+        if np.isnan(feedrate).any():
+            assert False, "Sanity Check Failed: NaN encountered in output, aborting"
+        values[:,4] = np.rint(feedrate * self.scale[4])
+
+        # modal words, compared with the last line written
+        changed = values != np.vstack((self.last, values[:-1]))
+        if e_relative:
+            changed[:,3] = values[:,3] != 0
+
+        lines = np.full(len(values), 'G1')
+        for i in range(5):
+            lines = np.char.add(lines, np.where(changed[:,i], self.templates[i], ''))
+
+        self.last = values[-1].copy()
+        if e_relative:
+            self.last[3] = nan
+
+        # drop trailing zeros by writing each value with only as many decimals as it needs
+        decimals = np.tile(self.decimals, (len(values), 1))
+        for i in range(max(self.decimals)):
+            decimals -= (decimals > 0) & (values % 10.0**(i+1) == 0)
+
+        arguments = np.empty((np.count_nonzero(changed), 2), dtype=object)
+        arguments[:,0] = decimals[changed]
+        arguments[:,1] = (values / self.scale)[changed]
+        return ('\n'.join(lines.tolist()) + '\n') % tuple(arguments.ravel().tolist())
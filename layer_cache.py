@@ -0,0 +1,73 @@
+# content-addressed cache of the output of process.py per layer, for reruns over the same file with small changes to
+# config.py (e.g. a calibration sweep over a z range). The input is split into runs at the same z, and the output of
+# each run is stored under a hash of its input lines, the state it starts from and the parameters in effect at its
+# z, so that only the runs where any of these changed are processed again.
+
+import hashlib
+import json
+import os
+import gcode_parser
+
+CACHE_VERSION = 1
+MIN_RUN_LINES = 500
+
+# key for the parameter classes of config.py (their public class attributes)
+def parameters_key(*classes):
+    return repr([sorted((name, value) for name, value in vars(c).items() if not name.startswith('_')) for c in classes])
+
+# split the lines into runs as (heights, lines): a new run starts at a G0/G1 that changes z, once the run has
+# min_lines lines (e.g. in vase mode, where every move changes z). heights are the z values of the run, in order.
+def runs(lines, min_lines = MIN_RUN_LINES, z = None):
+    run = []
+    heights = [z]
+    for line in lines:
+        if 'Z' in line or 'z' in line:
+            c = gcode_parser.parse(line)
+            if 'G' in c and 'Z' in c and c['G'] in (0, 1, 92) and c['Z'] != z:
+                if c['G'] != 92 and len(run) >= min_lines:
+                    yield heights, run
+                    run = []
+                    heights = []
+                z = c['Z']
+                heights.append(z)
+        run.append(line)
+    if run:
+        yield heights, run
+
+# hash of the input lines of a run and the descriptions (anything that repr() represents exactly) of what else
+# determines its output
+def key(lines, *descriptions):
+    h = hashlib.sha256(f'{CACHE_VERSION}\n'.encode())
+    for description in descriptions:
+        h.update(repr(description).encode())
+        h.update(b'\n')
+    for line in lines:
+        h.update(line.encode())
+    return h.hexdigest()
+
+# output text and state (a JSON-serializable dict) of runs on disk, one pair of files per key
+class store:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok = True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    # (text, state), or None if the key isn't stored
+    def get(self, key):
+        try:
+            with open(self._path(key) + '.json') as f:
+                state = json.load(f)
+            with open(self._path(key) + '.gcode', newline='') as f:
+                return f.read(), state
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, text, state):
+        # the state is written last, an entry without it is ignored
+        for suffix, write in (('.gcode', lambda f: f.write(text)), ('.json', lambda f: json.dump(state, f))):
+            temporary = self._path(key) + suffix + '.tmp'
+            with open(temporary, 'w', newline='') as f:
+                write(f)
+            os.replace(temporary, self._path(key) + suffix)
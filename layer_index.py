@@ -0,0 +1,106 @@
+# sidecar index of the z layers of a G-code file, used by plot_slice.py. The file is split into runs of lines at
+# the same z (a layer, or part of one between z hops), each with its byte offset, length and the machine state at
+# its start, so that a layer can be read without parsing the rest of the file. The index is stored next to the file
+# and rebuilt when the file changes.
+
+import json
+import os
+from dataclasses import dataclass, asdict
+from math import nan, isnan
+import gcode_parser
+
+INDEX_VERSION = 1
+
+@dataclass
+class slice_state:
+    x: float = nan
+    y: float = nan
+    z: float = nan
+    e: float = nan
+    f: float = nan
+    offset_e: float = 0 # accumulated G92 E resets
+    e_relative: bool = False
+
+# apply a parsed line to the state, returns the new position (x, y, z, e, feedrate in mm/s) of G0/G1 moves, else None
+def step(state, c):
+    if not c:
+        return None
+    position = None
+    if 'G' in c:
+        if c['G'] == 0 or c['G'] == 1:
+            state.x = c['X'] if 'X' in c else state.x
+            state.y = c['Y'] if 'Y' in c else state.y
+            state.z = c['Z'] if 'Z' in c else state.z
+
+            state.f = c['F'] if 'F' in c else state.f
+
+            if state.e_relative:
+                state.e += c['E'] if 'E' in c else 0
+            else:
+                state.e = c['E'] if 'E' in c else state.e
+
+            position = (state.x, state.y, state.z, state.e + state.offset_e, state.f / 60)
+        if c['G'] == 92:
+            if 'E' in c:
+                if isnan(state.e):
+                    state.e = 0
+                state.offset_e += state.e - c['E']
+                state.e = c['E']
+    if 'M' in c:
+        if c['M'] == 82:
+            state.e_relative = False
+        if c['M'] == 83:
+            state.e_relative = True
+    return position
+
+# the runs of a G-code file (binary stream) as [z, offset, length, state at the start of the run]
+def build(stream):
+    state = slice_state()
+    runs = []
+    offset = 0
+    for raw in stream:
+        c = gcode_parser.parse(raw.decode())
+        if c and 'G' in c and (c['G'] == 0 or c['G'] == 1) and 'Z' in c and c['Z'] != state.z:
+            runs.append([c['Z'], offset, 0, asdict(state)])
+        step(state, c)
+        offset += len(raw)
+    for i in range(len(runs)):
+        runs[i][2] = (runs[i+1][1] if i + 1 < len(runs) else offset) - runs[i][1]
+    return runs
+
+def sidecar_path(path):
+    return path + '.layers.json'
+
+# the runs of the G-code file at path, from its sidecar index if that is up to date, otherwise the index is
+# (re)built and saved (if the directory is writable)
+def load(path):
+    info = os.stat(path)
+    key = {'version': INDEX_VERSION, 'size': info.st_size, 'mtime_ns': info.st_mtime_ns}
+    try:
+        with open(sidecar_path(path)) as f:
+            index = json.load(f)
+        if all(index.get(k) == v for k, v in key.items()):
+            return index['runs']
+    except (OSError, ValueError):
+        pass
+
+    with open(path, 'rb') as f:
+        runs = build(f)
+    try:
+        with open(sidecar_path(path), 'w') as f:
+            json.dump({**key, 'runs': runs}, f)
+    except OSError:
+        pass
+    return runs
+
+# the z heights of the layers
+def layers(runs):
+    return sorted(set(z for z, *_ in runs))
+
+# the lines of the runs within tolerance of z, each as (state at the start of the run, lines), read from the
+# G-code file as a seekable binary stream
+def read_layer(stream, runs, z, tolerance):
+    for run_z, offset, length, state in runs:
+        if abs(run_z - z) < tolerance:
+            stream.seek(offset)
+            yield slice_state(**state), stream.read(length).decode().splitlines(keepends=True)
@@ -0,0 +1,55 @@
+# level-of-detail decimation of plotted series. The time range in view is split into one bucket per pixel and only
+# the first, last, minimum and maximum points of every series in each bucket are kept, so that the plot looks the
+# same as with all points (spikes included) while its size is bounded by the width of the view.
+
+import numpy as np
+
+# indices (sorted) of the points to keep of series (rows) sampled at increasing times t, for a view of [t0, t1]
+# split into the given number of buckets. The points next to the range are kept for the lines leaving the view.
+def minmax_indices(t, series, t0, t1, buckets):
+    t = np.asarray(t)
+    series = np.atleast_2d(series)
+    first, last = view(t, t0, t1)
+    if t1 <= t0 or last - first <= 4 * buckets:
+        return np.arange(first, last)
+
+    bucket = np.clip(((t[first:last] - t0) * (buckets / (t1 - t0))).astype(int), -1, buckets)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]]) # t is increasing, so buckets are contiguous
+    ends = np.r_[starts[1:], len(bucket)] - 1
+    keep = [starts, ends]
+    for y in series[:, first:last]:
+        for reduce in (np.minimum, np.maximum):
+            extreme = reduce.reduceat(y, starts)
+            hit = np.flatnonzero(y == np.repeat(extreme, ends - starts + 1))
+            # first hit in each bucket
+            keep.append(hit[np.r_[True, bucket[hit[1:]] != bucket[hit[:-1]]]])
+    return first + np.unique(np.concatenate(keep))
+
+# the range of indices of the points in view, including one on either side
+def view(t, t0, t1):
+    first = max(np.searchsorted(t, t0, side='left') - 1, 0)
+    last = min(np.searchsorted(t, t1, side='right') + 1, len(t))
+    return first, max(first, last)
+
+# keeps matplotlib lines of (t, series) decimated to the pixel width of their axes, redone whenever the view changes
+class decimated_lines:
+    def __init__(self, ax, t, lines, series, marker = None):
+        self.ax = ax
+        self.t = np.asarray(t)
+        self.lines = lines
+        self.series = np.atleast_2d(series)
+        self.marker = marker
+        self.update()
+        ax.callbacks.connect('xlim_changed', lambda ax: self.update())
+        ax.figure.canvas.mpl_connect('resize_event', lambda event: self.update())
+
+    def update(self):
+        t0, t1 = self.ax.get_xlim()
+        buckets = max(int(self.ax.get_window_extent().width), 1)
+        keep = minmax_indices(self.t, self.series, t0, t1, buckets)
+        first, last = view(self.t, t0, t1)
+        exact = len(keep) == last - first # markers only where every point is shown
+        for line, y in zip(self.lines, self.series):
+            line.set_data(self.t[keep], y[keep])
+            if self.marker:
+                line.set_marker(self.marker if exact else 'None')
@@ -0,0 +1,122 @@
+import numpy as np
+from math import inf
+from collections import Counter
+import move
+import smoothing
+from motion_profiles import s_curve_reachable_speed
+
+# what the planner needs to know about a move
+class _move:
+    def __init__(self, distance, direction, speed, accel, jerk, steps, exit_direction = None):
+        self.distance = distance
+        self.direction = direction # unit vector over all axes (relative to the xyz distance)
+        self.exit_direction = direction if exit_direction is None else exit_direction # differs for smoothed chains
+        self.speed = speed         # throttled max speed, acceleration and jerk
+        self.accel = accel
+        self.jerk = jerk
+        self.steps = steps         # largest velocity step per axis at a junction, see move.junction_velocity_step
+
+# plans the speeds at the junctions between consecutive moves over a window of upcoming moves. Junction speeds are
+# limited by the moves' (axis limited) max speeds and by the velocity step every axis takes when the direction
+# changes, and are chosen such that every move can reach the next junction speed, and the last move of the window
+# can come to a stop, within its accel and jerk.
+class junction_planner:
+    def __init__(self, motion_parameters, curve_parameters, junction_parameters, calibration_adjustment):
+        self.motion_parameters = motion_parameters
+        self.tolerances = curve_parameters.tolerances
+        self.window = junction_parameters.window
+        self.max_velocity_step = junction_parameters.max_velocity_step
+        self.calibration_adjustment = calibration_adjustment
+        self.moves = []       # [move (None if it stops at both ends), speed limit at the junction with the previous move]
+        self.previous = None  # last added move
+        self.speed = 0        # speed at the start of the first move in the window
+        self.junctions = 0    # number of junctions planned, and the ones passed at speed
+        self.joined = 0
+
+    def _describe(self, source, destination, target_speed):
+        mp = self.motion_parameters
+        self.calibration_adjustment(destination[2])
+        delta = np.array(destination) - np.array(source)
+        distance = np.linalg.norm(delta[:3])
+        if distance == 0:
+            return None # extruder-only moves are left unmodified (see gcode_adjuster.adjust)
+
+        speed, accel, jerk = min(target_speed, mp.max_speed), mp.accel, mp.jerk
+        if mp.axis_limits:
+            if any(mp.axis_limits[i] and delta[i] != 0 and move.junction_velocity_step(mp.dynamic_model[i], 0, 0) is None for i in range(len(delta))):
+                return None # axis limits of the asymmetric model are only checked on the generated move, at standstill
+            speed, accel, jerk = move.throttle(distance, delta, speed, accel, jerk, mp.dynamic_model, mp.axis_limits, inf, Counter())
+        steps = [move.junction_velocity_step(mp.dynamic_model[i], self.tolerances[i], self.max_velocity_step[i]) for i in range(len(delta))]
+        return _move(distance, delta / distance, speed, accel, jerk, steps)
+
+    # a chain of moves smoothed into one path, see smoothing.chain_fit
+    def _describe_chain(self, fit, target_speed):
+        mp = self.motion_parameters
+        self.calibration_adjustment(fit.vertices[-1,2])
+        speed, accel, jerk = smoothing.chain_limits(fit, min(target_speed, mp.max_speed), mp.accel, mp.jerk, mp.dynamic_model, mp.axis_limits, inf, Counter())
+        steps = [move.junction_velocity_step(mp.dynamic_model[i], self.tolerances[i], self.max_velocity_step[i]) for i in range(fit.vertices.shape[1])]
+        entry, exit = fit.directions()
+        return _move(fit.length, entry, speed, accel, jerk, steps, exit)
+
+    # highest speed at the junction from move a to move b
+    def _junction_speed(self, a, b):
+        if a is None or b is None:
+            return 0
+        limit = min(a.speed, b.speed)
+        change = np.abs(b.direction - a.exit_direction)
+        for i in np.nonzero(change > 1e-12)[0]:
+            if a.steps[i] is None or b.steps[i] is None:
+                return 0
+            limit = min(limit, min(a.steps[i], b.steps[i]) / change[i])
+        return limit
+
+    # (start, end) speeds of the moves in the window
+    def _plan(self):
+        n = len(self.moves)
+        # backward pass: the fastest each move may start at so that the rest of the window can stop in time
+        start_limit = [0] * (n + 1)
+        for i in range(n-1, -1, -1):
+            m, junction = self.moves[i]
+            if m is not None and junction > 0:
+                start_limit[i] = min(junction, s_curve_reachable_speed(start_limit[i+1], m.distance, m.accel, m.jerk))
+
+        # forward pass: as fast as the move can accelerate to
+        speeds = []
+        start = self.speed
+        for i in range(n):
+            m = self.moves[i][0]
+            end = 0
+            if m is not None:
+                end = min(start_limit[i+1], s_curve_reachable_speed(start, m.distance, m.accel, m.jerk))
+            speeds.append((start, end))
+            start = end
+        return speeds
+
+    def _pop(self, count):
+        speeds = self._plan()[:count]
+        del self.moves[:count]
+        if speeds:
+            self.speed = speeds[-1][1]
+        self.junctions += len(speeds)
+        self.joined += sum(1 for _, end in speeds if end > 0)
+        return speeds
+
+    # add the next move, returns the (start speed, end speed) of the moves that leave the window, in order
+    def add(self, source, destination, target_speed):
+        return self._add(self._describe(source, destination, target_speed))
+
+    # add a chain of moves that is smoothed into one path (a smoothing.chain_fit), see add
+    def add_chain(self, fit, target_speed):
+        return self._add(self._describe_chain(fit, target_speed))
+
+    def _add(self, m):
+        self.moves.append([m, self._junction_speed(self.previous, m)])
+        self.previous = m
+        return self._pop(len(self.moves) - self.window) if len(self.moves) > self.window else []
+
+    # end the chain of moves (stopping at the end of the last one), returns the speeds of the remaining moves
+    def finish(self):
+        speeds = self._pop(len(self.moves))
+        self.previous = None
+        self.speed = 0
+        return speeds
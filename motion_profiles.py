@@ -105,3 +105,145 @@ def s_curve_profile(distance, max_speed, max_accel, jerk):
     return spline.curve(a[:,0],a[:,1])
 
 
+# s_curve_profile for arrays of moves, with the cases of s_curve_profile selected per move. Returns the durations of
+# the phases as a (moves, 3) array of (jerk_time, constant_accel_time, coasting_time), and the knots of the profiles
+# as (moves, 8) arrays of times and accelerations along with the number of knots of each move (the rest repeat its
+# last knot). The knots are those of s_curve_profile, i.e. the profile of move i is
+# spline.curve(times[i,:counts[i]], accels[i,:counts[i]]).
+def s_curve_profiles(distance, max_speed, max_accel, jerk):
+    distance, max_speed, max_accel, jerk = np.broadcast_arrays(*[np.atleast_1d(np.asarray(x, dtype=np.float64)) for x in (distance, max_speed, max_accel, jerk)])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        time_to_constant_accel = max_accel / jerk
+        max_jerk_time = s_curve_max_jerk_t(distance, jerk)
+        speed_limit_time = constant_jerk_time_to_max_speed(jerk, max_speed)
+        no_constant_accel = (max_jerk_time <= time_to_constant_accel) | (speed_limit_time <= time_to_constant_accel)
+
+        # no constant acceleration phase, with coasting if the peak speed is hit
+        peak_speed_hit = constant_jerk_peak_speed(max_jerk_time, jerk) > max_speed
+        short_jerk_time = np.where(peak_speed_hit, speed_limit_time, max_jerk_time)
+        short_coasting_time = np.where(peak_speed_hit, (distance - s_curve_distance_during_jerk(jerk, short_jerk_time) * 2) / max_speed, 0)
+
+        # constant acceleration phase, with coasting if speed limited
+        jerk_time = time_to_constant_accel
+        half_distance_time = 1/2 * (-3 * jerk_time + np.sqrt((8 * (distance/2) + jerk * (jerk_time**3))/(jerk*jerk_time))) + 2*jerk_time
+        time_to_max_speed = s_curve_time_to_max_speed(jerk, jerk_time, max_speed)
+        speed_limited = half_distance_time > time_to_max_speed
+        constant_accel_time = np.where(speed_limited, time_to_max_speed, half_distance_time) - 2*jerk_time
+        coasting_time = np.where(speed_limited, (distance - 2 * s_curve_half_distance(jerk, jerk_time, constant_accel_time)) / max_speed, 0)
+        constant_accel_phase = speed_limited | (constant_accel_time > 0)
+        constant_accel_time = np.where(constant_accel_phase, constant_accel_time, 0)
+
+    jerk_time = np.where(no_constant_accel, short_jerk_time, jerk_time)
+    constant_accel_time = np.where(no_constant_accel, 0, constant_accel_time)
+    coasting_time = np.where(no_constant_accel, short_coasting_time, coasting_time)
+    peak_accel = np.where(no_constant_accel, short_jerk_time * jerk, max_accel)
+
+    T, C, K = jerk_time[:,np.newaxis], constant_accel_time[:,np.newaxis], coasting_time[:,np.newaxis]
+    zero = np.zeros_like(T)
+    times = np.hstack([zero, T, T + C, 2*T + C, K + 2*T + C, K + 3*T + C, K + 2*C + 3*T, K + 2*C + 4*T])
+    a = peak_accel[:,np.newaxis]
+    accels = np.hstack([zero, a, a, zero, zero, -a, -a, zero])
+
+    # the knots s_curve_profile keeps in each case: the constant acceleration phases and coasting only if present
+    keep = np.ones(times.shape, dtype=bool)
+    keep[:,[2, 6]] = (~no_constant_accel & constant_accel_phase)[:,np.newaxis]
+    keep[:,3] = np.where(no_constant_accel, peak_speed_hit, speed_limited)
+    keep[:,4] = np.where(no_constant_accel, peak_speed_hit, speed_limited & (times[:,4] != times[:,3]))
+    keep[distance == 0, 1:] = False
+
+    counts = keep.sum(axis=1)
+    order = np.argsort(~keep, axis=1, kind='stable')
+    last = np.minimum(np.arange(times.shape[1]), counts[:,np.newaxis] - 1)
+    order = np.take_along_axis(order, last, axis=1)
+    times = np.take_along_axis(times, order, axis=1)
+    accels = np.take_along_axis(accels, order, axis=1)
+    return np.stack([jerk_time, constant_accel_time, coasting_time], axis=1), times, accels, counts
+
+# closed form (peak speed, peak acceleration) of s_curve_profile(distance, max_speed, max_accel, jerk)
+def s_curve_peaks(distance, max_speed, max_accel, jerk):
+    if distance == 0:
+        return 0, 0
+
+    time_to_constant_accel = max_accel / jerk
+    jerk_time = min(s_curve_max_jerk_t(distance, jerk), constant_jerk_time_to_max_speed(jerk, max_speed))
+    if jerk_time <= time_to_constant_accel:
+        # no constant acceleration phase
+        return constant_jerk_peak_speed(jerk_time, jerk), jerk_time * jerk
+
+    # accelerating to speed v covers v**2/(2*accel) + v*accel/(2*jerk), solve for the speed at half distance
+    peak_speed = max_accel * (-max_accel / (2*jerk) + sqrt(max_accel**2 / (4*jerk**2) + distance / max_accel))
+    return min(max_speed, peak_speed), max_accel
+
+# jerk time, constant acceleration time and peak acceleration of an s-curve speed change by speed_change (>= 0)
+def s_curve_speed_change_times(speed_change, max_accel, jerk):
+    if speed_change <= max_accel**2 / jerk:
+        jerk_time = sqrt(speed_change / jerk)
+        return jerk_time, 0, jerk_time * jerk
+    jerk_time = max_accel / jerk
+    return jerk_time, speed_change / max_accel - jerk_time, max_accel
+
+# distance covered while changing speed from start_speed to end_speed along an s-curve (zero acceleration at both ends)
+def s_curve_transition_distance(start_speed, end_speed, max_accel, jerk):
+    jerk_time, constant_accel_time, _ = s_curve_speed_change_times(abs(end_speed - start_speed), max_accel, jerk)
+    # the acceleration profile is symmetric, so the average speed is the mean of both speeds
+    return (start_speed + end_speed) / 2 * (2*jerk_time + constant_accel_time)
+
+# highest speed that can be reached from start_speed within distance (the inverse of s_curve_transition_distance)
+def s_curve_reachable_speed(start_speed, distance, max_accel, jerk):
+    # without a constant acceleration phase: distance * sqrt(jerk) = (2*start_speed + u**2) * u with u = sqrt(speed_change)
+    # a depressed cubic with a single real root
+    q = distance * sqrt(jerk)
+    p = 2 * start_speed
+    r = sqrt(q**2 / 4 + p**3 / 27)
+    # Cardano, u = A - B with A**3 - B**3 = q, written without the cancellation
+    A = (r + q/2) ** (1/3)
+    B = (r - q/2) ** (1/3)
+    u = q / (A**2 + A*B + B**2) if q > 0 else 0
+    speed_change = u**2
+    if speed_change > max_accel**2 / jerk:
+        # with a constant acceleration phase: distance = (2*start_speed + dv) / 2 * (dv/max_accel + max_accel/jerk)
+        a = 1 / (2*max_accel)
+        b = start_speed / max_accel + max_accel / (2*jerk)
+        c = start_speed * max_accel / jerk - distance
+        speed_change = (-b + sqrt(b**2 - 4*a*c)) / (2*a)
+    return start_speed + speed_change
+
+# s-curve acceleration profile over a move of the given distance that starts at start_speed and ends at end_speed,
+# with zero acceleration at both ends. end_speed must be reachable from start_speed (see s_curve_reachable_speed).
+def s_curve_profile_between(distance, start_speed, end_speed, max_speed, max_accel, jerk):
+    if start_speed == 0 and end_speed == 0:
+        return s_curve_profile(distance, max_speed, max_accel, jerk)
+
+    def accel_distance(peak_speed):
+        return s_curve_transition_distance(start_speed, peak_speed, max_accel, jerk) + s_curve_transition_distance(peak_speed, end_speed, max_accel, jerk)
+
+    low = max(start_speed, end_speed)
+    peak_speed = max(low, max_speed) # entry and exit speeds above max_speed are cruised at
+    if accel_distance(peak_speed) > distance:
+        # the peak speed isn't reached, find the highest one that fits
+        high = peak_speed
+        for i in range(60):
+            mid = 0.5 * (low + high)
+            if accel_distance(mid) <= distance:
+                low = mid
+            else:
+                high = mid
+        peak_speed = low
+    coasting_time = max(0, distance - accel_distance(peak_speed)) / peak_speed
+
+    accel = [(0, 0)]
+    def ramp(speed_change, sign):
+        jerk_time, constant_accel_time, peak_accel = s_curve_speed_change_times(speed_change, max_accel, jerk)
+        t = accel[-1][0]
+        accel.extend([(t + jerk_time, sign * peak_accel), (t + jerk_time + constant_accel_time, sign * peak_accel), (t + 2*jerk_time + constant_accel_time, 0)])
+
+    ramp(peak_speed - start_speed, 1)
+    accel.append((accel[-1][0] + coasting_time, 0))
+    ramp(peak_speed - end_speed, -1)
+
+    # drop the empty phases
+    a = np.array([accel[0]] + [accel[i] for i in range(1, len(accel)) if accel[i][0] > accel[i-1][0]])
+    if len(a) == 1:
+        a = np.array([(0, 0), (distance / peak_speed, 0)])
+    return spline.curve(a[:,0], a[:,1])
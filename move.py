@@ -2,9 +2,11 @@ from math import *
 import numpy as np
 import polynomial as poly
 import spline
+import stats
 
-from motion_profiles import s_curve_profile
+from motion_profiles import s_curve_profile, s_curve_profile_between, s_curve_peaks
 from dataclasses import dataclass
+from collections import Counter, OrderedDict
 
 import sys # TMP
 
@@ -30,58 +32,197 @@ class axis_limits:
     accel: float = inf
     jerk:  float = inf
 
-# a machine vector is an np.array of coordinates [x, y, z, e, ...]. The first 3 are assumed to be euclidean x,y,z coordinates
+# number of moves that were throttled by each kind of axis limit
+throttle_events = Counter()
 
-# generate a spring-damper-corrected motion profile, return spline curves for each axis
-def generate_move(source, destination, max_speed, max_accel, max_jerk, dynamic_model, axis_limits):
-    delta = np.array(destination) - np.array(source)
-    distance = np.linalg.norm(delta[0:3])
+# the most recent arc profiles (see _arc_profile), e.g. of the same move generated for several variants of the
+# dynamic model (see process.py --variant)
+ARC_PROFILES = 64
+_arc_profiles = OrderedDict()
 
-    if distance == 0:
-        distance = np.linalg.norm(delta)
+# gains of an axis' velocity on the arc (acceleration, jerk) introduced by the dynamic model. The axis velocity is
+# k * (speed + c * acceleration + d * jerk), its acceleration k * (acceleration + c * jerk) and its jerk k * jerk,
+# where k is the direction cosine. Returns None for models where this doesn't hold (asymmetric spring-damper).
+def _velocity_gains(model):
+    if isinstance(model, spring_damper_parameters):
+        omega_n = model.f_n * tau
+        if omega_n > 0:
+            return 2*model.zeta / omega_n, omega_n**-2
+    elif isinstance(model, asymmetric_spring_damper_parameters):
+        if model.f_n_positive > 0 or model.f_n_negative > 0:
+            return None
+    elif isinstance(model, pressure_advance_parameters):
+        if model.k > 0:
+            return model.k, 0
+    return 0, 0
 
-    if distance == 0:
+# largest scale in (0, 1] for which feasible(scale) holds, given a monotone feasible()
+def _largest_feasible_scale(feasible, iterations = 40):
+    if feasible(1):
+        return 1
+    low, high = 0, 1
+    for i in range(iterations):
+        mid = 0.5 * (low + high)
+        if feasible(mid):
+            low = mid
+        else:
+            high = mid
+    return low
+
+# largest step in an axis' velocity at a junction between moves (mm/s) that keeps both the residual vibration
+# (step / omega_n for a spring-damper) and the jump in the correction (c * step, see _velocity_gains) within the
+# tolerance. default is used for axes without a dynamic model, None if the model doesn't allow junctions at speed.
+def junction_velocity_step(model, tolerance, default):
+    gains = _velocity_gains(model)
+    if gains is None:
         return None
+    step = default
+    if isinstance(model, spring_damper_parameters) and model.f_n > 0:
+        step = tolerance * model.f_n * tau
+    if gains[0] > 0:
+        step = min(step, tolerance / gains[0])
+    return step
 
-    # determine acceleration curve (over the arc length)
-    arc_acceleration = s_curve_profile(distance, max_speed, max_accel, max_jerk)
+# reduce speed, acceleration and jerk of a move so that all axes with symmetric models stay within their limits.
+# Uses the closed form peaks of the s-curve profile, so no curves are generated. The peaks are those of a move of
+# profile_distance (defaults to distance), use inf for moves that don't start and end at standstill. Throttling is
+# counted in events.
+def throttle(distance, delta, max_speed, max_accel, max_jerk, dynamic_model, axis_limits, profile_distance = None, events = throttle_events):
+    k, c, d, limits = [], [], [], []
+    for i in range(len(axis_limits)):
+        if axis_limits[i] and delta[i] != 0:
+            gains = _velocity_gains(dynamic_model[i])
+            if gains is not None:
+                k.append(abs(delta[i] / distance))
+                c.append(gains[0])
+                d.append(gains[1])
+                limits.append((axis_limits[i].speed, axis_limits[i].accel, axis_limits[i].jerk))
+    if not k:
+        return max_speed, max_accel, max_jerk
+
+    k, c, d = np.array(k), np.array(c), np.array(d)
+    speed_limit, accel_limit, jerk_limit = np.array(limits).T
+    if profile_distance is None:
+        profile_distance = distance
+
+    def accel_ok(speed, accel, jerk):
+        peak_speed, peak_accel = s_curve_peaks(profile_distance, speed, accel, jerk)
+        return np.all(k * (peak_accel + c * jerk) <= accel_limit)
+
+    def speed_ok(speed, accel, jerk):
+        # upper bound, the peaks of the three terms don't necessarily coincide
+        peak_speed, peak_accel = s_curve_peaks(profile_distance, speed, accel, jerk)
+        return np.all(k * (peak_speed + c * peak_accel + d * jerk) <= speed_limit)
+
+    throttle_jerk = min(1, np.min(jerk_limit / (k * max_jerk)))
+    if throttle_jerk < 1:
+        events['jerk'] += 1
+        max_jerk *= throttle_jerk
+
+    throttle_accel = _largest_feasible_scale(lambda s: accel_ok(max_speed, max_accel * s, max_jerk * s))
+    if throttle_accel < 1:
+        events['accel'] += 1
+        max_accel *= throttle_accel
+        max_jerk *= throttle_accel
+
+    # throttle accel along with speed, since this is likely due to too high spring compensation (a function of accel)
+    throttle_speed = _largest_feasible_scale(lambda s: speed_ok(max_speed * s**.25, max_accel * s, max_jerk * s))
+    if throttle_speed < 1:
+        events['speed'] += 1
+        max_speed *= throttle_speed**.25
+        max_accel *= throttle_speed
+        max_jerk *= throttle_speed
+
+    return max_speed, max_accel, max_jerk
+
+# a machine vector is an np.array of coordinates [x, y, z, e, ...]. The first 3 are assumed to be euclidean x,y,z coordinates
+
+# acceleration, speed and position along the arc of a move, independent of the dynamic model. The curves are shared
+# between the moves with the same arguments, and must not be modified.
+def _arc_profile(distance, start_speed, end_speed, max_speed, max_accel, max_jerk):
+    key = (distance, start_speed, end_speed, max_speed, max_accel, max_jerk)
+    if key in _arc_profiles:
+        stats.count('arc_profiles_shared')
+        _arc_profiles.move_to_end(key)
+        return _arc_profiles[key]
+
+    arc_acceleration = s_curve_profile_between(distance, start_speed, end_speed, max_speed, max_accel, max_jerk)
     #plot_spline_accel(arc_acceleration)
     arc_speed = arc_acceleration.integrate()
-    arc_position = arc_speed.integrate()    
+    if start_speed:
+        arc_speed = arc_speed + start_speed
+    arc_position = arc_speed.integrate()
 
-    positions = []
-    # calculate spring-damper correction for each axis
-    for i in range(len(delta)):
-        k = delta[i] / distance
+    _arc_profiles[key] = arc_acceleration, arc_speed, arc_position
+    if len(_arc_profiles) > ARC_PROFILES:
+        _arc_profiles.popitem(last=False)
+    return arc_acceleration, arc_speed, arc_position
 
-        position = arc_position * k
+# coefficient matrix of the axis positions on the arc profile for the direction cosines k: the position of axis i is
+# matrix[i] @ (arc position, speed, acceleration) + source[i], see _velocity_gains. Pressure advance integrates
+# speed + k * acceleration, which is position + k * speed. The rows of the axes with a nonlinear model (asymmetric
+# spring-damper) are nan.
+def _position_matrix(dynamic_model, k):
+    assert len(dynamic_model) >= len(k), 'a dynamic model is needed for every axis'
+    matrix = np.zeros((len(k), 3))
+    for i, model in enumerate(dynamic_model[:len(k)]):
+        gains = _velocity_gains(model)
+        matrix[i] = (1, *gains) if gains is not None else nan
+    return matrix * np.asarray(k)[:,np.newaxis]
 
-        if isinstance(dynamic_model[i], spring_damper_parameters):
-            omega_n = dynamic_model[i].f_n * tau
-            zeta    = dynamic_model[i].zeta
+# spring-damper-corrected spline curves for each axis of a move with the given (unthrottled) profile parameters
+def _generate_positions(source, delta, distance, max_speed, max_accel, max_jerk, dynamic_model, start_speed = 0, end_speed = 0):
+    # determine acceleration curve (over the arc length)
+    arc_acceleration, arc_speed, arc_position = _arc_profile(distance, start_speed, end_speed, max_speed, max_accel, max_jerk)
 
-            if omega_n > 0:
-                correction = arc_acceleration * (k * omega_n**-2) + arc_speed * (k * 2*zeta * omega_n**-1)
-                position = position + correction
+    # the linear models of all axes as one product with the coefficients of the arc profile, (3, pieces, width)
+    k = np.asarray(delta) / distance
+    matrix = _position_matrix(dynamic_model, k)
+    width = arc_position.coeffs.shape[1]
+    profile = np.stack([arc_position.coeffs, spline._pad(arc_speed.coeffs, width), spline._pad(arc_acceleration.coeffs, width)])
+    coeffs = np.tensordot(matrix, profile, axes=1)
+    knots = arc_position.knots.copy() # shared by the curves, see spline.harmonize_knots
 
-        elif isinstance(dynamic_model[i], asymmetric_spring_damper_parameters):
+    positions = []
+    for i in range(len(delta)):
+        if np.isnan(matrix[i,0]):
             omega_n_pos = dynamic_model[i].f_n_positive * tau
             omega_n_neg = dynamic_model[i].f_n_negative * tau
             b_div_m     = dynamic_model[i].zeta * (omega_n_pos + omega_n_neg)
 
-            if omega_n_pos > 0 or omega_n_neg > 0:
-                correction = spline.composite(spline.kinked_line(omega_n_neg**-2, omega_n_pos**-2), arc_acceleration * k + arc_speed * (k * b_div_m))
-                position = position + correction
+            correction, = spline.kinked_composite([arc_acceleration * k[i] + arc_speed * (k[i] * b_div_m)], omega_n_neg**-2, omega_n_pos**-2)
+            positions.append(arc_position * k[i] + correction + source[i])
+            continue
 
-        elif isinstance(dynamic_model[i], pressure_advance_parameters):
-            if dynamic_model[i].k > 0:
-                corrected_speed = arc_speed * k + arc_acceleration * (k * dynamic_model[i].k)
-                position = corrected_speed.integrate()
+        coeffs[i,:,0] += source[i]
+        positions.append(arc_position._with(knots, coeffs[i]))
+
+    return positions
+
+# generate a spring-damper-corrected motion profile, return spline curves for each axis
+# start_speed and end_speed are the speeds at the junctions with the previous and next move (see lookahead). At a
+# junction at speed the corrected position is offset from the source/destination by the velocity dependent terms.
+# Throttling is counted in events.
+def generate_move(source, destination, max_speed, max_accel, max_jerk, dynamic_model, axis_limits, start_speed = 0, end_speed = 0, events = throttle_events):
+    delta = np.array(destination) - np.array(source)
+    distance = np.linalg.norm(delta[0:3])
+
+    if distance == 0:
+        distance = np.linalg.norm(delta)
+
+    if distance == 0:
+        return None
 
-        positions.append(position + source[i])
-    
-    # check axis limits
     if axis_limits:
+        with stats.stage('axis_limits'):
+            max_speed, max_accel, max_jerk = throttle(distance, delta, max_speed, max_accel, max_jerk, dynamic_model, axis_limits, inf if start_speed or end_speed else None, events)
+
+    positions = _generate_positions(source, delta, distance, max_speed, max_accel, max_jerk, dynamic_model, start_speed, end_speed)
+
+    # the closed form throttling doesn't cover the asymmetric model, check the resulting curves instead
+    iterate = axis_limits and any(axis_limits[i] and delta[i] != 0 and _velocity_gains(dynamic_model[i]) is None for i in range(len(axis_limits)))
+    throttled = set()
+    while iterate:
         throttle_speed = 1.0
         throttle_accel = 1.0
         throttle_jerk = 1.0
@@ -103,16 +244,27 @@ def generate_move(source, destination, max_speed, max_accel, max_jerk, dynamic_m
                     throttle_jerk  = min(throttle_jerk,  axis_limits[i].jerk / top_jerk)
 
         if throttle_jerk < 1 - eps:
-            positions = generate_move(source, destination, max_speed, max_accel, max_jerk * throttle_jerk, dynamic_model, axis_limits)
+            throttled.add('jerk')
+            max_jerk *= throttle_jerk
         elif throttle_accel < 1 - eps:
-            positions = generate_move(source, destination, max_speed, max_accel * throttle_accel, max_jerk * throttle_accel, dynamic_model, axis_limits)
+            throttled.add('accel')
+            max_accel *= throttle_accel
+            max_jerk *= throttle_accel
         elif throttle_speed < 1 - eps:
+            throttled.add('speed')
             # HACK, throttle accel instead of speed, since this is likely due to too high spring compensation (a function of accel)
-            positions = generate_move(source, destination, max_speed * throttle_speed**.25, max_accel * throttle_speed, max_jerk * throttle_speed, dynamic_model, axis_limits)
-            #positions = generate_move(source, destination, max_speed * throttle_speed, max_accel, max_jerk, dynamic_model, axis_limits)
+            max_speed *= throttle_speed**.25
+            max_accel *= throttle_speed
+            max_jerk *= throttle_speed
+        else:
+            break
+
+        stats.count('axis_limit_retries')
+        positions = _generate_positions(source, delta, distance, max_speed, max_accel, max_jerk, dynamic_model, start_speed, end_speed)
+
+    events.update(throttled)
 
     # ensure that all curves have equal knots
     spline.harmonize_knots(positions)
     
     return positions 
-
@@ -0,0 +1,78 @@
+import numpy as np
+from collections import OrderedDict
+from dataclasses import astuple
+
+# key for the active parameters of a dynamic model or a list of axis limits (None entries are kept as is)
+def parameters_key(parameters):
+    if parameters is None:
+        return None
+    return tuple(None if p is None else (type(p).__name__,) + astuple(p) for p in parameters)
+
+# LRU cache of discretized move profiles. Profiles are stored relative to the move's source, keyed on the
+# quantized delta vector and the parameters that shape the move, so any move with the same shape is a hit. A profile
+# is generated from the origin along the quantized delta, so a hit is the same as generating the move again (e.g. in
+# another worker process, with its own cache), and the output doesn't depend on what was cached before.
+class profile_cache:
+    def __init__(self, max_bytes = 64 * 1024**2, quantum = 1e-6):
+        self.max_bytes = max_bytes
+        self.quantum = quantum
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, source, destination, parameters):
+        delta = (np.array(destination) - np.array(source)) / self.quantum
+        return (tuple(np.round(delta).astype(np.int64)), parameters)
+
+    # return the discretized points (see discretize.linear_interpolate) for a move, calling generate(source,
+    # destination) for the profile on a miss. parameters = hashable description of everything but source and
+    # destination that affects the result
+    def get(self, source, destination, parameters, generate):
+        key = self.key(source, destination, parameters)
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            entry = self.entries[key]
+        else:
+            self.misses += 1
+            entry = self._generate(key, generate)
+            self._insert(key, entry)
+
+        if entry is None:
+            return None
+        relative, end_offset = entry
+        points = relative.copy()
+        points[:-1] += np.array(source)[:,np.newaxis]
+        points[:-1,-1] = np.array(destination) + end_offset # the delta is quantized, end exactly where the move would
+        return points
+
+    # (relative points, end offset) of the move from the origin along the quantized delta of the key, or None
+    def _generate(self, key, generate):
+        delta = np.array(key[0]) * self.quantum
+        relative = generate(np.zeros(len(delta)), delta)
+        if relative is None:
+            return None
+        # moves ending at speed end offset from their destination (see move.generate_move), anything below the
+        # quantum is rounding noise of moves that end at standstill
+        end_offset = relative[:-1,-1] - delta
+        end_offset[np.abs(end_offset) < self.quantum] = 0
+        return relative, end_offset
+
+    # (relative points, end offset) or None
+    def _insert(self, key, entry):
+        size = entry[0].nbytes if entry is not None else 0
+        if size > self.max_bytes:
+            return
+        self.entries[key] = entry
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= evicted[0].nbytes if evicted is not None else 0
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self.entries)
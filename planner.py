@@ -0,0 +1,139 @@
+import numpy as np
+from collections import deque, Counter
+
+# model of the firmware's command throughput: every line takes line_cost seconds to be sent and planned, and the
+# look-ahead buffer holds at most buffer_depth segments. The printer stalls when a segment arrives after the previous
+# one has finished executing.
+class planner_model:
+    def __init__(self, max_segments_per_s, buffer_depth, serial_cost = 0):
+        self.line_cost = max(1 / max_segments_per_s, serial_cost or 0)
+        self.buffer_depth = buffer_depth
+        self.host = 0       # time at which the next line can be sent
+        self.end = None     # time at which the last buffered segment finishes executing, None if idle
+        self.finish = deque(maxlen = buffer_depth) # finish times of the buffered segments
+        self.stall = 0      # accumulated predicted stall time (s)
+
+    def _state(self):
+        return self.host, self.end, deque(self.finish, maxlen = self.buffer_depth), self.stall
+
+    def _restore(self, state):
+        self.host, self.end, self.finish, self.stall = state
+
+    # send a number of lines that don't move the machine (e.g. passed through commands)
+    def send(self, lines):
+        self.host += lines * self.line_cost
+
+    # send segments with the given durations, returns the stall time they cause
+    def push(self, durations):
+        stall = 0
+        for duration in durations:
+            send = self.host
+            if len(self.finish) == self.buffer_depth:
+                send = max(send, self.finish[0]) # wait for a free slot in the buffer
+            arrive = send + self.line_cost
+            if self.end is None:
+                start = arrive
+            else:
+                start = max(self.end, arrive)
+                stall += start - self.end
+            self.end = start + duration
+            self.finish.append(self.end)
+            self.host = arrive
+        self.stall += stall
+        return stall
+
+    # stall time the segments would cause, without sending them
+    def predict(self, durations):
+        state = self._state()
+        stall = self.push(durations)
+        self._restore(state)
+        return stall
+
+# drop points of a discretized move (see discretize.linear_interpolate) that are within tolerance of the
+# straight segment (linear in t) between their kept neighbours. The first and last points are always kept.
+def decimate(points, tolerances):
+    tolerances = np.array(tolerances)[:,np.newaxis]
+    t = points[-1]
+    keep = [0]
+    anchor = 0
+    n = points.shape[1]
+    j = 1
+    while j < n - 1:
+        # try to skip point j, i.e. extend the segment from anchor to j+1
+        inner = slice(anchor + 1, j + 1)
+        fraction = (t[inner] - t[anchor]) / (t[j+1] - t[anchor])
+        line = points[:-1,anchor,np.newaxis] + (points[:-1,j+1] - points[:-1,anchor])[:,np.newaxis] * fraction
+        if (np.abs(points[:-1,inner] - line) > tolerances).any():
+            keep.append(j)
+            anchor = j
+        j += 1
+    keep.append(n - 1)
+    return points[:,keep]
+
+# simulates the planner queue as moves are written, and coarsens moves that would starve it by relaxing the
+# discretization tolerances in steps of 2x, up to max_relaxation
+class capacity_control:
+    def __init__(self, planner_parameters, tolerances):
+        self.model = planner_model(planner_parameters.max_segments_per_s, planner_parameters.buffer_depth, planner_parameters.serial_cost)
+        self.tolerances = np.array(tolerances)
+        self.max_relaxation = planner_parameters.max_relaxation
+        self.coarsened = Counter() # coarsened moves per layer height
+        self.relaxation = 1        # largest relaxation used
+        self.trace = None          # if a list, the lines sent (int) and segment durations pushed (list) are appended to it
+
+    # send lines that don't move the machine, see planner_model.send
+    def send(self, lines):
+        self.model.send(lines)
+        if self.trace is not None:
+            self.trace.append(lines)
+
+    def _push(self, durations):
+        self.model.push(durations)
+        if self.trace is not None:
+            self.trace.append(durations)
+
+    # returns the points to write for a discretized move
+    def adjust(self, points):
+        durations = np.diff(points[-1]).tolist()
+        if self.model.predict(durations) <= 1e-9:
+            self._push(durations)
+            return points
+
+        # the dense points are within tolerance of the curves, so a coarse path within (factor-1)*tolerance
+        # of them is within factor*tolerance of the curves
+        coarse = points
+        factor = 1
+        while factor < self.max_relaxation:
+            factor = min(2 * factor, self.max_relaxation) # the last step is to max_relaxation itself
+            coarse = decimate(points, (factor - 1) * self.tolerances)
+            if self.model.predict(np.diff(coarse[-1]).tolist()) <= 1e-9:
+                break
+
+        if coarse.shape[1] < points.shape[1]:
+            self.coarsened[round(points[2,0], 3)] += 1
+            self.relaxation = max(self.relaxation, factor)
+        else:
+            coarse = points
+        self._push(np.diff(coarse[-1]).tolist())
+        return coarse
+
+    # send and push a trace again (e.g. of output that is reused), as long as none of the moves would be coarsened
+    # (unless check is False). Returns whether the trace was replayed, the model is left unchanged if not.
+    def replay(self, trace, check = True):
+        state = self.model._state()
+        for entry in trace:
+            if isinstance(entry, int):
+                self.model.send(entry)
+            elif self.model.push(entry) > 1e-9 and check:
+                self.model._restore(state)
+                return False
+        return True
+
+    # human readable summary of where the output was coarsened, None if it never was
+    def summary(self, max_layers = 10):
+        if not self.coarsened:
+            return None
+        layers = sorted(self.coarsened)
+        where = ', '.join(f'{z:g}' for z in layers[:max_layers]) + (', ...' if len(layers) > max_layers else '')
+        return (f'coarsened {sum(self.coarsened.values())} moves on {len(layers)} layers (z = {where}), '
+                f'tolerances relaxed up to {self.relaxation}x, {self.model.stall:.3f} s of predicted stalls remaining')
@@ -2,7 +2,10 @@ from math import inf, nan, isnan
 import matplotlib.pyplot as plt
 import numpy as np
 import sys
+import io
 import gcode_parser
+import layer_index
+import lod
 import matplotlib as mpl
 import argparse
 #mpl.use('tkagg')
@@ -10,90 +13,82 @@ import argparse
 
 parser = argparse.ArgumentParser(description='Visualize the motion profiles of a slice of a G-Code file')
 parser.add_argument('file', type=argparse.FileType('r'), nargs='?', default=(None if sys.stdin.isatty() else sys.stdin), help='G-Code file to be processed (or stdin)')
-parser.add_argument('-z', type=float, help='the z height for the slice in mm', required=True)
+parser.add_argument('-z', type=float, help='the z height for the slice in mm (required unless --list)')
 parser.add_argument('-e', type=float, default=0.01, help='the z tolerance for the slice in mm (default: 0.01 mm)')
+parser.add_argument('-l', '--list', action='store_true', help='list the z heights of the layers and exit')
+parser.add_argument('--lod', action='store_true', help='plot only the first, last, minimum and maximum points per pixel of the view (for large slices)')
 
 args = parser.parse_args()
-
-zs = set()
-
-current_x = nan
-current_y = nan
-current_z = nan
-current_e = nan
-current_f = nan
-
-offset_e = 0
-e_relative = False
+if args.z is None and not args.list:
+    parser.error('-z is required unless --list is given')
 
 output = []
 
-for line in args.file.readlines():
-    c = gcode_parser.parse(line)
-
-    if c and 'G' in c:
-        if c['G'] == 0 or c['G'] == 1:            
-            current_x = c['X'] if 'X' in c else current_x
-            current_y = c['Y'] if 'Y' in c else current_y
-            current_z = c['Z'] if 'Z' in c else current_z
-            
-            current_f = c['F'] if 'F' in c else current_f
-
-            last_e = current_e
-            if e_relative:
-                current_e += c['E'] if 'E' in c else 0
-            else: 
-                current_e = c['E'] if 'E' in c else current_e
-
-            # TODO: add support for relative E moves
-            new_pos = (current_x, current_y, current_z, current_e + offset_e, current_f / 60)
-
-            zs.add(current_z)
-
-            dist = inf
-            if output:
-                dist = np.linalg.norm(np.array(new_pos[:4])-np.array(output[-1][:4]))
-            
-            if dist > 0 and not isnan(current_f + current_x + current_y + current_z + current_e) and abs(current_z - args.z) < args.e:
-                output.append(new_pos)
-        if c['G'] == 92:
-            if 'E' in c:
-                if isnan(current_e):
-                    current_e = 0
-                offset_e += current_e - c['E']
-                current_e = c['E']
-    if c and 'M' in c:
-        if c['M'] == 82:
-            e_relative = False
-        if c['M'] == 83:
-            e_relative = True
-
-
-if not output:
-    print(f'No slice found at {args.z}. Available slices:')
-    print(f'   {sorted(list(zs))}')
-    sys.exit(1)
+# the points of the slice from the lines, starting at the given state
+def read_slice(lines, state):
+    for line in lines:
+        new_pos = layer_index.step(state, gcode_parser.parse(line))
+        if new_pos is None:
+            continue
+
+        moved = not output or new_pos[:4] != output[-1][:4]
+
+        if moved and not isnan(state.f + state.x + state.y + state.z + state.e) and abs(state.z - args.z) < args.e:
+            output.append(new_pos)
+
+if args.file is sys.stdin:
+    # no sidecar index for streamed input, index it in memory
+    stream = io.BytesIO(args.file.read().encode())
+    runs = layer_index.build(stream)
+else:
+    # the sidecar index is built on first use, after that the layer is read straight from its offsets
+    args.file.close()
+    runs = layer_index.load(args.file.name)
+    stream = open(args.file.name, 'rb')
+
+if not args.list:
+    for state, lines in layer_index.read_layer(stream, runs, args.z, args.e):
+        read_slice(lines, state)
+
+if args.list or not output:
+    if not args.list:
+        print(f'No slice found at {args.z}. Available slices:')
+    print(f'   {layer_index.layers(runs)}')
+    sys.exit(0 if args.list else 1)
 
 output = np.array(output)
 d_euclidean = np.linalg.norm(output[1:,0:3] - output[:-1,0:3], axis=1)
 d_extruder = np.abs(output[1:,3] - output[:-1,3])
-dist = [d_euclidean[i] if d_euclidean[i] > 0 else d_extruder[i] for i in range(len(d_euclidean))]
+dist = np.where(d_euclidean > 0, d_euclidean, d_extruder)
 time = dist / output[1:,4]
 t = np.cumsum(time)
+velocity = (output[2:,:4]-output[1:-1,:4])/(np.transpose([t[1:]-t[:-1]]))
 
 ax = plt.subplot(2,1,1)
-ax.plot(t, output[1:,0], 'o-', markersize = 2, label = '$X$')
-ax.plot(t, output[1:,1], 'o-', markersize = 2, label = '$Y$')
-ax.plot(t, output[1:,3], 'o-', markersize = 2, label = '$E$')
+ax2 = plt.subplot(2,1,2, sharex = ax)
 ax.margins(0, 0.01, tight=True)
+if args.lod:
+    # lines are filled with the decimated points in view, and redone on zoom
+    position_lines = [ax.plot([], [], 'o-', markersize = 2, label = label)[0] for label in ['$X$', '$Y$', '$E$']]
+    velocity_lines = [ax2.plot([], [], drawstyle='steps-post', label = label)[0] for label in ['$\\dot X$', '$\\dot Y$', '$\\dot E$']]
+    ax.set_xlim(t[0], t[-1])
+    decimated = [lod.decimated_lines(ax, t, position_lines, output[1:,[0,1,3]].T, marker = 'o'),
+                 lod.decimated_lines(ax2, t[:-1], velocity_lines, velocity[:,[0,1,3]].T)]
+    for a in [ax, ax2]:
+        a.relim()
+        a.autoscale_view(scalex = False)
+else:
+    ax.plot(t, output[1:,0], 'o-', markersize = 2, label = '$X$')
+    ax.plot(t, output[1:,1], 'o-', markersize = 2, label = '$Y$')
+    ax.plot(t, output[1:,3], 'o-', markersize = 2, label = '$E$')
+    ax2.step(t[:-1], velocity[:,0], where='post', label = '$\\dot X$')
+    ax2.step(t[:-1], velocity[:,1], where='post', label = '$\\dot Y$')
+    ax2.step(t[:-1], velocity[:,3], where='post', label = '$\\dot E$')
 ax.legend()
+plt.sca(ax)
 plt.ylabel('mm')
-ax2 = plt.subplot(2,1,2, sharex = ax)
 
-velocity = (output[2:,:4]-output[1:-1,:4])/(np.transpose([t[1:]-t[:-1]]))
-ax2.step(t[:-1], velocity[:,0], where='post', label = '$\\dot X$')
-ax2.step(t[:-1], velocity[:,1], where='post', label = '$\\dot Y$')
-ax2.step(t[:-1], velocity[:,3], where='post', label = '$\\dot E$')
+plt.sca(ax2)
 plt.xlabel('time (s)')
 plt.ylabel('mm/s')
 ax2.legend()
@@ -1,26 +1,36 @@
 import numpy as np
-from math import inf, floor, log2
+from math import inf, nan, floor, log2, comb
+from functools import lru_cache
 
+# the coefficients of a polynomial (lowest order first) as an array, scalars are constant polynomials. Floating point
+# coefficients keep their dtype, others (e.g. integers) are kept as Python numbers, so that their arithmetic is exact
 def _to_poly(p):
-    if isinstance(p, (int, float, np.float64)):
-        return [p]
-    return p
+    p = np.atleast_1d(np.asarray(p))
+    return p if p.dtype.kind in 'fc' else p.astype(object)
+
+# the operands of a binary operation, an exact one is promoted if the other one is floating point
+def _to_polys(poly1, poly2):
+    poly1 = _to_poly(poly1)
+    poly2 = _to_poly(poly2)
+    if poly1.dtype == object and poly2.dtype != object:
+        poly1 = poly1.astype(poly2.dtype)
+    elif poly2.dtype == object and poly1.dtype != object:
+        poly2 = poly2.astype(poly1.dtype)
+    return poly1, poly2
+
+# the result of an operation on _to_poly operands: an array, or a list for exact coefficients (as they were given)
+def _from_poly(p):
+    return p.tolist() if p.dtype == object else p
 
 def differentiate(polynomial):
-    order = len(polynomial)-1
-    if order == 0:
-        return [0]
-    out = np.zeros(order)
-    for i in range(order):
-        out[i] = polynomial[i+1] * (i+1)
-    return out
-    
+    polynomial = np.atleast_1d(np.asarray(polynomial, dtype=np.float64))
+    if len(polynomial) == 1:
+        return np.zeros(1)
+    return polynomial[1:] * np.arange(1, len(polynomial))
+
 def integrate(polynomial):
-    order = len(polynomial)-1
-    out = np.zeros(order+2)
-    for i in range(order+1):
-        out[i+1] = polynomial[i] / (i+1)
-    return out
+    polynomial = np.atleast_1d(np.asarray(polynomial, dtype=np.float64))
+    return np.concatenate(([0], polynomial / np.arange(1, len(polynomial)+1)))
 
 # basic helper, defines a linear function from two points
 def line_from_to(x0, y0, x1, y1):
@@ -42,97 +52,190 @@ def to_string(poly):
                 str += f'^{i}'
         sep = " + "
     return str
-    
+
 def add(poly1, poly2):
-    poly1 = _to_poly(poly1)
-    poly2 = _to_poly(poly2)
+    poly1, poly2 = _to_polys(poly1, poly2)
 
     if len(poly2) > len(poly1):
         poly1,poly2 = poly2,poly1
     ret = poly1.copy()
-    for i in range(len(poly2)):
-        ret[i] += poly2[i]
-    return ret
+    ret[:len(poly2)] += poly2
+    return _from_poly(ret)
 
 def sub(poly1, poly2):
     return add(poly1, neg(poly2))
 
 def neg(poly):
-    poly = _to_poly(poly)
-    return [-k for k in poly]
+    return _from_poly(-_to_poly(poly))
 
 def mul(poly1, poly2):
-    poly1 = _to_poly(poly1)
-    poly2 = _to_poly(poly2)
-        
-    ret = [0] * (len(poly1) + len(poly2) - 1)
-    for i in range(len(poly1)):
-        for j in range(len(poly2)):
-            ret[i+j] += poly1[i] * poly2[j]
-    return ret
+    return _from_poly(np.convolve(*_to_polys(poly1, poly2)))
 
 def sq(poly):
-    n = len(poly)
-    ret = [0] * (n*2-1)
-    for i in range(n):
-        for j in range(i, n):
-            ret[i+j] += poly[i] * poly[j] * ((i!=j) + 1)
-    return ret
+    poly = _to_poly(poly)
+    return _from_poly(np.convolve(poly, poly))
 
 def pow(poly, exp):
     n = floor(log2(exp)) + 1 if exp > 0 else 0
-    ret = [1]
+    ret = _from_poly(np.ones(1, dtype=_to_poly(poly).dtype))
     for i in range(0,n):
         if exp & (2**i):
             ret = mul(ret, poly)
         if i < n:
             poly = sq(poly)
-    return ret    
-    
+    return ret
+
+# Horner, x may be an array
 def eval(poly, x):
-    order = len(poly)
     y = 0
-    for j in range(order):
-        i = order-j-1
-        y = x * y + poly[i]
+    for c in reversed(poly):
+        y = x * y + c
     return y
 
+# binomial coefficients and exponents of the Taylor shift of polynomials with m coefficients, q(x) = p(x + x0) has
+# q[i] = sum over j of binomials[i,j] * x0**exponents[i,j] * p[j], i.e. binomial(j, i) * x0**(j-i)
+@lru_cache(maxsize=None)
+def _pascal(m):
+    binomials = np.array([[comb(j, i) for j in range(m)] for i in range(m)], dtype=np.float64)
+    i, j = np.indices((m, m))
+    return binomials, np.maximum(j - i, 0)
+
+# the matrix of the Taylor shift by x0 of polynomials with m coefficients (applied to column vectors)
+def shift_matrix(m, x0):
+    binomials, exponents = _pascal(m)
+    return binomials * x0**exponents
+
 def shift(a, x0):
     """transform p(x) -> p(x+x0)"""
-    
+    a = np.atleast_1d(np.asarray(a, dtype=np.float64))
     if x0 == 0:
-        return a[:]
-    
-    #Given the n-degree polynomial: p(x) = anxn+an-1xn-1+...+a1x+a0
-    m = len(a)
-    n = m-1
-    
-    #We must obtain new polynomial coefficients qi, by Taylor shift q(x) = p(x+ x0).
-    #We'll use the matrix t of dimensions m x m, m=n+1 to store data.
-    t = [x[:] for x in [[0] * m] * m] 
-    
-    #Compute ti,0 = an-i-1x0n-i-1 for i=0..n-1
-    for i in range(n):
-        t[i][0] = a[n-i-1] * x0**(n-i-1)
-    
-    #Store ti,i+1 = anx0n for i=0..n-1
-    for i in range(n):
-        t[i][i+1] = a[n]*x0**n
-    
-    #Compute ti,j+1 = ti-1,j+ti-1,j+1 for j=0..n-1, i=j+1..n
-    for j in range(n):
-        for i in range(j+1,n+1):        
-            t[i][j+1] = t[i-1][j] + t[i-1][j+1]
-    
-    #Compute the coefficients: qi = tn,i+1/x0i for i=0..n-1
-    q = np.zeros(m)
-    for i in range(n):
-        q[i] = t[n][i+1]/x0**i
-        
-    #The highest degree coefficient is the same: qn = an
-    q[n] = a[n]
-    
-    return q
+        return a.copy()
+    return shift_matrix(len(a), x0) @ a
+
+# zero-pad the last axis of an array of coefficients to the given number of coefficients
+def pad_batch(coeffs, width):
+    if coeffs.shape[-1] >= width:
+        return coeffs
+    out = np.zeros(coeffs.shape[:-1] + (width,))
+    out[...,:coeffs.shape[-1]] = coeffs
+    return out
+
+# evaluate each row of a coefficient matrix (k, n+1) at the points in the corresponding row of x (k, m)
+def eval_batch(coeffs, x):
+    y = np.zeros(np.shape(x))
+    for j in range(coeffs.shape[1]-1, -1, -1):
+        y = y * x + coeffs[:,j,np.newaxis]
+    return y
+
+# shift every row of a coefficient matrix (k, n+1), q(x) = p(x + x0), by x0 or by the corresponding element of x0 (k,)
+def shift_batch(coeffs, x0):
+    coeffs = np.asarray(coeffs, dtype=np.float64)
+    if np.ndim(x0) == 0:
+        return coeffs @ shift_matrix(coeffs.shape[1], x0).T
+    binomials, exponents = _pascal(coeffs.shape[1])
+    return np.einsum('kij,kj->ki', binomials * np.asarray(x0, dtype=np.float64)[:,np.newaxis,np.newaxis]**exponents, coeffs)
+
+def differentiate_batch(coeffs):
+    return coeffs[:,1:] * np.arange(1, coeffs.shape[1])
+
+# roots of the rows that are (at most) quadratic, NaN where there is none, same criteria as find_roots
+def _quadratic_roots_batch(coeffs, x_min, x_max):
+    coeffs = pad_batch(coeffs, 3)
+    c0, c1, c2 = coeffs[:,0], coeffs[:,1], coeffs[:,2]
+    roots = np.full((len(coeffs), 2), nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        linear = (np.abs(c2) < 1e-16) & (np.abs(c1) >= 1e-16)
+        roots[linear,0] = -c0[linear] / c1[linear]
+
+        quadratic = np.abs(c2) >= 1e-16
+        b = c1[quadratic] / c2[quadratic]
+        c = c0[quadratic] / c2[quadratic]
+        discriminant = b**2 - 4*c
+        sd = np.sqrt(np.where(discriminant >= 0, discriminant, nan))
+        roots[quadratic,0] = (-b - sd) / 2
+        roots[quadratic,1] = np.where(discriminant == 0, nan, (-b + sd) / 2)
+
+    roots[~((x_min[:,np.newaxis] < roots) & (roots < x_max[:,np.newaxis]))] = nan
+    return roots
+
+# a bound on the magnitude of the real roots of each row (Cauchy), 0 for (near) zero rows
+def _root_bound(coeffs):
+    significant = np.abs(coeffs) >= 1e-16
+    lead = coeffs.shape[1] - 1 - np.argmax(significant[:,::-1], axis=1)
+    rows = np.arange(len(coeffs))
+    lower = np.arange(coeffs.shape[1]) < lead[:,np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bound = 1 + np.max(np.where(lower, np.abs(coeffs), 0), axis=1, initial=0) / np.abs(coeffs[rows,lead])
+    return np.where(significant.any(axis=1), bound, 0)
+
+# refine the roots of each row that are bracketed by lo and hi (function values of opposite sign), safeguarded Newton
+def _refine_brackets(coeffs, lo, hi):
+    derivative = differentiate_batch(coeffs)
+    f_lo = eval_batch(coeffs, lo[:,np.newaxis])[:,0]
+    x = 0.5 * (lo + hi)
+    active = np.arange(len(x))
+    for _ in range(100):
+        c = coeffs[active]
+        fx = eval_batch(c, x[active,np.newaxis])[:,0]
+        dfx = eval_batch(derivative[active], x[active,np.newaxis])[:,0]
+
+        same_sign = np.sign(fx) == np.sign(f_lo[active])
+        lo[active] = np.where(same_sign, x[active], lo[active])
+        hi[active] = np.where(same_sign, hi[active], x[active])
+        f_lo[active] = np.where(same_sign, fx, f_lo[active])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = x[active] - fx / dfx
+        inside = (lo[active] < newton) & (newton < hi[active])
+        step = np.where(inside, newton, 0.5 * (lo[active] + hi[active]))
+
+        done = (fx == 0) | (np.abs(step - x[active]) <= 4 * np.finfo(float).eps * np.maximum(1, np.abs(x[active])))
+        x[active] = np.where(fx == 0, x[active], step)
+        active = active[~done]
+        if len(active) == 0:
+            break
+    return x
+
+# find the real roots of many polynomials at once, each row of coeffs (k, n+1) in its own open interval (x_min, x_max).
+# Returns a (k, n) matrix with the sorted roots of each row, padded with NaN. Degree <= 2 is solved in closed form,
+# higher degrees by isolation: the roots of the derivative split the interval into monotonic pieces that contain
+# at most one root each, which is then refined within its bracket.
+def find_roots_batch(coeffs, x_min, x_max):
+    coeffs = np.asarray(coeffs, dtype=np.float64)
+    k = len(coeffs)
+    x_min = np.broadcast_to(np.asarray(x_min, dtype=np.float64), (k,))
+    x_max = np.broadcast_to(np.asarray(x_max, dtype=np.float64), (k,))
+
+    # eliminate (near) zero high-order coefficients shared by all rows
+    width = coeffs.shape[1]
+    while width > 1 and (np.abs(coeffs[:,width-1]) < 1e-16).all():
+        width -= 1
+    coeffs = coeffs[:,:width]
+    degree = width - 1
+
+    if degree <= 0 or k == 0:
+        return np.full((k, max(degree, 0)), nan)
+    if degree <= 2:
+        return _quadratic_roots_batch(coeffs, x_min, x_max)[:,:degree]
+
+    # isolation needs finite intervals
+    bound = _root_bound(coeffs)
+    a = np.maximum(x_min, -bound)
+    b = np.minimum(x_max, bound)
+
+    critical = find_roots_batch(differentiate_batch(coeffs), a, b)
+    breaks = np.sort(np.hstack((a[:,np.newaxis], np.where(np.isnan(critical), b[:,np.newaxis], critical), b[:,np.newaxis])), axis=1)
+    values = eval_batch(coeffs, breaks)
+
+    roots = np.full((k, degree), nan)
+    bracketed = values[:,:-1] * values[:,1:] < 0
+    rows, pieces = np.nonzero(bracketed)
+    roots[rows, pieces] = _refine_brackets(coeffs[rows], breaks[rows,pieces].copy(), breaks[rows,pieces+1].copy())
+
+    # (multiple) roots at the critical points themselves
+    at_critical = np.where(values[:,1:-1] == 0, breaks[:,1:-1], nan)
+    at_critical[~((a[:,np.newaxis] < at_critical) & (at_critical < b[:,np.newaxis]))] = nan
+    return np.sort(np.hstack((roots, at_critical)), axis=1)[:,:degree]
 
 # find all real roots between x_min and x_max (exclusive)
 def find_roots(poly, x_min, x_max):
@@ -161,8 +264,8 @@ def find_roots(poly, x_min, x_max):
         else:
             return []
     else:
-        # TODO
-        assert False, "unimplemented"
+        roots = find_roots_batch([poly], x_min, x_max)[0]
+        return roots[~np.isnan(roots)].tolist()
 
 # return the (min, max) range of the polynomial in the given domain (inclusive)
 def minmax(poly, x_min, x_max):
@@ -176,6 +279,15 @@ def minmax(poly, x_min, x_max):
         y_max = max(y_max, y)
     return y_min, y_max
 
+# (min, max) range of each row of coeffs in its domain [x_min, x_max] (inclusive), as two arrays
+def minmax_batch(coeffs, x_min, x_max):
+    coeffs = np.asarray(coeffs, dtype=np.float64)
+    x_min = np.broadcast_to(np.asarray(x_min, dtype=np.float64), (len(coeffs),))
+    x_max = np.broadcast_to(np.asarray(x_max, dtype=np.float64), (len(coeffs),))
+    x = np.hstack((x_min[:,np.newaxis], x_max[:,np.newaxis], find_roots_batch(differentiate_batch(coeffs), x_min, x_max)))
+    y = eval_batch(coeffs, np.where(np.isnan(x), x_min[:,np.newaxis], x))
+    return y.min(axis=1), y.max(axis=1)
+
 # return a new polynomial f(g(x))
 def composite(f, g):
     ret = [0]
@@ -3,11 +3,30 @@
 import gcode_parser
 from dataclasses import dataclass
 import sys
+import os
+import stat
 import copy
+import io
+import argparse
+import time
+import re
+from collections import deque, Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
 from math import nan, isnan
 import gcode_adjuster
+import move_cache
+import gcode_writer
+import stats
+import planner
+import lookahead
+import smoothing
+import checkpoint
+import layer_cache
 from config import *
 
+OUTPUT_BUFFER_SIZE = 1 << 20
+
 MIN_PYTHON = (3, 7)
 assert sys.version_info >= MIN_PYTHON, f"requires Python {'.'.join([str(n) for n in MIN_PYTHON])} or newer"
 
@@ -23,95 +42,638 @@ class State:
     f = nan
     autostart = True
 
-current_state = State()
-
-count = 0
-for line in sys.stdin.readlines():
-    count += 1
-    c = gcode_parser.parse(line)
-
-    consumed = False
-
-    if c and 'G' in c:
-        # detect G0/1
-        if not current_state.g_relative and (c['G'] == 0 or c['G'] == 1):
-            new_state = copy.deepcopy(current_state)
-            if 'X' in c:
-                new_state.x = c['X']
-            if 'Y' in c:
-                new_state.y = c['Y']
-            if 'Z' in c:
-                new_state.z = c['Z']
-            if 'E' in c:
-                if current_state.e_relative:
-                    new_state.e += c['E']
-                else:
-                    new_state.e = c['E']
-            if 'F' in c:
-                new_state.f = c['F']
-
-            if c['G'] == 1 and current_state.modifying:
-                
-                if gcode_adjuster.process([current_state.x, current_state.y, current_state.z, current_state.e],
-                                        [new_state.x, new_state.y, new_state.z, new_state.e], new_state.f/60, current_state.e_relative, motion_parameters, curve_parameters, calibration_adjustment):
-                    consumed = True
-                else:
-                    if not 'F' in c:
-                        # We likely have an extruder-only move, but without a speed tagged. We will need to patch it.
-                        print(line.rstrip() + f" F{new_state.f} ; note: added F to extruder-only move")
-                        consumed = True
+STATE_FIELDS = [name for name in vars(State) if not name.startswith('_')] # saved in checkpoints
+
+# a chunk of moves that is generated by one worker process
+class _chunk:
+    def __init__(self):
+        self.moves = []
+        self.future = None
+
+# writes the output in input order. Moves are either adjusted immediately (jobs == 1) or collected into
+# chunks that are generated by a process pool, while the surrounding lines are queued behind them.
+# calibration = the calibration_adjustment of the parameters (e.g. a variant, see variant_outputs)
+# detect_chains = False if the runs of moves are detected by the caller and passed to _plan
+class ordered_output:
+    def __init__(self, out, jobs = 1, chunk_size = 64, calibration = calibration_adjustment, detect_chains = True):
+        self.out = out
+        self.calibration = calibration
+        self.pool = ProcessPoolExecutor(jobs) if jobs > 1 else None
+        self.chunk_size = chunk_size
+        self.max_queued = 4 * jobs * chunk_size # bounds the memory held by pending output
+        self.queue = deque() # output text or (chunk, index, fallback text)
+        self.chunk = _chunk()
+        self.cache = None # worker processes keep their own caches
+        if self.pool is None and cache_parameters.max_bytes > 0:
+            self.cache = move_cache.profile_cache(cache_parameters.max_bytes, cache_parameters.quantum)
+        self.counters = Counter() # see gcode_adjuster.counters
+        self.throttle_events = Counter() # of the moves adjusted in this process, see move.throttle
+        self.writer = gcode_writer.g1_writer(curve_parameters.tolerances)
+        self.capacity = None
+        if planner_parameters.max_segments_per_s:
+            self.capacity = planner.capacity_control(planner_parameters, curve_parameters.tolerances)
+        self.junctions = None
+        if junction_parameters.window > 0:
+            self.junctions = lookahead.junction_planner(motion_parameters, curve_parameters, junction_parameters, calibration)
+        self.planned = deque() # moves waiting for their junction speeds, and the comments in between
+        self.move_time = 0     # duration of the adjusted moves (s)
+        self.chains = None
+        if chain_parameters.min_moves > 0 and detect_chains:
+            self.chains = smoothing.chain_detector(chain_parameters, motion_parameters.dynamic_model)
+        self.recording = None  # list the output is also appended to, see record
+
+    def write(self, text):
+        if self.chains is not None and self.chains.moves:
+            self._plan(self.chains.finish()) # chains don't extend across any other lines
+        if self.planned:
+            stripped = text.lstrip()
+            if not stripped or stripped[0] == ';':
+                self.planned.append(text)
+                return
+            self._end_chain() # anything else is executed by the printer between the moves, so they stop at it
+        self._write_queued(text)
+
+    def _write_queued(self, text):
+        if self.queue:
+            self.queue.append(text)
+        else:
+            self._write_text(text)
+
+    def _write_text(self, text):
+        stripped = text.lstrip()
+        if stripped and stripped[0] != ';':
+            self.writer.reset() # anything but comments may change the machine state the G1 writer relies on
+            if self.capacity is not None:
+                self.capacity.send(sum(1 for line in text.splitlines() if line.strip() and line.lstrip()[0] != ';'))
+        self._emit(text)
+
+    def _emit(self, text):
+        self.out.write(text)
+        if self.recording is not None:
+            self.recording.append(text)
+
+    def _write_move(self, result, e_relative, fallback):
+        if result is None:
+            stats.count('moves_passed_through')
+            self._write_text(fallback)
+            return
+        stats.count('moves_modified')
+        points, e_offset = result
+        if points is not None:
+            stats.record('points_per_move', points.shape[1] - 1)
+            self.move_time += points[-1,-1] - points[-1,0]
+            if self.capacity is not None:
+                with stats.stage('planner'):
+                    coarse = self.capacity.adjust(points)
+                if coarse is not points:
+                    stats.count('planner_coarsened')
+                    stats.count('planner_points_removed', points.shape[1] - coarse.shape[1])
+                points = coarse
+            with stats.stage('format'):
+                self._emit(self.writer.format(points, e_offset, e_relative))
+
+    # capture anything printed by fn (e.g. the config's firmware control commands) into the output
+    def write_printed(self, fn):
+        buffer = io.StringIO()
+        with redirect_stdout(buffer):
+            fn()
+        self.write(buffer.getvalue())
+
+    # add a move to be adjusted, fallback is written instead if the move is left unmodified
+    def add_move(self, source, destination, target_speed, e_relative, fallback):
+        if self.chains is None:
+            self._plan([([(source, destination, target_speed, e_relative, fallback)], None)])
+            return
+        self._plan(self.chains.add(source, destination, target_speed, e_relative, fallback))
+
+    # plan runs of moves (see smoothing.chain_detector), chains are smoothed into one path
+    def _plan(self, runs):
+        for run, fit in runs:
+            path = fit if fit is not None else run[0][:2]
+            target_speed, e_relative = run[0][2:4]
+            fallback = ''.join(m[4] for m in run)
+
+            if self.junctions is None:
+                self._add_move(path, target_speed, e_relative, fallback, (0, 0))
+                continue
+
+            self.planned.append([path, target_speed, e_relative, fallback, None])
+            if fit is not None:
+                self._release(self.junctions.add_chain(fit, target_speed))
+            else:
+                self._release(self.junctions.add(*path, target_speed))
+
+    # hand the moves that got their junction speeds on to be adjusted, in order
+    def _release(self, speeds):
+        speeds = iter(speeds)
+        for entry in self.planned:
+            if isinstance(entry, list) and entry[4] is None:
+                entry[4] = next(speeds, None)
+                if entry[4] is None:
+                    break
+
+        while self.planned:
+            entry = self.planned[0]
+            if isinstance(entry, list):
+                if entry[4] is None:
+                    break
+                self._add_move(*entry)
+            else:
+                self._write_queued(entry)
+            self.planned.popleft()
+
+    # stop at the end of the planned moves
+    def _end_chain(self):
+        self._release(self.junctions.finish())
+
+    def _add_move(self, path, target_speed, e_relative, fallback, junction_speeds):
+        if self.pool is None:
+            if self.queue:
+                self._drain(0)
+            result = gcode_adjuster.adjust_path(path, target_speed, e_relative, motion_parameters, curve_parameters, self.calibration, self.cache, junction_speeds, self.throttle_events)
+            self._write_move(result, e_relative, fallback)
+            return
 
-            current_state = new_state
-
-            if current_state.autostart and not current_state.modifying and not isnan(current_state.x) and not isnan(current_state.y) and not isnan(current_state.z) and not isnan(current_state.e) and not isnan(current_state.f):
-                current_state.modifying = True
-                disable_acceleration_control()
-            
-            if count % 100 == 0:
-                print(f'\rz = {current_state.z:.2f} mm', file=sys.stderr, end='', flush=True)
-
-        if c['G'] == 92:
-            if 'X' in c:
-                current_state.x = c['X']
-            if 'Y' in c:
-                current_state.y = c['Y']
-            if 'Z' in c:
-                current_state.z = c['Z']
-            if 'E' in c:
-                current_state.e = c['E']
-        if c['G'] == 91:
-            # we don't support relative G0/G1 moves, leave unmodified
-            current_state.g_relative = True
-            if current_state.modifying:
-                current_state.modifying = False
-                restore_acceleration_control()
-            # declare ourselves lost
-            current_state.x = nan
-            current_state.y = nan
-            current_state.z = nan
-        if c['G'] == 90:
-            current_state.g_relative = False
-
-    if c and 'M' in c:
-        if c['M'] == 82:
-            current_state.e_relative = False
-        if c['M'] == 83:
-            current_state.e_relative = True
-    
-    if '--- MODIFY START ---' in line:
-        if not current_state.modifying:
-            current_state.modifying = True
+        self.queue.append((self.chunk, len(self.chunk.moves), fallback))
+        self.chunk.moves.append((path, target_speed, e_relative, junction_speeds))
+        if len(self.chunk.moves) >= self.chunk_size:
+            self._submit()
+
+        self._drain(self.max_queued // 2 if len(self.queue) > self.max_queued else None)
+
+    def _submit(self):
+        if self.chunk.moves:
+            self.chunk.future = self.pool.submit(gcode_adjuster.adjust_chunk, self.chunk.moves, motion_parameters, curve_parameters, self.calibration, cache_parameters, stats.enabled)
+            self.chunk = _chunk()
+
+    # write out everything that is ready. If a limit is given, wait for results until at most limit entries are queued
+    def _drain(self, limit = None):
+        while self.queue:
+            block = limit is not None and len(self.queue) > limit
+            entry = self.queue[0]
+            if isinstance(entry, tuple):
+                chunk, index, fallback = entry
+                if chunk.future is None:
+                    if not block:
+                        return
+                    self._submit()
+                if not block and not chunk.future.done():
+                    return
+                results, counters, worker_stats = chunk.future.result()
+                if index == 0:
+                    self.counters.update(counters)
+                    stats.merge(*worker_stats)
+                self._write_move(results[index], chunk.moves[index][2], fallback)
+            else:
+                self._write_text(entry)
+            self.queue.popleft()
+
+    # write out everything for the moves added so far, stopping at the end of them. The profile cache is cleared and
+    # the G1 writer reset, so that the output from here on only depends on the state (see checkpoint_state), e.g. a
+    # run resumed from here (with an empty cache) writes the same output.
+    def settle(self):
+        if self.cache is not None:
+            self.cache.clear()
+        if self.chains is not None:
+            self._plan(self.chains.finish())
+        if self.junctions is not None:
+            self._end_chain()
+        if self.pool is not None:
+            self._submit()
+        self._drain(0)
+        self.writer.reset()
+
+    # settle, and return the offset of the end of the output written to the file
+    def sync(self):
+        self.settle()
+        self.out.flush()
+        os.fsync(self.out.fileno())
+        return os.lseek(self.out.fileno(), 0, os.SEEK_CUR)
+
+    # the state carried across a checkpoint, see settle
+    def checkpoint_state(self):
+        planner = None
+        if self.capacity is not None:
+            model = self.capacity.model
+            planner = [model.host, model.end, list(model.finish), model.stall]
+        return {'planner': planner, 'e_residual': float(self.writer.e_residual)}
+
+    def restore(self, saved):
+        if self.capacity is not None and saved['planner'] is not None:
+            model = self.capacity.model
+            host, end, finish, stall = saved['planner']
+            model._restore((host, end, deque(finish, maxlen = model.buffer_depth), stall))
+        self.writer.e_residual = saved['e_residual']
+
+    # start recording the output, and the trace of the planner model (see planner.capacity_control) if any
+    def record(self):
+        self.recording = []
+        if self.capacity is not None:
+            self.capacity.trace = []
+            self.coarsened = sum(self.capacity.coarsened.values())
+
+    # stop recording, returns (text, planner trace or None, whether any moves were coarsened)
+    def stop_recording(self):
+        text = ''.join(self.recording)
+        self.recording = None
+        if self.capacity is None:
+            return text, None, False
+        trace = self.capacity.trace
+        self.capacity.trace = None
+        return text, trace, sum(self.capacity.coarsened.values()) > self.coarsened
+
+    # write recorded output again (after settle), if the planner trace is replayed without coarsening any of its moves
+    # (or check is False). Returns whether it was written.
+    def replay(self, text, trace, check = True):
+        if self.capacity is not None and not self.capacity.replay(trace, check):
+            return False
+        self.out.write(text)
+        self.writer.reset()
+        return True
+
+    def close(self):
+        if self.chains is not None:
+            self._plan(self.chains.finish())
+        if self.junctions is not None:
+            self._end_chain()
+        if self.pool is not None:
+            self._submit()
+            self._drain(0)
+            self.pool.shutdown()
+        else:
+            self.counters = gcode_adjuster.counters(self.cache, self.throttle_events)
+        self.out.flush()
+
+# periodically records a checkpoint (see checkpoint.py) while processing lines from a checkpoint.line_reader. A
+# checkpoint that is due is taken at the next line other than a move or comment, which ends the moves anyway, or if
+# there is none within LATE_CHECKPOINT of the interval, after a move (the moves are stopped there). Either only
+# depends on the input offsets, so a resumed run takes the same checkpoints.
+class checkpoints:
+    LATE_CHECKPOINT = 1/2
+
+    def __init__(self, path, lines, output, interval):
+        self.path = path
+        self.lines = lines
+        self.output = output
+        self.interval = interval # bytes of input between checkpoints
+        self.saved = lines.offset
+        self.count = 0
+        self.late = 0 # checkpoints taken after a move
+
+    # whether to record a checkpoint after the current line, settled = whether it ended the moves
+    def due(self, settled = True):
+        return self.lines.offset - self.saved >= self.interval * (1 if settled else 1 + self.LATE_CHECKPOINT)
+
+    def save(self, state, late = False):
+        checkpoint.save(self.path, {
+            'output_offset': self.output.sync(),
+            'input_offset': self.lines.offset,
+            'state': {name: getattr(state, name) for name in STATE_FIELDS},
+            'output': self.output.checkpoint_state(),
+        })
+        self.saved = self.lines.offset
+        self.count += 1
+        self.late += late
+
+# reuses the output of runs of lines at the same z (see layer_cache.py) that was stored by an earlier run with the
+# same input, state and parameters in effect. Moves stop at the start of every run, so that its output doesn't
+# depend on what comes before it, other than through the planner model: the run is reused if its moves aren't
+# coarsened when it is replayed from the current planner state, or (if any were) the planner state is the same.
+# With relative extrusion, the part of it lost to rounding (see gcode_writer.g1_writer) isn't carried into a run.
+class cached_layers:
+    def __init__(self, directory, output, min_lines = layer_cache.MIN_RUN_LINES):
+        self.cache = layer_cache.store(directory)
+        self.output = output
+        self.min_lines = min_lines
+        self.hits = 0
+        self.misses = 0
+        self.commands = io.StringIO()
+        with redirect_stdout(self.commands):
             disable_acceleration_control()
-    if '--- MODIFY END ---' in line:
-        current_state.autostart = False # after encountering a "--- MODIFY END ---", smoothing doesn't resume until a "--- MODIFY START ---"
-        if current_state.modifying:
-            current_state.modifying = False
             restore_acceleration_control()
+        self.commands = self.commands.getvalue()
+
+    def runs(self, lines):
+        return layer_cache.runs(lines, self.min_lines)
+
+    # the planner model's state relative to the time of the next line, rounded to compare states of different runs
+    def _planner_state(self):
+        if self.output.capacity is None:
+            return None
+        model = self.output.capacity.model
+        return [None if model.end is None else round(model.end - model.host, 9), [round(t - model.host, 9) for t in model.finish]]
+
+    # returns the State at the end of the run if its output was cached and has been written, otherwise None and
+    # the output of the run is recorded until store
+    def lookup(self, heights, lines, state):
+        self.output.settle()
+        self.output.writer.e_residual = 0 # less than the resolution of E, but it would tie the run to the ones before
+        # the parameters the moves of the run are adjusted with (see calibration_adjustment), at each of its heights
+        parameters = []
+        for z in heights:
+            if z is not None:
+                calibration_adjustment(z)
+            parameters.append(layer_cache.parameters_key(motion_parameters, curve_parameters, cache_parameters, junction_parameters, chain_parameters, planner_parameters))
+        self.key = layer_cache.key(lines, parameters, self.commands, [getattr(state, name) for name in STATE_FIELDS])
+        self.planner_state = self._planner_state()
+
+        cached = self.cache.get(self.key)
+        if cached is not None:
+            text, saved = cached
+            exact = saved['planner'] is not None
+            if (not exact or saved['planner'] == self.planner_state) and self.output.replay(text, saved['trace'], check = not exact):
+                self.hits += 1
+                state = State()
+                for name, value in saved['state'].items():
+                    setattr(state, name, value)
+                return state
+
+        self.misses += 1
+        self.output.record()
+        return None
+
+    # store the output of the run since lookup, and the state at its end
+    def store(self, state):
+        self.output.settle()
+        text, trace, coarsened = self.output.stop_recording()
+        self.cache.put(self.key, text, {
+            'state': {name: getattr(state, name) for name in STATE_FIELDS},
+            'trace': trace,
+            'planner': self.planner_state if coarsened else None,
+        })
+
+# a variant of the parameters, given as assignments name=value separated by spaces or commas, where name is an
+# attribute of motion_parameters (e.g. accel) or of an axis' dynamic model (e.g. x.f_n, y.zeta, e.k). Called like
+# calibration_adjustment: the swept attributes are reset to their values in config.py (base, shared between the
+# variants of a sweep), then calibration_adjustment and then the assignments are applied.
+class variant:
+    AXES = 'xyze'
+
+    def __init__(self, spec, base):
+        self.spec = spec
+        self.base = base
+        self.assignments = []
+        for assignment in spec.replace(',', ' ').split():
+            name, _, value = assignment.partition('=')
+            axis, _, attribute = name.rpartition('.')
+            if axis:
+                if axis not in self.AXES:
+                    raise ValueError(f'unknown axis {axis} in {assignment}, expected one of {", ".join(self.AXES)}')
+                target = motion_parameters.dynamic_model[self.AXES.index(axis)]
+            else:
+                target = motion_parameters
+            if attribute.startswith('_') or not hasattr(target, attribute) or not isinstance(getattr(target, attribute), (int, float)):
+                raise ValueError(f'{assignment}: {type(target).__name__ if axis else "motion_parameters"} has no parameter {attribute}')
+            self.assignments.append((target, attribute, float(value)))
+            base.setdefault(name, (target, attribute, getattr(target, attribute)))
+
+    def __call__(self, z):
+        for target, attribute, value in self.base.values():
+            setattr(target, attribute, value)
+        calibration_adjustment(z)
+        for target, attribute, value in self.assignments:
+            setattr(target, attribute, value)
+
+# writes the output for several variants of the parameters in one pass over the input, each to its own file. The
+# parsing and the detection (and fit) of chains are shared, and so are the arc profiles of moves that get the same
+# speeds in all variants (see move._arc_profile).
+class variant_outputs:
+    def __init__(self, outs, variants):
+        self.outputs = [ordered_output(out, calibration = v, detect_chains = False) for out, v in zip(outs, variants)]
+        self.chains = None
+        if chain_parameters.min_moves > 0:
+            self.chains = smoothing.chain_detector(chain_parameters, motion_parameters.dynamic_model)
+
+    def write(self, text):
+        if self.chains is not None and self.chains.moves:
+            self._plan(self.chains.finish())
+        for output in self.outputs:
+            output.write(text)
+
+    def write_printed(self, fn):
+        buffer = io.StringIO()
+        with redirect_stdout(buffer):
+            fn()
+        self.write(buffer.getvalue())
+
+    def add_move(self, source, destination, target_speed, e_relative, fallback):
+        if self.chains is None:
+            self._plan([([(source, destination, target_speed, e_relative, fallback)], None)])
+            return
+        self._plan(self.chains.add(source, destination, target_speed, e_relative, fallback))
+
+    def _plan(self, runs):
+        for output in self.outputs:
+            # the source and destination of single moves are modified when they are adjusted
+            output._plan([([(list(m[0]), list(m[1])) + m[2:] for m in run], fit) for run, fit in runs])
+
+    def close(self):
+        if self.chains is not None:
+            self._plan(self.chains.finish())
+        for output in self.outputs:
+            output.close()
+
+# state = the State to start from (when resuming), checkpoints = optional checkpoints to record along the way,
+# layers = optional cached_layers to reuse the output of unchanged layers from
+def process(lines, output, state = None, checkpoints = None, layers = None):
+    current_state = State()
+    if state is not None:
+        for name, value in state.items():
+            setattr(current_state, name, value)
+
+    parse = stats.timed('parse', gcode_parser.parse)
+
+    count = 0
+    runs = [(None, lines)] if layers is None else layers.runs(lines)
+    for heights, run in runs:
+        if layers is not None:
+            cached = layers.lookup(heights, run, current_state)
+            if cached is not None:
+                current_state = cached
+                continue
+
+        for line in run:
+            count += 1
+            c = parse(line)
+
+            consumed = False
+
+            if c and 'G' in c:
+                # detect G0/1
+                if not current_state.g_relative and (c['G'] == 0 or c['G'] == 1):
+                    new_state = copy.deepcopy(current_state)
+                    if 'X' in c:
+                        new_state.x = c['X']
+                    if 'Y' in c:
+                        new_state.y = c['Y']
+                    if 'Z' in c:
+                        new_state.z = c['Z']
+                    if 'E' in c:
+                        if current_state.e_relative:
+                            new_state.e += c['E']
+                        else:
+                            new_state.e = c['E']
+                    if 'F' in c:
+                        new_state.f = c['F']
+
+                    if c['G'] == 1 and current_state.modifying:
+                        if not 'F' in c:
+                            # If left unmodified, we likely have an extruder-only move, but without a speed tagged. We will need to patch it.
+                            fallback = line.rstrip() + f" F{new_state.f} ; note: added F to extruder-only move\n"
+                        else:
+                            fallback = line
+                        output.add_move([current_state.x, current_state.y, current_state.z, current_state.e],
+                                        [new_state.x, new_state.y, new_state.z, new_state.e], new_state.f/60, current_state.e_relative, fallback)
+                        consumed = True
+
+                    current_state = new_state
+
+                    if current_state.autostart and not current_state.modifying and not isnan(current_state.x) and not isnan(current_state.y) and not isnan(current_state.z) and not isnan(current_state.e) and not isnan(current_state.f):
+                        current_state.modifying = True
+                        output.write_printed(disable_acceleration_control)
+
+                    if count % 100 == 0:
+                        print(f'\rz = {current_state.z:.2f} mm', file=sys.stderr, end='', flush=True)
+
+                if c['G'] == 92:
+                    if 'X' in c:
+                        current_state.x = c['X']
+                    if 'Y' in c:
+                        current_state.y = c['Y']
+                    if 'Z' in c:
+                        current_state.z = c['Z']
+                    if 'E' in c:
+                        current_state.e = c['E']
+                if c['G'] == 91:
+                    # we don't support relative G0/G1 moves, leave unmodified
+                    current_state.g_relative = True
+                    if current_state.modifying:
+                        current_state.modifying = False
+                        output.write_printed(restore_acceleration_control)
+                    # declare ourselves lost
+                    current_state.x = nan
+                    current_state.y = nan
+                    current_state.z = nan
+                if c['G'] == 90:
+                    current_state.g_relative = False
+
+            if c and 'M' in c:
+                if c['M'] == 82:
+                    current_state.e_relative = False
+                if c['M'] == 83:
+                    current_state.e_relative = True
+
+            if '--- MODIFY START ---' in line:
+                if not current_state.modifying:
+                    current_state.modifying = True
+                    output.write_printed(disable_acceleration_control)
+            if '--- MODIFY END ---' in line:
+                current_state.autostart = False # after encountering a "--- MODIFY END ---", smoothing doesn't resume until a "--- MODIFY START ---"
+                if current_state.modifying:
+                    current_state.modifying = False
+                    output.write_printed(restore_acceleration_control)
+
+            if not consumed:
+                output.write(line)
+            if checkpoints is not None:
+                # anything but moves and comments ends the chains of moves, so all output up to here can be written out
+                stripped = line.lstrip()
+                settled = not consumed and stripped and stripped[0] != ';'
+                if checkpoints.due(settled):
+                    checkpoints.save(current_state, late = not settled)
+
+        if layers is not None:
+            layers.store(current_state)
+
+    if current_state.modifying:
+        output.write_printed(restore_acceleration_control)
+
+def main():
+    parser = argparse.ArgumentParser(description='Adjust the G1 moves of a G-Code file (stdin) for dynamic motion control and write the result to stdout')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of worker processes generating moves (default: 1)')
+    parser.add_argument('--chunk-size', type=int, default=64, help='number of moves handed to a worker process at a time (default: 64)')
+    parser.add_argument('--stats', nargs='?', const='-', metavar='FILE', help='print per-stage timings and counters to stderr, or write them as JSON to FILE')
+    parser.add_argument('--checkpoint', metavar='FILE', help='periodically record the progress in FILE, so that an interrupted run can be resumed (stdin and stdout must be files)')
+    parser.add_argument('--checkpoint-interval', type=float, default=64, metavar='MB', help='megabytes of input between checkpoints (default: 64)')
+    parser.add_argument('--resume', action='store_true', help='continue from the checkpoint in the --checkpoint FILE, truncating the output (e.g. opened with >>) to it and appending to it')
+    parser.add_argument('--layer-cache', metavar='DIR', help='store the output of every layer in DIR, and reuse it on later runs where the layer, the state at its start and the parameters at its z are unchanged')
+    parser.add_argument('--variant', action='append', metavar='SPEC', help='write the output for a variant of the parameters, e.g. "x.f_n=48 x.zeta=0.05", to its own file instead of stdout. Repeat for a sweep, which processes the input once for all variants')
+    parser.add_argument('--variant-output', default='variant_{index}.gcode', metavar='TEMPLATE', help='file name of the output of each --variant, {index} is replaced by its number and {name} by its parameters (default: variant_{index}.gcode)')
+    args = parser.parse_args()
+
+    lines = sys.stdin
+    saved = None
+    if args.resume and not args.checkpoint:
+        parser.error('--resume requires --checkpoint')
+    if args.layer_cache and args.checkpoint:
+        parser.error('--layer-cache can\'t be combined with --checkpoint')
+    if args.variant and (args.jobs > 1 or args.checkpoint or args.layer_cache):
+        parser.error('--variant can\'t be combined with --jobs, --checkpoint or --layer-cache')
+    if args.checkpoint:
+        if not (stat.S_ISREG(os.fstat(sys.stdin.fileno()).st_mode) and stat.S_ISREG(os.fstat(sys.stdout.fileno()).st_mode)):
+            parser.error('--checkpoint requires stdin and stdout to be redirected from and to files')
+        if args.resume:
+            saved = checkpoint.load(args.checkpoint)
+            checkpoint.rewind(saved, sys.stdin.fileno(), sys.stdout.fileno())
+        lines = checkpoint.line_reader(open(sys.stdin.fileno(), 'rb', closefd=False), sys.stdin.encoding, sys.stdin.errors,
+                                       saved['input_offset'] if saved else os.lseek(sys.stdin.fileno(), 0, os.SEEK_CUR))
+
+    stats.enabled = args.stats is not None
+    start = time.perf_counter()
+
+    # stream the input line by line, and write through a large buffer that is only flushed when it is full (or at a checkpoint)
+    if args.variant:
+        base = {}
+        try:
+            variants = [variant(spec, base) for spec in args.variant]
+        except ValueError as e:
+            parser.error(str(e))
+        names = [args.variant_output.format(index = i, name = re.sub(r'[^\w.=+-]+', '_', spec.strip())) for i, spec in enumerate(args.variant)]
+        outs = [open(name, 'w', buffering=OUTPUT_BUFFER_SIZE) for name in names]
+        output = variant_outputs(outs, variants)
+        outputs = output.outputs
+    else:
+        out = open(sys.stdout.fileno(), 'w', buffering=OUTPUT_BUFFER_SIZE, encoding=sys.stdout.encoding, errors=sys.stdout.errors, closefd=False)
+        output = ordered_output(out, args.jobs, args.chunk_size)
+        outputs = [output]
+    if saved:
+        output.restore(saved['output'])
+    layers = cached_layers(args.layer_cache, output) if args.layer_cache else None
+    recorder = checkpoints(args.checkpoint, lines, output, args.checkpoint_interval * 1e6) if args.checkpoint else None
+    process(lines, output, saved['state'] if saved else None, recorder, layers)
+    output.close()
+    if args.variant:
+        for out in outs:
+            out.close()
 
-    if not consumed:
-        print(line, end='')
+    print(f'\rDone.         ', file=sys.stderr, flush=True)
+    counters = output.counters if not args.variant else sum((o.counters for o in outputs), Counter())
+    if counters['cache_hits'] + counters['cache_misses'] > 0:
+        print(f"Profile cache: {counters['cache_hits']} hits, {counters['cache_misses']} misses", file=sys.stderr, flush=True)
+    if output.chains is not None and output.chains.chains['chains'] > 0:
+        print(f"Chains: smoothed {output.chains.chains['moves']} moves into {output.chains.chains['chains']} paths", file=sys.stderr, flush=True)
+    if recorder is not None:
+        if recorder.count == 0:
+            print('Warning: no checkpoint was recorded, the input processed was shorter than --checkpoint-interval', file=sys.stderr, flush=True)
+        elif recorder.late > 0:
+            print(f'Checkpoints: {recorder.late} of {recorder.count} were taken after a move, where the moves stop', file=sys.stderr, flush=True)
+    if layers is not None:
+        print(f'Layer cache: reused {layers.hits} of {layers.hits + layers.misses} layers', file=sys.stderr, flush=True)
+    for i, o in enumerate(outputs):
+        prefix = f'{names[i]} ({args.variant[i]}): ' if args.variant else ''
+        if o.counters['throttle_speed'] + o.counters['throttle_accel'] + o.counters['throttle_jerk'] > 0:
+            print(f"{prefix}Axis limits: throttled speed {o.counters['throttle_speed']}, accel {o.counters['throttle_accel']}, jerk {o.counters['throttle_jerk']} times", file=sys.stderr, flush=True)
+        if o.junctions is not None and o.junctions.junctions > 0:
+            print(f'{prefix}Junctions: {o.junctions.joined} of {o.junctions.junctions} passed at speed, adjusted moves take {o.move_time:.1f} s', file=sys.stderr, flush=True)
+        if o.capacity is not None and o.capacity.summary():
+            print(f'{prefix}Planner capacity: {o.capacity.summary()}', file=sys.stderr, flush=True)
 
-if current_state.modifying:    
-    restore_acceleration_control()
+    if stats.enabled:
+        report = stats.report({'wall_seconds': time.perf_counter() - start, 'jobs': args.jobs, **counters})
+        if args.stats == '-':
+            print(stats.format_report(report), file=sys.stderr, flush=True)
+        else:
+            stats.write_report(report, args.stats)
 
-print(f'\rDone.         ', file=sys.stderr, flush=True)
+if __name__ == '__main__':
+    main()
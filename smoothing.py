@@ -0,0 +1,283 @@
+import numpy as np
+from math import inf, sqrt, radians, cos
+from collections import Counter
+import spline
+import polynomial as poly
+import move
+
+# cubic pieces through the points (x, y) with second derivatives m at the points, extended linearly beyond them
+def _cubic_pieces(x, y, m):
+    h = np.diff(x)
+    # pieces in the local variable w = x - x[i], then expanded around 0
+    q0 = y[:-1]
+    q1 = np.diff(y) / h - h * (2*m[:-1] + m[1:]) / 6
+    q2 = m[:-1] / 2
+    q3 = np.diff(m) / (6*h)
+    s = x[:-1]
+    coeffs = np.zeros((len(x) + 1, 4))
+    coeffs[1:-1] = np.stack((q0 - q1*s + q2*s**2 - q3*s**3, q1 - 2*q2*s + 3*q3*s**2, q2 - 3*q3*s, q3), axis=1)
+    end_slope = q1[-1] + 2*q2[-1]*h[-1] + 3*q3[-1]*h[-1]**2
+    coeffs[0,:2] = (y[0] - q1[0]*x[0], q1[0])
+    coeffs[-1,:2] = (y[-1] - end_slope*x[-1], end_slope)
+
+    ret = spline.curve()
+    ret.knots = x
+    ret.coeffs = coeffs
+    return ret
+
+# second derivatives at the knots x of the natural cubic spline through the values, as a linear map (len(x), len(x))
+def _natural_second_derivatives(x):
+    n = len(x) - 1
+    h = np.diff(x)
+    g = np.zeros((n + 1, n + 1))
+    if n > 1:
+        a = np.zeros((n - 1, n - 1))
+        i = np.arange(n - 1)
+        a[i, i] = 2 * (h[:-1] + h[1:])
+        a[i[1:], i[:-1]] = h[1:-1]
+        a[i[:-1], i[1:]] = h[1:-1]
+        d = np.zeros((n - 1, n + 1))
+        d[i, i] = 6 / h[:-1]
+        d[i, i + 1] = -6 / h[:-1] - 6 / h[1:]
+        d[i, i + 2] = 6 / h[1:]
+        g[1:-1] = np.linalg.solve(a, d)
+    return g
+
+# cubic spline through the points (x, y) with zero second derivative at both ends, extended linearly beyond them
+def natural_spline(x, y):
+    return _cubic_pieces(x, y, _natural_second_derivatives(x) @ y)
+
+# least squares natural cubic spline values at the knots x, fitting the points (u, y) with u in [x[0], x[-1]]. The
+# values at both ends are pinned to y[0] and y[-1] (the first and last points must be at the ends).
+def _fit_knot_values(x, u, y):
+    n = len(x) - 1
+    h = np.diff(x)
+    g = _natural_second_derivatives(x)
+
+    # the spline at u as a linear map of the knot values
+    k = np.clip(np.searchsorted(x, u, side='right') - 1, 0, n - 1)
+    t = (u - x[k]) / h[k]
+    rows = np.arange(len(u))
+    basis = np.zeros((len(u), n + 1))
+    basis[rows, k] = 1 - t
+    basis[rows, k + 1] += t
+    basis += (h[k]**2 / 6 * ((1 - t)**3 - (1 - t)))[:,np.newaxis] * g[k] + (h[k]**2 / 6 * (t**3 - t))[:,np.newaxis] * g[k + 1]
+
+    values = np.zeros((n + 1,) + y.shape[1:])
+    values[0], values[-1] = y[0], y[-1]
+    if n > 1:
+        rhs = y - np.multiply.outer(basis[:,0], y[0]) - np.multiply.outer(basis[:,-1], y[-1])
+        values[1:-1] = np.linalg.lstsq(basis[:,1:-1], rhs, rcond=None)[0]
+    return values
+
+# one continuous path through (close to) the vertices (n+1, axes) of a chain of moves, parametrized by the chord
+# length u. x, y and z follow a natural cubic spline with knots at vertices about knot_spacing apart, fit by least
+# squares (which also smooths out the rounding of the coordinates in the G-code), e is interpolated linearly between
+# the knots so that it never runs backwards. Both ends are at the first and last vertex exactly. The path is
+# centered around zero extrusion, add e_offset for the absolute E position.
+class chain_fit:
+    def __init__(self, vertices, knot_spacing):
+        vertices = np.array(vertices, dtype=np.float64)
+        self.e_offset = vertices[0,3]
+        vertices[:,3] -= self.e_offset
+        self.vertices = vertices
+        self.u = np.concatenate(([0], np.cumsum(np.linalg.norm(np.diff(vertices[:,:3], axis=0), axis=1))))
+        self.length = self.u[-1]
+
+        # knots at the first vertex at least knot_spacing past the previous knot, and at the end
+        knots = [0]
+        while True:
+            i = int(np.searchsorted(self.u, self.u[knots[-1]] + knot_spacing))
+            if i >= len(self.u) - 1:
+                break
+            knots.append(i)
+        if len(knots) > 1 and self.length - self.u[knots[-1]] < knot_spacing / 2:
+            knots.pop() # don't end on a short piece
+        knots.append(len(self.u) - 1)
+        self.knot_vertices = np.array(knots)
+
+        x = self.u[self.knot_vertices]
+        values = _fit_knot_values(x, self.u, vertices[:,:3])
+        self.curves = [natural_spline(x, values[:,i]) for i in range(3)] + [spline.curve(x, vertices[self.knot_vertices,3])]
+        self._max_curvature = self._directions = self._max_direction = self._derivatives = None
+
+    # largest deviation of any axis from the original moves, for each move
+    def deviation(self):
+        a, b = self.u[:-1], self.u[1:]
+        pieces = np.searchsorted(self.curves[0].knots, a, side='right')
+        worst = np.zeros(len(a))
+        for i in range(3):
+            c = self.curves[i].coeffs[pieces].copy()
+            slope = np.diff(self.vertices[:,i]) / (b - a)
+            c[:,0] -= self.vertices[:-1,i] - slope * a
+            c[:,1] -= slope
+            low, high = poly.minmax_batch(c, a, b)
+            worst = np.maximum(worst, np.maximum(-low, high))
+        # e is linear between the knots, so it deviates the most at the vertices
+        e = np.abs(self.curves[3].evaluate(self.u) - self.vertices[:,3])
+        return np.maximum(worst, np.maximum(e[:-1], e[1:]))
+
+    # the results below only depend on the fit, and are kept for the outputs sharing it (see process.py --variant)
+
+    # largest curvature along the path (|d²p/du²|, u is close to the arc length for low angle chains)
+    def max_curvature(self):
+        if self._max_curvature is None:
+            second = np.array([ddc.evaluate(c.knots) for c, dc, ddc in self.derivatives()[:3]])
+            self._max_curvature = np.max(np.linalg.norm(second, axis=0))
+        return self._max_curvature
+
+    # direction (dp/du over all axes) at the start and at the end of the path
+    def directions(self):
+        if self._directions is None:
+            ends = [(1, self.u[0]), (-2, self.u[-1])]
+            self._directions = [np.array([poly.eval(dc.coeffs[i], u) for c, dc, ddc in self.derivatives()]) for i, u in ends]
+        return self._directions
+
+    # largest |dp/du| of every axis
+    def max_direction(self):
+        if self._max_direction is None:
+            ret = []
+            for c in self.curves:
+                derivative = poly.differentiate_batch(c.coeffs[1:-1])
+                low, high = poly.minmax_batch(derivative, c.knots[:-1], c.knots[1:])
+                ret.append(max(-low.min(), high.max()))
+            self._max_direction = np.array(ret)
+        return self._max_direction
+
+    # (p, dp/du, d²p/du²) of every axis
+    def derivatives(self):
+        if self._derivatives is None:
+            self._derivatives = [(c, c.differentiate(), c.differentiate().differentiate()) for c in self.curves]
+        return self._derivatives
+
+# fit a chain of moves within tolerance, refining the knot spacing down to one knot per vertex. Returns the fit and
+# its deviation from each move.
+def fit_chain(vertices, tolerance, knot_spacing):
+    while True:
+        fit = chain_fit(vertices, knot_spacing)
+        deviation = fit.deviation()
+        if deviation.max() <= tolerance or len(fit.knot_vertices) == len(vertices):
+            return fit, deviation
+        knot_spacing /= 2
+
+# max speed, acceleration and jerk along a chain. The centripetal acceleration is kept within the acceleration
+# budget, and axis limits are checked (conservatively) with the largest direction cosine of every axis.
+def chain_limits(fit, max_speed, max_accel, max_jerk, dynamic_model, axis_limits, profile_distance = None, events = move.throttle_events):
+    curvature = fit.max_curvature()
+    if curvature > 0:
+        max_speed = min(max_speed, sqrt(max_accel / curvature))
+    if axis_limits:
+        max_speed, max_accel, max_jerk = move.throttle(fit.length, fit.max_direction() * fit.length, max_speed, max_accel, max_jerk, dynamic_model, axis_limits, profile_distance, events)
+    return max_speed, max_accel, max_jerk
+
+# spring-damper-corrected spline curves for each axis along a chain, see move.generate_move. The axis positions
+# p(t) = path(s(t)) are of high degree, which doesn't hold up in the (absolute time) coefficients of spline.curve,
+# so they are approximated by cubic pieces that match p and its acceleration exactly at the knots. The knots are
+# refined until the correction c * v + d * a (see move._velocity_gains) is within a quarter of the tolerances.
+# Throttling is counted in events.
+def generate_chain(fit, max_speed, max_accel, max_jerk, dynamic_model, axis_limits, tolerances, start_speed = 0, end_speed = 0, max_step = 0.05, max_refinements = 20, events = move.throttle_events):
+    max_speed, max_accel, max_jerk = chain_limits(fit, max_speed, max_accel, max_jerk, dynamic_model, axis_limits, inf if start_speed or end_speed else None, events)
+
+    arc_acceleration, arc_speed, arc_position = move._arc_profile(fit.length, start_speed, end_speed, max_speed, max_accel, max_jerk)
+    paths = fit.derivatives()
+    gains = np.array([move._velocity_gains(model) for model in dynamic_model]) # chain_detector leaves out the asymmetric model
+    tolerances = np.array(tolerances)[:,np.newaxis] / 4
+
+    # position, speed and acceleration of every axis at the times t, (axes, 3, len(t))
+    def exact(t):
+        s, v, a = arc_position.evaluate(t), arc_speed.evaluate(t), arc_acceleration.evaluate(t)
+        ret = []
+        for f, df, ddf in paths:
+            slope = df.evaluate(s)
+            ret.append((f.evaluate(s), slope * v, ddf.evaluate(s) * v**2 + slope * a))
+        return np.array(ret)
+
+    # start from the profile's knots, at most max_step apart
+    knots = arc_acceleration.knots
+    steps = np.maximum(1, np.ceil(np.diff(knots) / max_step)).astype(int)
+    knots = np.concatenate([np.linspace(knots[i], knots[i+1], steps[i], endpoint=False) for i in range(len(steps))] + [knots[-1:]])
+
+    for i in range(max_refinements):
+        values = exact(knots)
+        positions = [_cubic_pieces(knots, values[j,0], values[j,2]) for j in range(len(paths))]
+
+        # compare the corrections at points inside every interval
+        probes = knots[:-1,np.newaxis] + np.diff(knots)[:,np.newaxis] * [0.25, 0.5, 0.75]
+        expected = exact(probes.reshape(-1))
+        error = np.zeros(expected.shape[::2])
+        for j in range(len(positions)):
+            speed = positions[j].differentiate()
+            error[j] = (np.abs(positions[j].evaluate(probes.reshape(-1)) - expected[j,0]) +
+                        np.abs(speed.evaluate(probes.reshape(-1)) - expected[j,1]) * gains[j,0] +
+                        np.abs(speed.differentiate().evaluate(probes.reshape(-1)) - expected[j,2]) * gains[j,1])
+        bad = (error > tolerances).reshape(len(positions), -1, 3).any(axis=(0, 2))
+        if not bad.any():
+            break
+        knots = np.sort(np.concatenate((knots, 0.5 * (knots[:-1][bad] + knots[1:][bad]))))
+
+    for j in range(len(positions)):
+        speed = positions[j].differentiate()
+        c, d = gains[j]
+        if c > 0:
+            positions[j] = positions[j] + speed * c
+        if d > 0:
+            positions[j] = positions[j] + speed.differentiate() * d
+    return positions
+
+# collects runs of short, low angle moves that can be smoothed as one chain
+class chain_detector:
+    def __init__(self, chain_parameters, dynamic_model):
+        self.parameters = chain_parameters
+        self.dynamic_model = dynamic_model
+        self.min_cos = cos(radians(chain_parameters.max_angle))
+        self.moves = []  # (source, destination, target_speed, e_relative, fallback) of the current run
+        self.chains = Counter() # number of chains and the moves in them
+
+    # can the move be part of a chain at all
+    def _candidate(self, source, destination):
+        delta = np.array(destination) - np.array(source)
+        length = np.linalg.norm(delta[:3])
+        if length == 0 or length > self.parameters.max_segment_length:
+            return False
+        # the asymmetric model's axis limits are only checked on single moves
+        return all(delta[i] == 0 or move._velocity_gains(self.dynamic_model[i]) is not None for i in range(len(delta)))
+
+    def _continues(self, move_):
+        source, destination, target_speed, e_relative, _ = move_
+        last_source, last_destination, last_speed, last_e_relative, _ = self.moves[-1]
+        if target_speed != last_speed or e_relative != last_e_relative or len(self.moves) >= self.parameters.max_moves:
+            return False
+        a = np.array(last_destination) - np.array(last_source)
+        b = np.array(destination) - np.array(source)
+        if (a[3] > 0) != (b[3] > 0):
+            return False # extruding and non extruding moves
+        return np.dot(a[:3], b[:3]) >= self.min_cos * np.linalg.norm(a[:3]) * np.linalg.norm(b[:3])
+
+    # add a move, returns the runs that are complete as (moves, chain_fit), the fit is None for single moves
+    def add(self, source, destination, target_speed, e_relative, fallback):
+        move_ = (source, destination, target_speed, e_relative, fallback)
+        if not self._candidate(source, destination):
+            return self.finish() + [([move_], None)]
+        if self.moves and not self._continues(move_):
+            ret = self.finish()
+            self.moves = [move_]
+            return ret
+        self.moves.append(move_)
+        return []
+
+    # end the current run, returns it split into chains that can be smoothed within tolerance and single moves, see add
+    def finish(self):
+        moves, self.moves = self.moves, []
+        return self._split(moves)
+
+    def _split(self, moves):
+        if len(moves) < max(2, self.parameters.min_moves):
+            return [([m], None) for m in moves]
+        fit, deviation = fit_chain([m[0] for m in moves] + [moves[-1][1]], self.parameters.tolerance, self.parameters.knot_spacing)
+        worst = int(np.argmax(deviation))
+        if deviation[worst] > self.parameters.tolerance:
+            # leave the worst move as a single move, and try the rest
+            return self._split(moves[:worst]) + [([moves[worst]], None)] + self._split(moves[worst+1:])
+        self.chains['chains'] += 1
+        self.chains['moves'] += len(moves)
+        return [(moves, fit)]
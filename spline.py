@@ -1,52 +1,111 @@
 import numpy as np
-import copy
 import polynomial as poly
-from math import inf, isinf
+from math import inf, nan, isinf, isnan
+
+# pack a list of (possibly ragged) coefficient lists into a zero-padded (n, width) matrix
+def _pack(polys):
+    if isinstance(polys, np.ndarray) and polys.ndim == 2:
+        return np.array(polys, dtype=np.float64)
+    polys = [poly._to_poly(p) for p in polys]
+    width = max([len(p) for p in polys], default=1)
+    out = np.zeros((len(polys), width))
+    for i in range(len(polys)):
+        out[i, :len(polys[i])] = polys[i]
+    return out
+
+# zero-pad a coefficient matrix to the given number of columns
+def _pad(coeffs, width):
+    if coeffs.shape[1] >= width:
+        return coeffs
+    out = np.zeros((len(coeffs), width))
+    out[:,:coeffs.shape[1]] = coeffs
+    return out
+
+# evaluate each row of a coefficient matrix at the corresponding x (Horner)
+def _eval_rows(coeffs, x):
+    y = np.zeros(len(coeffs))
+    for j in range(coeffs.shape[1]-1, -1, -1):
+        y = x * y + coeffs[:,j]
+    return y
+
+# are two knot vectors the same, e.g. the one array shared by the curves of a move
+def _same_knots(a, b):
+    return a is b or (len(a) == len(b) and np.array_equal(a, b))
 
 # simple spline curve made up of piecewise polynomials
 class curve:
     # n knots
-    # n+1 polys
-    
+    # n+1 polys, stored as the rows of an (n+1, max_degree+1) coefficient matrix
+
     # initialize linear interpolation
     def __init__(self, x = None, y = None):
         if x is None:
             self.knots = []
-            self.polys = [[0]]
+            self.coeffs = np.zeros((1,1))
             return
-            
+
         if y is None:
-            self.knots = copy.deepcopy(x.knots)
-            self.polys = copy.deepcopy(x.polys)
+            self.knots = x.knots.copy()
+            self.coeffs = x.coeffs.copy()
             return
-            
+
         assert len(x) == len(y)
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
         self.knots = x
-        self.polys = [None] * (len(x)+1)
-        self.polys[0] = [y[0]]
-        for i in range(len(x)-1):
-            if x[i+1] > x[i]:
-                k = (y[i+1]-y[i]) / (x[i+1]-x[i])
-                b = y[i] - x[i] * k
-                self.polys[i+1] = [b,k]
-            else:
-                self.polys[i+1] = [y[i]]
-        self.polys[len(x)] = [y[-1]]
-    
-    def poly_index(self, x):        
+        self.coeffs = np.zeros((len(x)+1, 2))
+        self.coeffs[0,0] = y[0]
+        dx = x[1:] - x[:-1]
+        rising = dx > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            k = np.where(rising, (y[1:] - y[:-1]) / dx, 0)
+        self.coeffs[1:-1,0] = np.where(rising, y[:-1] - x[:-1] * k, y[:-1])
+        self.coeffs[1:-1,1] = k
+        self.coeffs[-1,0] = y[-1]
+
+    @property
+    def knots(self):
+        return self._knots
+
+    @knots.setter
+    def knots(self, knots):
+        self._knots = np.array(knots, dtype=np.float64).reshape(-1)
+
+    # the pieces as rows of the coefficient matrix (lowest order first)
+    @property
+    def polys(self):
+        return self.coeffs
+
+    @polys.setter
+    def polys(self, polys):
+        self.coeffs = _pack(polys)
+
+    def _with(self, knots, coeffs):
+        ret = curve()
+        ret._knots = knots
+        ret.coeffs = coeffs
+        return ret
+
+    def poly_index(self, x):
         assert len(self.knots) == len(self.polys) - 1
 
-        for i in range(len(self.knots)):
-            if self.knots[i] > x:
-                return i
-        return len(self.polys)-1
+        return int(np.searchsorted(self.knots, x, side='right'))
 
     # todo, change to __call__
     def __getitem__(self, x):
         ix = self.poly_index(x)
-        return poly.eval(self.polys[ix], x)
-    
-    def __repr__(self):        
+        return poly.eval(self.coeffs[ix], x)
+
+    # evaluate the spline at an array of points
+    def evaluate(self, ts):
+        ts = np.asarray(ts, dtype=np.float64)
+        coeffs = self.coeffs[np.searchsorted(self.knots, ts, side='right')]
+        y = np.zeros(ts.shape)
+        for j in range(coeffs.shape[-1]-1, -1, -1):
+            y = ts * y + coeffs[...,j]
+        return y
+
+    def __repr__(self):
         ret = f"Spline:\n"
         for i in range(len(self.polys)):
             if i < len(self.knots):
@@ -55,71 +114,57 @@ class curve:
                 ret += "    else    \t"
             ret += f"{poly.to_string(self.polys[i])}\n"
         return ret
-    
+
     def differentiate(self):
-        ret = copy.deepcopy(self)
-        for i in range(len(self.polys)):
-            ret.polys[i] = poly.differentiate(self.polys[i])
-        return ret
-        
+        width = self.coeffs.shape[1]
+        if width == 1:
+            return self._with(self.knots.copy(), np.zeros((len(self.coeffs), 1)))
+        return self._with(self.knots.copy(), self.coeffs[:,1:] * np.arange(1, width))
+
     def integrate(self):
-        ret = copy.deepcopy(self)
+        width = self.coeffs.shape[1]
+        coeffs = np.zeros((len(self.coeffs), width+1))
+        coeffs[:,1:] = self.coeffs / np.arange(1, width+1)
 
-        for i in range(len(self.polys)):
-            ret.polys[i] = poly.integrate(self.polys[i])
-            # solve for constant term
-            
-            if i > 0:
-                ret.polys[i][0] = poly.eval(ret.polys[i-1], ret.knots[i-1]) - poly.eval(ret.polys[i], ret.knots[i-1])
+        # solve for the constant terms that make the result continuous across the knots
+        if len(self.knots):
+            jumps = _eval_rows(coeffs[:-1], self.knots) - _eval_rows(coeffs[1:], self.knots)
+            coeffs[1:,0] = np.cumsum(jumps)
+
+        return self._with(self.knots.copy(), coeffs)
 
-        return ret
-    
     def shift(self, x0):
         """return a new spline q, such that q(x) = p(x + x0)"""
-        ret = copy.deepcopy(self)
-        
         if x0 == 0:
-            return ret
-        
-        for i in range(len(ret.knots)):
-            ret.knots[i] -= x0
-        for i in range(len(ret.polys)):
-            ret.polys[i] = poly.shift(ret.polys[i], x0)
-            
-        return ret
-            
+            return curve(self)
+
+        return self._with(self.knots - x0, poly.shift_batch(self.coeffs, x0))
+
     def __mul__(self, factor):
-        ret = copy.deepcopy(self)
-        for i in range(len(ret.polys)):
-            for j in range(len(ret.polys[i])):
-                ret.polys[i][j] *= factor
-        return ret
-        
-    def __add__(self, other):
-        ret = copy.deepcopy(self)
+        return self._with(self.knots.copy(), self.coeffs * factor)
 
+    def __add__(self, other):
         if isinstance(other, curve):
-            if not np.array_equal(self.knots, other.knots):
-                ret.insert_knots(other.knots)
-
-            if not np.array_equal(self.knots, other.knots):
-                other = copy.deepcopy(other)
-                other.insert_knots(ret.knots)
+            a, b = self, other
+            if _same_knots(a.knots, b.knots):
+                knots, a_coeffs, b_coeffs = a.knots, a.coeffs, b.coeffs
+            else:
+                knots = np.union1d(a.knots, b.knots)
+                a_coeffs, b_coeffs = a.coeffs[a._pieces(knots)], b.coeffs[b._pieces(knots)]
 
-            assert np.array_equal(ret.knots, other.knots)            
+            width = max(a_coeffs.shape[1], b_coeffs.shape[1])
+            return self._with(knots.copy(), _pad(a_coeffs, width) + _pad(b_coeffs, width))
 
-            for i in range(len(ret.polys)):
-                ret.polys[i] = poly.add(ret.polys[i], other.polys[i])
-            
-        elif type(other) == int or type(other) == float:
-            for i in range(len(ret.polys)):
-                ret.polys[i] = poly.add(ret.polys[i], other)
+        elif isinstance(other, (int, float)):
+            coeffs = self.coeffs.copy()
+            coeffs[:,0] += other
+            return self._with(self.knots.copy(), coeffs)
 
-        return ret
+        return curve(self)
 
     def range_min(self):
         return self.knots[0]
-        
+
     def range_max(self):
         return self.knots[-1]
 
@@ -129,53 +174,50 @@ class curve:
         a = self.knots[i-1] if i > 0 else -inf
         b = self.knots[i] if i < len(self.knots) else +inf
         return a,b
-    
-    def minmax(self):
-        y_min, y_max = inf, -inf
-        for i in range(len(self.knots)-1):
-            a = self.knots[i]
-            b = self.knots[i+1]
-            m = poly.minmax(self.polys[i+1], a, b)
-            y_min = min(y_min, m[0])
-            y_max = max(y_max, m[1])
-        return y_min, y_max
-
-    def insert_knots(self, knots):
-        assert all(knots[i] < knots[i+1] for i in range(len(knots)-1))
-
-        new_knots = []
-        new_polys = [self.polys[0]]
 
-        i,j = 0,0
-        while i < len(self.knots) and j < len(knots):
-            if self.knots[i] <= knots[j]:
-                new_knots.append(self.knots[i])
-                new_polys.append(self.polys[i+1])                
-                if self.knots[i] == knots[j]:
-                    j += 1 # skip this knot
-                i += 1
-                continue
-            # knots[j] is a new knot
-            new_knots.append(knots[j])
-            new_polys.append(new_polys[-1])
-            j += 1
+    def minmax(self):
+        if len(self.knots) < 2:
+            return inf, -inf
+        y_min, y_max = poly.minmax_batch(self.coeffs[1:-1], self.knots[:-1], self.knots[1:])
+        return y_min.min(), y_max.max()
 
-        while j < len(knots):
-            new_knots.append(knots[j])
-            new_polys.append(new_polys[-1])
-            j += 1
+    # indices of the pieces that the intervals of the (sorted) knots, a superset of the curve's knots, fall in
+    def _pieces(self, knots):
+        return np.concatenate(([0], np.searchsorted(self.knots, knots, side='right')))
 
-        while i < len(self.knots):
-            new_knots.append(self.knots[i])
-            new_polys.append(self.polys[i+1])
-            i += 1
+    def insert_knots(self, knots):
+        knots = np.asarray(knots, dtype=np.float64)
+        assert np.all(knots[:-1] < knots[1:])
+
+        # the knots that aren't there yet, inserted knots continue the piece they fall in
+        at = np.searchsorted(self.knots, knots)
+        present = self.knots[np.minimum(at, len(self.knots) - 1)] == knots if len(self.knots) else np.zeros(len(knots), dtype=bool)
+        new = knots[~present]
+        if len(new) == 0:
+            return
+        if len(new) + len(self.knots) == len(knots):
+            # knots has all the knots of the curve (e.g. the union in harmonize_knots)
+            self.coeffs = self.coeffs[self._pieces(knots)]
+            self.knots = knots
+            return
 
+        # positions of the new knots in the merged ones, and the pieces they continue
+        at = np.searchsorted(self.knots, new, side='right')
+        inserted = at + np.arange(len(new))
+        kept = np.ones(len(self.knots) + len(new), dtype=bool)
+        kept[inserted] = False
+        knots = np.empty(len(kept))
+        knots[inserted] = new
+        knots[kept] = self.knots
+        pieces = np.empty(len(kept) + 1, dtype=int)
+        pieces[0] = 0
+        pieces[1:][inserted] = at
+        pieces[1:][kept] = np.arange(1, len(self.knots) + 1)
 
-        self.knots = new_knots
-        self.polys = new_polys
+        self.knots = knots
+        self.coeffs = self.coeffs[pieces]
 
 
-    
 # combines two non-overlapping splines
 def combine(spline1, spline2):
     if len(spline1.knots) == 0:
@@ -190,10 +232,12 @@ def combine(spline1, spline2):
     ret = curve()
     if spline1.knots[-1] == spline2.knots[0]:
         ret.knots = np.concatenate((spline1.knots, spline2.knots[1:]), axis=0)
-        ret.polys = np.concatenate((spline1.polys[:-1], spline2.polys[1:]), axis=0)
+        polys = (spline1.coeffs[:-1], spline2.coeffs[1:])
     else:
         ret.knots = np.concatenate((spline1.knots, spline2.knots), axis=0)
-        ret.polys = np.concatenate((spline1.polys, spline2.polys[1:]), axis=0)
+        polys = (spline1.coeffs, spline2.coeffs[1:])
+    width = max(p.shape[1] for p in polys)
+    ret.coeffs = np.concatenate([_pad(p, width) for p in polys], axis=0)
     
     assert all(ret.knots[i] <= ret.knots[i+1] for i in range(len(ret.knots)-1))
         
@@ -207,22 +251,23 @@ def kinked_line(k_neg, k_pos):
 
 # create a new spline f(g(t))
 def composite(f, g):
-    ret = curve()
-    ret.polys = []
+    knots = []
+    polys = []
 
-    # identify all new knots
-    for j in range(len(g.polys)):
-        
-        additional_knots = []
-        # find the points where g transitions across a knot in f
-        for i in range(len(f.knots)):            
-            additional_knots.extend(poly.find_roots(poly.add(g.polys[j], -f.knots[i]), *g.range(j)))
+    # find the points where each piece of g transitions across a knot in f, all at once
+    n = len(g.coeffs)
+    crossings = np.repeat(g.coeffs, len(f.knots), axis=0)
+    crossings[:,0] -= np.tile(f.knots, n)
+    bounds = np.concatenate(([-inf], g.knots, [inf]))
+    roots = poly.find_roots_batch(crossings, np.repeat(bounds[:-1], len(f.knots)), np.repeat(bounds[1:], len(f.knots)))
+    roots = np.sort(roots.reshape(n, len(f.knots) * roots.shape[1]), axis=1).tolist()
 
-        if additional_knots:
-            additional_knots = list(dict.fromkeys(sorted(additional_knots)))
+    # identify all new knots
+    for j in range(n):
+        additional_knots = list(dict.fromkeys(x for x in roots[j] if not isnan(x)))
         additional_knots.append(g.range(j)[1])
 
-        knot_left = ret.knots[-1] if ret.knots else additional_knots[0] - 1
+        knot_left = knots[-1] if knots else additional_knots[0] - 1
         for knot_right in additional_knots:
             if isinf(knot_right):
                 knot_right = knot_left + 1
@@ -230,26 +275,58 @@ def composite(f, g):
             mid_point = 0.5 * (knot_left + knot_right)
             y = g[mid_point]
             i = f.poly_index(y)
-            ret.knots.append(knot_right)
-            ret.polys.append(poly.composite(f.polys[i], g.polys[j]))
+            knots.append(knot_right)
+            polys.append(poly.composite(f.polys[i], g.polys[j]))
 
             knot_left = knot_right
 
-    ret.knots.pop() # remove the bogus +inf knot at the end
+    knots.pop() # remove the bogus +inf knot at the end
+
+    ret = curve()
+    ret.knots = knots
+    ret.polys = polys
+    return ret
+
+# composite(kinked_line(k_neg, k_pos), g) for a batch of curves gs (and gains, scalars or one per curve), without
+# composing polynomials: the pieces of each g are split at its roots and scaled by the gain for their sign
+def kinked_composite(gs, k_neg, k_pos):
+    k_neg = np.broadcast_to(np.asarray(k_neg, dtype=np.float64), (len(gs),))
+    k_pos = np.broadcast_to(np.asarray(k_pos, dtype=np.float64), (len(gs),))
+    width = max(g.coeffs.shape[1] for g in gs)
+    coeffs = np.concatenate([_pad(g.coeffs, width) for g in gs])
+    owner = np.repeat(np.arange(len(gs)), [len(g.coeffs) for g in gs])
+    upper = np.concatenate([np.append(g.knots, inf) for g in gs])
+    lower = np.concatenate([np.insert(g.knots, 0, -inf) for g in gs])
+
+    # the knots of every piece: its roots (without repeats) followed by its upper bound
+    roots = np.sort(poly.find_roots_batch(coeffs, lower, upper), axis=1)
+    roots[:,1:][roots[:,1:] == roots[:,:-1]] = nan
+    candidates = np.hstack((roots, upper[:,np.newaxis]))
+    pieces = np.repeat(np.arange(len(coeffs)), candidates.shape[1])
+    knots = candidates.reshape(-1)
+    pieces, knots = pieces[~np.isnan(knots)], knots[~np.isnan(knots)]
+
+    # the sign of the piece in the middle of every new piece, the first and the last one are open ended
+    first = np.r_[True, owner[pieces[1:]] != owner[pieces[:-1]]]
+    left = np.where(first, knots - 1, np.r_[nan, knots[:-1]])
+    right = np.where(np.isinf(knots), left + 1, knots)
+    y = _eval_rows(coeffs[pieces], 0.5 * (left + right))
+    gain = np.where(y < 0, k_neg[owner[pieces]], k_pos[owner[pieces]])
+    scaled = coeffs[pieces] * gain[:,np.newaxis]
+
+    ret = []
+    for i, g in enumerate(gs):
+        mine = np.flatnonzero(owner[pieces] == i)
+        ret.append(g._with(knots[mine[:-1]], scaled[mine]))
     return ret
 
 def harmonize_knots(splines):
-    if all([np.array_equal(splines[i].knots, splines[i+1].knots) for i in range(len(splines)-1)]):
+    if all(_same_knots(s.knots, splines[0].knots) for s in splines[1:]):
         return
-        
-    knots = set()
-    for s in splines:
-        knots.update(s.knots)
-
-    knots = list(knots)
-    knots.sort()
 
+    knots = np.unique(np.concatenate([s.knots for s in splines]))
     for s in splines:
-        s.insert_knots(knots)
+        if not _same_knots(s.knots, knots):
+            s.insert_knots(knots)
 
 
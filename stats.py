@@ -0,0 +1,101 @@
+# optional instrumentation: per-stage timers and hot-path counters. Everything is a no-op unless enabled is set,
+# and hot functions can be wrapped with timed(), which returns the function itself when disabled.
+
+import json
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+enabled = False
+
+totals = Counter() # counts, value sums and accumulated seconds
+maxima = {}        # largest recorded value of each record()
+
+_NO_STAGE = nullcontext()
+
+class _stage:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args):
+        totals['time.' + self.name] += time.perf_counter() - self.start
+        totals['calls.' + self.name] += 1
+
+# context manager timing a stage
+def stage(name):
+    return _stage(name) if enabled else _NO_STAGE
+
+# fn, timed as a stage when enabled
+def timed(name, fn):
+    if not enabled:
+        return fn
+    def wrapper(*args, **kwargs):
+        with _stage(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+def count(name, n = 1):
+    if enabled:
+        totals['count.' + name] += n
+
+# record a value, keeping its count, sum and maximum
+def record(name, value):
+    if enabled:
+        totals['record.' + name + '.count'] += 1
+        totals['record.' + name + '.sum'] += value
+        maxima[name] = max(maxima.get(name, value), value)
+
+def snapshot():
+    return Counter(totals), dict(maxima)
+
+# add the totals and maxima of another process
+def merge(other_totals, other_maxima):
+    totals.update(other_totals)
+    for name, value in other_maxima.items():
+        maxima[name] = max(maxima.get(name, value), value)
+
+def report(extra = None):
+    stages = {}
+    counts = {}
+    records = {}
+    for key, value in totals.items():
+        kind, name = key.split('.', 1)
+        if kind == 'time':
+            stages.setdefault(name, {})['seconds'] = value
+        elif kind == 'calls':
+            stages.setdefault(name, {})['calls'] = value
+        elif kind == 'count':
+            counts[name] = value
+        elif kind == 'record':
+            name, field = name.rsplit('.', 1)
+            records.setdefault(name, {})[field] = value
+    for name, r in records.items():
+        r['mean'] = r['sum'] / r['count'] if r.get('count') else 0
+        r['max'] = maxima.get(name)
+    ret = {'stages': stages, 'counts': counts, 'records': records}
+    if extra:
+        ret.update(extra)
+    return ret
+
+def format_report(report):
+    lines = ['Stage timings (seconds, summed over worker processes):']
+    for name, s in sorted(report['stages'].items(), key = lambda s: -s[1].get('seconds', 0)):
+        calls = s.get('calls', 0)
+        per_call = s.get('seconds', 0) / calls * 1e6 if calls else 0
+        lines.append(f"  {name:24s} {s.get('seconds', 0):10.3f} s  {calls:10d} calls  {per_call:10.1f} µs/call")
+    lines.append('Counters:')
+    for name, value in sorted(report['counts'].items()):
+        lines.append(f'  {name:24s} {value:10d}')
+    for name, r in sorted(report['records'].items()):
+        lines.append(f"  {name:24s} mean {r['mean']:8.2f}  max {r['max']:8g}  ({r['count']} samples)")
+    for key, value in report.items():
+        if key not in ('stages', 'counts', 'records'):
+            lines.append(f'  {key:24s} {value}')
+    return '\n'.join(lines)
+
+def write_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent = 2)
@@ -0,0 +1,41 @@
+import process
+import io
+import pytest
+from math import cos, sin, radians
+
+# G-code for the tests that run process.process: layers at z = 0.2, 0.4, ... of a circle of short segments (a chain)
+# and a square of long moves (junctions). If commands, a command ends every quarter of a circle and every circle,
+# otherwise there are only moves after the header.
+def gcode(layers = 4, e_relative = False, commands = True):
+    lines = ['G21\n', 'G90\n', 'M83\n' if e_relative else 'M82\n', 'G92 E0\n']
+    e = 0
+    for layer in range(layers):
+        lines.append(f'G1 Z{0.2 * (layer + 1):.1f} F600\n')
+        for a in range(0, 360, 10):
+            e += 0.05123
+            lines.append(f'G1 X{10 + 5 * cos(radians(a)):.3f} Y{10 + 5 * sin(radians(a)):.3f} E{0.05123 if e_relative else e:.5f} F3000\n')
+            if commands and a % 90 == 80:
+                lines.append('M117 quarter\n')
+        if commands:
+            lines.append(f'M106 S{100 + layer}\n')
+        for x, y in [(20, 10), (20, 20), (10, 20), (10, 10)]:
+            e += 0.5
+            lines.append(f'G1 X{x} Y{y} E{0.5 if e_relative else e:.5f}\n')
+    return lines
+
+# run process.process over the lines into output (by default an ordered_output writing to a string), keyword arguments
+# are passed on to it. Returns the stream written to.
+def run(lines, output = None, **kwargs):
+    if output is None:
+        output = process.ordered_output(io.StringIO())
+    process.process(iter(lines), output, **kwargs)
+    output.close()
+    return output.out
+
+@pytest.fixture(name='gcode')
+def gcode_fixture():
+    return gcode
+
+@pytest.fixture(name='run')
+def run_fixture():
+    return run
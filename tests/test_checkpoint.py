@@ -0,0 +1,51 @@
+import checkpoint
+import process
+import io
+import pytest
+
+def test_line_reader():
+    data = b'G1 X1\r\nG1 X2\n; done'
+    reader = checkpoint.line_reader(io.BytesIO(data))
+    offsets = []
+    lines = []
+    for line in reader:
+        lines.append(line)
+        offsets.append(reader.offset)
+    assert lines == ['G1 X1\n', 'G1 X2\n', '; done']
+    assert offsets == [7, 13, len(data)]
+
+# run process.py over the input file from a checkpoint (or the start), returns the checkpoints saved on the way
+def run_file(run, input, output, path, saved = None):
+    with open(input, 'rb') as i, open(output, 'ab') as o:
+        if saved:
+            checkpoint.rewind(saved, i.fileno(), o.fileno())
+        lines = checkpoint.line_reader(i, offset = saved['input_offset'] if saved else 0)
+        with open(o.fileno(), 'w', closefd = False) as out:
+            output = process.ordered_output(out)
+            if saved:
+                output.restore(saved['output'])
+            checkpoints = process.checkpoints(str(path), lines, output, 500)
+            saves = []
+            save = checkpoints.save
+            def record(*args, **kwargs):
+                save(*args, **kwargs)
+                saves.append(checkpoint.load(str(path)))
+            checkpoints.save = record
+            run(lines, output, state = saved['state'] if saved else None, checkpoints = checkpoints)
+    return saves
+
+@pytest.mark.parametrize('e_relative, commands', [(False, True), (True, True), (False, False)])
+def test_resume(tmp_path, gcode, run, e_relative, commands):
+    input = tmp_path / 'in.gcode'
+    input.write_bytes(''.join(gcode(e_relative = e_relative, commands = commands)).encode()) # without commands, the checkpoints are taken after moves
+    reference = tmp_path / 'reference.gcode'
+    saves = run_file(run, input, reference, tmp_path / 'checkpoint.json')
+    assert len(saves) > 3
+
+    # interrupted after the second checkpoint, with some partial output past it
+    saved = saves[1]
+    output = tmp_path / 'out.gcode'
+    output.write_bytes(reference.read_bytes()[:saved['output_offset'] + 100])
+    resumed = run_file(run, input, output, tmp_path / 'resumed.json', saved)
+    assert output.read_bytes() == reference.read_bytes()
+    assert resumed == saves[2:]
@@ -0,0 +1,52 @@
+import discretize
+import move
+import numpy as np
+from pytest import approx
+
+tolerances = [0.002, 0.002, 0.05, 0.1]
+dynamic_model = [
+    move.spring_damper_parameters(f_n = 60, zeta = 0.05),
+    move.spring_damper_parameters(f_n = 50, zeta = 0.02),
+    move.spring_damper_parameters(),
+    move.pressure_advance_parameters(k = 0.05),
+]
+
+def generate(destination):
+    return move.generate_move([0, 0, 0, 0], destination, 100, 10000, 2000000, dynamic_model, None)
+
+def max_error(curves, points):
+    ts = np.linspace(points[-1,0], points[-1,-1], 2001)
+    return [np.max(np.abs(c.evaluate(ts) - np.interp(ts, points[-1], points[i]))) for i, c in enumerate(curves)]
+
+def test_within_tolerance():
+    curves = generate([20, 5, 0, 1])
+    points = discretize.linear_interpolate(curves, tolerances, 0)
+    for error, tolerance in zip(max_error(curves, points), tolerances):
+        assert error <= tolerance * (1 + 1e-6)
+    for i, c in enumerate(curves):
+        assert points[i] == approx(c.evaluate(points[-1]))
+
+def test_segment_budget():
+    curves = generate([20, 5, 0, 1])
+    full = discretize.linear_interpolate(curves, tolerances, 0)
+    knots = len(curves[0].knots)
+    budget = knots + 5
+    assert full.shape[1] > budget + 1
+
+    capped = discretize.linear_interpolate(curves, tolerances, 0, budget)
+    assert capped.shape[1] == budget + 1
+    assert np.all(np.diff(capped[-1]) > 0)
+    # the budget is spent on the worst intervals first
+    assert max(max_error(curves, capped)) < max(max_error(curves, discretize.linear_interpolate(curves, tolerances, 0, knots - 1)))
+
+def test_batch_budget():
+    moves = [generate([20, 5, 0, 1]), generate([1, 0, 0, 0.05]), None]
+    separate = [discretize.linear_interpolate(m, tolerances, 0) for m in moves[:2]]
+    batch = discretize.linear_interpolate_batch(moves, tolerances, 0)
+    assert batch[2] is None
+    for a, b in zip(separate, batch):
+        assert np.array_equal(a, b)
+
+    segments = sum(len(m[0].knots) - 1 for m in moves[:2])
+    capped = discretize.linear_interpolate_batch(moves, tolerances, 0, segments + 3)
+    assert sum(c.shape[1] - 1 for c in capped[:2]) == segments + 3
@@ -0,0 +1,32 @@
+import gcode_parser
+import numpy as np
+from pytest import approx
+
+def test_parse():
+    assert gcode_parser.parse('G1 X10 Y-2.5 E.5 F3000 ; move\n') == {'G': 1, 'X': 10, 'Y': -2.5, 'E': 0.5, 'F': 3000}
+    assert gcode_parser.parse('G1X10Y20Z0.3') == {'G': 1, 'X': 10, 'Y': 20, 'Z': 0.3}
+    assert gcode_parser.parse('g1 x1e5') == {'G': 1, 'X': 1, 'E': 5}
+    assert gcode_parser.parse('N12 G92 E0*71') == {'N': 12, 'G': 92, 'E': 0}
+    assert gcode_parser.parse('M117 Printing 3 layers') == {'M': 117}
+
+def test_parse_empty():
+    for line in ['', '\n', '   \n', '; comment', '  ;G1 X10']:
+        c = gcode_parser.parse(line)
+        assert not c
+        assert 'G' not in c
+
+def test_parse_chunk():
+    lines = ['G1 X10 Y20 F1200\n', '; G1 X5\n', 'M83\n', 'G1X1E-0.5\n', '', 'G92 E0 ; reset\n']
+    columns = gcode_parser.parse_chunk(lines)
+
+    for letter in 'GMXYZEF':
+        assert len(columns[letter]) == len(lines)
+        for i in range(len(lines)):
+            c = gcode_parser.parse(lines[i])
+            if letter in c:
+                assert columns[letter][i] == approx(c[letter])
+            else:
+                assert np.isnan(columns[letter][i])
+
+    empty = gcode_parser.parse_chunk([])
+    assert len(empty['G']) == 0
@@ -0,0 +1,94 @@
+import gcode_writer
+import gcode_parser
+import numpy as np
+from pytest import approx
+
+tolerances = [0.002, 0.002, 0.05, 0.1]
+
+# replay G1 lines, returns the X Y Z E F state after each line
+def replay(text, state, e_relative):
+    out = []
+    for line in text.splitlines():
+        c = gcode_parser.parse(line)
+        assert c['G'] == 1
+        for letter in 'XYZF':
+            if letter in c:
+                state[letter] = c[letter]
+        if 'E' in c:
+            state['E'] = state['E'] + c['E'] if e_relative else c['E']
+        out.append([state[letter] for letter in 'XYZEF'])
+    return np.array(out)
+
+def make_points(n, x0 = 0, e0 = 0):
+    t = np.linspace(0, 1, n)
+    return np.array([x0 + 10 * t**2, 5 * t, np.full(n, 0.2), e0 + 0.5 * t, t])
+
+def test_decimals():
+    assert [gcode_writer.output_decimals(t) for t in tolerances] == [4, 4, 3, 3]
+
+def test_format():
+    writer = gcode_writer.g1_writer(tolerances)
+    points = make_points(11)
+    text = writer.format(points, 2.0, False)
+    lines = text.splitlines()
+    assert len(lines) == 10
+    assert lines[0] == 'G1 X0.1 Y0.5 Z0.2 E2.05 F305.9'
+    assert all('Z' not in line for line in lines[1:]) # modal Z
+    assert all(not w.endswith('0') or '.' not in w for line in lines for w in line.split())
+
+    state = replay(text, dict.fromkeys('XYZEF', np.nan), False)
+    assert state[:,0] == approx(points[0,1:], abs=1e-4)
+    assert state[:,3] == approx(points[3,1:] + 2.0, abs=1e-3)
+
+    # the next move continues from the written state
+    assert 'Z' not in writer.format(make_points(3, x0 = 10, e0 = 0.5), 2.0, False).splitlines()[0]
+    writer.reset()
+    assert 'Z0.2' in writer.format(make_points(3, x0 = 10, e0 = 0.5), 2.0, False).splitlines()[0]
+
+def test_relative_extrusion():
+    writer = gcode_writer.g1_writer(tolerances)
+    state = dict.fromkeys('XYZEF', np.nan)
+    state['E'] = 0
+    total = 0
+    for i in range(200):
+        points = make_points(7)
+        points[3] *= 0.0123
+        total += points[3,-1]
+        replay(writer.format(points, 0, True), state, True)
+    # rounding errors don't accumulate
+    assert state['E'] == approx(total, abs=1e-3)
+
+def test_nan():
+    writer = gcode_writer.g1_writer(tolerances)
+    points = make_points(3)
+    points[0,1] = np.nan
+    try:
+        writer.format(points, 0, False)
+        assert False
+    except AssertionError as e:
+        assert 'NaN' in str(e)
+
+def test_number_format():
+    writer = gcode_writer.g1_writer(tolerances)
+    points = np.array([[0, 2, 1.5, -0.00001, -1.25, 10.1, 0.00004],
+                       [1, 1, 1, 1, 1, 1, 1],
+                       [0.2] * 7,
+                       [0, 0.1, 0.2, 0.2, 0.3, 1, 1.5],
+                       [0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6]])
+    # no trailing zeros or points, integers without decimals, no negative zero
+    assert writer.format(points, 0, False).splitlines() == [
+        'G1 X2 Y1 Z0.2 E0.1 F1200', 'G1 X1.5 E0.2 F300', 'G1 X0 F900', 'G1 X-1.25 E0.3 F750', 'G1 X10.1 E1 F6810', 'G1 X0 E1.5 F6060']
+
+def test_sub_resolution_segment():
+    writer = gcode_writer.g1_writer(tolerances)
+    # the second point moves less than the output resolution, its time goes to the next segment
+    points = np.array([[0, 1, 1.00001, 2],
+                       [0, 0, 0, 0],
+                       [0.2] * 4,
+                       [0, 0.1, 0.1, 0.2],
+                       [0, 0.1, 0.2, 0.3]])
+    assert writer.format(points, 0, False).splitlines() == ['G1 X1 Y0 Z0.2 E0.1 F600', 'G1 X2 E0.2 F300']
+    # a move that ends up where the last line left the printer writes nothing, not a lone F word
+    assert writer.format(np.array([[2, 2.00001], [0, 0], [0.2, 0.2], [0.2, 0.2], [0.3, 0.4]]), 0, False) == ''
+    # the feedrate is compared with the last line written
+    assert writer.format(np.array([[2, 2.00001, 3], [0, 0, 0], [0.2] * 3, [0.2, 0.2, 0.3], [0.4, 0.5, 0.6]]), 0, False) == 'G1 X3 E0.3\n'
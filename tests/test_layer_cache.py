@@ -0,0 +1,38 @@
+import layer_cache
+import process
+import config
+import io
+import pytest
+
+def test_runs():
+    lines = ['G21\n', 'G1 Z0.2 F600\n', 'G1 X1 Y1\n', 'G1 X2 Y1\n', 'G1 Z0.6\n', 'G1 X2 Y2\n', 'G1 Z0.2\n', '; Z 0.4\n',
+             'G92 Z0.4\n', 'G1 X1 Y1 Z0.4\n', 'G0 Z0.8\n']
+    assert list(layer_cache.runs(lines, min_lines = 2)) == [
+        ([None, 0.2], lines[:4]), ([0.6], lines[4:6]), ([0.2, 0.4], lines[6:10]), ([0.8], lines[10:])]
+    assert list(layer_cache.runs(lines, min_lines = 5)) == [([None, 0.2, 0.6], lines[:6]), ([0.2, 0.4, 0.8], lines[6:])]
+
+# process the G-code with the output of its layers cached in directory, returns the output and the layers reused
+def run_cached(run, lines, directory):
+    output = process.ordered_output(io.StringIO())
+    layers = process.cached_layers(str(directory), output, min_lines = 10)
+    return run(lines, output, layers = layers).getvalue(), layers.hits
+
+@pytest.mark.parametrize('e_relative', [False, True])
+def test_cached_layers(tmp_path, monkeypatch, gcode, run, e_relative):
+    lines = gcode(e_relative = e_relative)
+    directory = tmp_path / 'cache'
+    first, hits = run_cached(run, lines, directory)
+    assert hits == 0
+    again, hits = run_cached(run, lines, directory)
+    assert hits == 4 and again == first
+
+    # a calibration sweep that only changes the third layer
+    model = config.motion_parameters.dynamic_model[0]
+    f_n = model.f_n
+    def calibration(z):
+        monkeypatch.setattr(model, 'f_n', f_n + 10 if abs(z - 0.6) < 1e-6 else f_n)
+    monkeypatch.setattr(process, 'calibration_adjustment', calibration)
+    swept, hits = run_cached(run, lines, directory)
+    assert hits == 3 and swept != first
+    fresh, hits = run_cached(run, lines, tmp_path / 'fresh')
+    assert hits == 0 and swept == fresh
@@ -0,0 +1,69 @@
+import layer_index
+import gcode_parser
+import os
+import io
+import json
+
+GCODE = '''G21
+G90
+M83
+G92 E0
+G1 Z0.2 F600
+G1 X10 Y10 F3000
+G1 X20 Y10 E0.5
+G1 X20 Y20 E0.5 F1200
+G1 Z0.6 ; hop
+G1 X0 Y0
+G1 Z0.2
+G1 X10 Y0 E0.5
+M82
+G92 E0
+G1 Z0.4
+G1 X20 Y0 E1 F1800
+G1 X20 Y10 E2
+'''
+
+def full_parse(z, tolerance = 0.01):
+    state = layer_index.slice_state()
+    points = []
+    for line in io.StringIO(GCODE):
+        position = layer_index.step(state, gcode_parser.parse(line))
+        if position is not None and abs(state.z - z) < tolerance:
+            points.append(position)
+    return points
+
+def indexed(runs, z, tolerance = 0.01):
+    points = []
+    for state, lines in layer_index.read_layer(io.BytesIO(GCODE.encode()), runs, z, tolerance):
+        for line in lines:
+            position = layer_index.step(state, gcode_parser.parse(line))
+            if position is not None and abs(state.z - z) < tolerance:
+                points.append(position)
+    return points
+
+def test_runs():
+    runs = layer_index.build(io.BytesIO(GCODE.encode()))
+    assert [run[0] for run in runs] == [0.2, 0.6, 0.2, 0.4]
+    assert layer_index.layers(runs) == [0.2, 0.4, 0.6]
+    assert runs[-1][1] + runs[-1][2] == len(GCODE.encode())
+    # the state at the start of the hop back down
+    assert runs[2][3]['x'] == 0 and runs[2][3]['f'] == 1200 and runs[2][3]['e_relative']
+    for z in [0.2, 0.4, 0.6]:
+        assert indexed(runs, z) == full_parse(z)
+
+def test_sidecar(tmp_path, monkeypatch):
+    path = tmp_path / 'part.gcode'
+    path.write_text(GCODE)
+    runs = layer_index.load(str(path))
+    assert os.path.exists(layer_index.sidecar_path(str(path)))
+
+    # reused while the file is unchanged
+    builds = []
+    build = layer_index.build
+    monkeypatch.setattr(layer_index, 'build', lambda stream: builds.append(1) or build(stream))
+    assert json.dumps(layer_index.load(str(path))) == json.dumps(runs) # nan != nan
+    assert not builds
+
+    path.write_text(GCODE + 'G1 Z0.8\nG1 X0 Y0\n')
+    assert layer_index.layers(layer_index.load(str(path))) == [0.2, 0.4, 0.6, 0.8]
+    assert builds
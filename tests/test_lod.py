@@ -0,0 +1,26 @@
+import lod
+import numpy as np
+
+def test_minmax_indices():
+    t = np.linspace(0, 10, 100001)
+    y = np.stack([np.sin(t * 20), np.cos(t)])
+    y[0, 54321] = 5 # spike
+    keep = lod.minmax_indices(t, y, 0, 10, 500)
+    assert len(keep) <= 500 * 6 + 2
+    assert np.all(np.diff(keep) > 0)
+    assert 54321 in keep and keep[0] == 0 and keep[-1] == len(t) - 1
+    # every bucket keeps the extremes of each series
+    bucket = (t * 50).astype(int)
+    for b in [0, 123, 271, 499]:
+        inside = keep[bucket[keep] == b]
+        for series in y:
+            assert series[inside].max() == series[bucket == b].max()
+            assert series[inside].min() == series[bucket == b].min()
+
+    # zoomed in: all points in view, and one on either side
+    keep = lod.minmax_indices(t, y, 2.00005, 2.01005, 500)
+    assert list(keep) == list(range(20000, 20102))
+    assert lod.view(t, 2.00005, 2.01005) == (20000, 20102)
+
+    # outside the data
+    assert len(lod.minmax_indices(t, y, 11, 12, 500)) == 1
@@ -0,0 +1,79 @@
+import lookahead
+import move
+from math import cos, sin, radians
+from pytest import approx
+from motion_profiles import s_curve_transition_distance
+
+class motion_parameters:
+    dynamic_model = [
+        move.spring_damper_parameters(f_n = 60, zeta = 0.05),
+        move.spring_damper_parameters(f_n = 50, zeta = 0.02),
+        move.spring_damper_parameters(),
+        move.pressure_advance_parameters(k = 0.05),
+    ]
+    max_speed = 100
+    accel = 10000
+    jerk = 2000000
+    axis_limits = None
+
+class curve_parameters:
+    tolerances = [0.002, 0.002, 0.05, 0.1]
+
+class junction_parameters:
+    window = 8
+    max_velocity_step = [1, 1, 0.5, 1]
+
+def plan(points, speed = 100):
+    planner = lookahead.junction_planner(motion_parameters, curve_parameters, junction_parameters, lambda z: None)
+    speeds = []
+    for a, b in zip(points[:-1], points[1:]):
+        speeds.extend(planner.add(a, b, speed))
+    return speeds + planner.finish()
+
+def test_collinear():
+    points = [[x, 0, 0.2, 0.03 * x] for x in range(0, 21)]
+    speeds = plan(points)
+    assert len(speeds) == 20
+    assert speeds[0][0] == 0 and speeds[-1][1] == 0
+    assert max(end for _, end in speeds) == approx(100)
+    for (start, end), next in zip(speeds, speeds[1:]):
+        assert end == next[0]
+        # every speed change fits its move
+        assert s_curve_transition_distance(start, end, motion_parameters.accel, motion_parameters.jerk) <= 1 + 1e-9
+
+def test_corners():
+    # a square stops (nearly) at every corner, a shallow polygon doesn't
+    square = plan([[0, 0, 0, 0], [10, 0, 0, 0], [10, 10, 0, 0], [0, 10, 0, 0], [0, 0, 0, 0]])
+    assert all(end < 1 for _, end in square)
+
+    polygon = [[10 * cos(radians(a)), 10 * sin(radians(a)), 0, 0] for a in range(0, 30)]
+    speeds = plan(polygon)
+    assert all(end > 10 for _, end in speeds[:-1])
+
+def test_window_bounds_the_speed():
+    # the planner can't look past the window, so it has to be able to stop at its end
+    points = [[x / 10, 0, 0, 0] for x in range(0, 200)]
+    speeds = plan(points)
+    top = max(end for _, end in speeds)
+    assert s_curve_transition_distance(0, top, motion_parameters.accel, motion_parameters.jerk) <= junction_parameters.window * 0.1 + 1e-9
+
+def test_asymmetric_stops():
+    class asymmetric(motion_parameters):
+        dynamic_model = [move.asymmetric_spring_damper_parameters(f_n_positive = 50, f_n_negative = 55)] + motion_parameters.dynamic_model[1:]
+    planner = lookahead.junction_planner(asymmetric, curve_parameters, junction_parameters, lambda z: None)
+    speeds = []
+    points = [[0, 0, 0, 0], [1, 1, 0, 0], [2, 1.05, 0, 0]]
+    for a, b in zip(points[:-1], points[1:]):
+        speeds.extend(planner.add(a, b, 100))
+    speeds += planner.finish()
+    assert speeds == [(0, 0), (0, 0)]
+
+def test_generate_move_at_speed():
+    curves = move.generate_move([0, 0, 0, 0], [10, 0, 0, 0.3], 100, 10000, 2000000, motion_parameters.dynamic_model, None, 20, 40)
+    t = curves[0].range_max()
+    e_speed = curves[3].differentiate()
+    assert e_speed[0] == approx(0.03 * 20) and e_speed[t] == approx(0.03 * 40)
+    # the velocity dependent corrections are offset at both ends, continuing those of the neighbouring moves
+    c = 2 * 0.05 / (60 * 6.283185307179586)
+    assert curves[0][0] == approx(c * 20) and curves[0][t] == approx(10 + c * 40)
+    assert curves[3][0] == approx(0.05 * 0.03 * 20) and curves[3][t] == approx(0.3 + 0.05 * 0.03 * 40)
@@ -1,5 +1,6 @@
-from motion_profiles import s_curve_profile
+from motion_profiles import s_curve_profile, s_curve_profiles, s_curve_peaks, s_curve_profile_between, s_curve_reachable_speed, s_curve_transition_distance
 from pytest import approx
+import numpy as np
 
 def validate_s_curve_solution(acceleration, distance, t):
     
@@ -50,3 +51,64 @@ def test_s_curve_profile():
         run_case(10000, speed, accel, jerk)
         
     
+
+def test_s_curve_peaks():
+    for distance in [0, 0.01, 1, 10, 100, 1000]:
+        for speed, accel, jerk in [(10, 1000, 1000), (100, 1000, 1000), (200, 10000, 2000000), (24, 1000, 1000000), (100, 1000000, 1000)]:
+            acceleration = s_curve_profile(distance, speed, accel, jerk)
+            peak_speed, peak_accel = s_curve_peaks(distance, speed, accel, jerk)
+            if distance == 0:
+                assert (peak_speed, peak_accel) == (0, 0)
+                continue
+            assert peak_speed == approx(max(abs(y) for y in acceleration.integrate().minmax()))
+            assert peak_accel == approx(max(abs(y) for y in acceleration.minmax()))
+
+def test_s_curve_reachable_speed():
+    for start_speed in [0, 1, 30, 200]:
+        for distance in [0.001, 0.1, 10, 1000]:
+            for accel, jerk in [(10000, 2000000), (1000, 1000), (1000000, 1000)]:
+                speed = s_curve_reachable_speed(start_speed, distance, accel, jerk)
+                assert speed >= start_speed
+                assert s_curve_transition_distance(start_speed, speed, accel, jerk) == approx(distance, rel=1e-9, abs=1e-9)
+
+def test_s_curve_profile_between():
+    accel, jerk = 10000, 2000000
+    for distance, start_speed, end_speed, max_speed in [(10, 20, 30, 100), (0.1, 40, 40, 100), (50, 0, 30, 100), (50, 30, 0, 60), (5, 100, 100, 100), (1, 0, 10, 10), (0.3, 50, 0, 100)]:
+        acceleration = s_curve_profile_between(distance, start_speed, end_speed, max_speed, accel, jerk)
+        t = acceleration.range_max()
+        speed = acceleration.integrate() + start_speed
+        position = speed.integrate()
+
+        assert acceleration[0] == approx(0) and acceleration[t] == approx(0, abs=1e-6)
+        assert speed[0] == approx(start_speed) and speed[t] == approx(end_speed, abs=1e-6)
+        assert position[t] == approx(distance, rel=1e-9)
+        assert max(abs(y) for y in acceleration.minmax()) <= accel * (1 + 1e-9)
+        assert speed.minmax()[1] <= max(max_speed, start_speed, end_speed) * (1 + 1e-9)
+        assert speed.minmax()[0] >= -1e-9
+
+def test_s_curve_profiles():
+    cases = []
+    for i in range(8):
+        speed, accel, jerk = 10, 1000, 1000
+        if i & 1 == 1:
+            speed **= 2
+        if i & 2 == 2:
+            accel **= 2
+        if i & 4 == 4:
+            jerk **= 2
+        cases += [(distance, speed, accel, jerk) for distance in [0, 0.01, 1, 10, 100, 1000, 10000]]
+    distance, speed, accel, jerk = np.array(cases).T
+
+    phases, times, accels, counts = s_curve_profiles(distance, speed, accel, jerk)
+    assert phases.shape == (len(cases), 3) and times.shape == accels.shape == (len(cases), 8)
+    for i, case in enumerate(cases):
+        profile = s_curve_profile(*case)
+        assert list(times[i,:counts[i]]) == approx(list(profile.knots), rel=1e-12)
+        assert np.all(times[i,counts[i]:] == times[i,counts[i]-1])
+        if counts[i] > 1:
+            assert list(accels[i,:counts[i]]) == approx(list(profile.evaluate(profile.knots)), rel=1e-9, abs=1e-9 * case[2])
+            jerk_time, constant_accel_time, coasting_time = phases[i]
+            assert 4 * jerk_time + 2 * constant_accel_time + coasting_time == approx(profile.range_max())
+
+    # scalars are broadcast
+    assert np.array_equal(s_curve_profiles([1, 10], 100, 10000, 2000000)[1], s_curve_profiles([1, 10], [100, 100], 10000, [2000000] * 2)[1])
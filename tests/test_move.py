@@ -0,0 +1,71 @@
+import move
+import numpy as np
+import pytest
+from pytest import approx
+
+dynamic_model = [
+    move.spring_damper_parameters(f_n = 40, zeta = 0.1),
+    move.spring_damper_parameters(f_n = 30, zeta = 0.05),
+    move.spring_damper_parameters(),
+    move.pressure_advance_parameters(k = 0.05),
+]
+
+def peaks(curve):
+    speed = curve.differentiate()
+    accel = speed.differentiate()
+    jerk = accel.differentiate()
+    return [max(abs(y) for y in c.minmax()) for c in (speed, accel, jerk)]
+
+def check_limits(destination, speed, accel, jerk, model, limits, rel = 1e-6):
+    positions = move.generate_move([0, 0, 0, 0], destination, speed, accel, jerk, model, limits)
+    for i in range(len(limits)):
+        if limits[i]:
+            top_speed, top_accel, top_jerk = peaks(positions[i])
+            assert top_speed <= limits[i].speed * (1 + rel)
+            assert top_accel <= limits[i].accel * (1 + rel)
+            assert top_jerk <= limits[i].jerk * (1 + rel)
+    return positions
+
+def test_throttle():
+    limits = [move.axis_limits(speed = 150, accel = 6000), move.axis_limits(speed = 120, jerk = 500000), move.axis_limits(speed = 24, accel = 1000, jerk = 1000000), None]
+    for destination in [[10, 0, 0, 1], [0, 10, 0, 1], [30, 40, 0, 2], [0.5, -0.2, 0, 0.01], [1, 1, 2, 0], [0, 0, 0.2, 0], [0, 0, 0, 5]]:
+        for speed in [50, 200, 500]:
+            positions = check_limits(destination, speed, 10000, 2000000, dynamic_model, limits)
+            for i in range(4):
+                assert positions[i][positions[i].range_max()] == approx(destination[i])
+
+def test_throttle_events():
+    limits = [None, None, move.axis_limits(speed = 24, accel = 1000, jerk = 1000000), None]
+    before = dict(move.throttle_events)
+    check_limits([0, 0, 1, 0], 100, 10000, 2000000, dynamic_model, limits)
+    assert move.throttle_events['jerk'] == before.get('jerk', 0) + 1
+    assert move.throttle_events['accel'] == before.get('accel', 0) + 1
+
+def test_asymmetric_fallback():
+    model = list(dynamic_model)
+    model[1] = move.asymmetric_spring_damper_parameters(f_n_positive = 30, f_n_negative = 25, zeta = 0.05)
+    limits = [move.axis_limits(speed = 150), move.axis_limits(speed = 150, accel = 8000), None, None]
+    for destination in [[0, 10, 0, 1], [10, -20, 0, 1]]:
+        check_limits(destination, 200, 10000, 2000000, model, limits, rel = 1e-3) # iterates to within 1e-4 per step
+
+def test_position_matrix():
+    # the axis positions of the matrix product equal the models applied to the arc profile one by one
+    source, destination = [1, 2, 0.2, 3], [11, -3, 0.4, 3.5]
+    for start_speed, end_speed in [(0, 0), (40, 20)]:
+        positions = move._generate_positions(source, [10, -5, 0.2, 0.5], 125 ** 0.5, 100, 10000, 2000000, dynamic_model, start_speed, end_speed)
+        acceleration, speed, position = move._arc_profile(125 ** 0.5, start_speed, end_speed, 100, 10000, 2000000)
+        t = acceleration.knots[0] + (acceleration.knots[-1] - acceleration.knots[0]) * (0.5 + 0.5 * np.cos(np.linspace(0, np.pi, 50)))
+        for i in range(4):
+            k = (destination[i] - source[i]) / 125 ** 0.5
+            model = dynamic_model[i]
+            if isinstance(model, move.spring_damper_parameters) and model.f_n > 0:
+                omega_n = model.f_n * 2 * np.pi
+                expected = position * k + acceleration * (k * omega_n**-2) + speed * (k * 2 * model.zeta / omega_n)
+            elif isinstance(model, move.pressure_advance_parameters):
+                expected = (speed * k + acceleration * (k * model.k)).integrate() + k * model.k * start_speed
+            else:
+                expected = position * k
+            assert positions[i].evaluate(t) == approx((expected + source[i]).evaluate(t), abs=1e-12)
+    # every axis needs its model
+    with pytest.raises(AssertionError):
+        move._position_matrix(dynamic_model[:3], [1, 0, 0, 0])
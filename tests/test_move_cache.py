@@ -0,0 +1,54 @@
+import move
+import move_cache
+import discretize
+import numpy as np
+from pytest import approx
+
+dynamic_model = [
+    move.spring_damper_parameters(f_n = 60, zeta = 0.05),
+    move.spring_damper_parameters(f_n = 50, zeta = 0.02),
+    move.spring_damper_parameters(),
+    move.pressure_advance_parameters(k = 0.05),
+]
+tolerances = [0.002, 0.002, 0.05, 0.1]
+
+def generate(source, destination):
+    curves = move.generate_move(source, destination, 100, 10000, 2000000, dynamic_model, None)
+    return discretize.linear_interpolate(curves, tolerances, 1/200) if curves else None
+
+def test_translation():
+    cache = move_cache.profile_cache()
+    parameters = move_cache.parameters_key(dynamic_model)
+
+    a = cache.get([0, 0, 0.2, 0], [10, 5, 0.2, 0.5], parameters, generate)
+    b = cache.get([20, 30, 0.4, 0], [30, 35, 0.4, 0.5], parameters, lambda *move: None)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    expected = generate([20, 30, 0.4, 0], [30, 35, 0.4, 0.5])
+    assert b.shape == expected.shape
+    assert b == approx(expected, abs=1e-9)
+    assert a[:,0] == approx([0, 0, 0.2, 0, 0])
+    assert list(b[:-1,-1]) == [30, 35, 0.4, 0.5]
+
+    # different parameters are a miss
+    cache.get([0, 0, 0, 0], [10, 5, 0, 0.5], (parameters, 1), lambda *move: None)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+def test_memory_cap():
+    size = generate([0, 0, 0, 0], [10, 0, 0, 0]).nbytes
+    cache = move_cache.profile_cache(max_bytes = 2 * size)
+    for x in [10, 10.5, 11]:
+        cache.get([0, 0, 0, 0], [x, 0, 0, 0], None, generate)
+    assert len(cache) < 3
+    assert cache.bytes <= cache.max_bytes
+    cache.get([0, 0, 0, 0], [11, 0, 0, 0], None, lambda *move: None)
+    assert cache.hits == 1
+
+def test_hit_is_fresh():
+    # a hit is the same as generating the move again, up to the last bit, for a delta that is the same up to the quantum
+    cache = move_cache.profile_cache()
+    cache.get([0.1, 0.2, 0.2, 0], [10.2, 5.3, 0.2, 0.5], None, generate)
+    hit = cache.get([20.3, 30.1, 0.4, 0], [30.4, 35.2, 0.4, 0.5], None, lambda *move: None)
+    fresh = move_cache.profile_cache().get([20.3, 30.1, 0.4, 0], [30.4, 35.2, 0.4, 0.5], None, generate)
+    assert cache.hits == 1
+    assert np.array_equal(hit, fresh)
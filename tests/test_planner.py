@@ -0,0 +1,58 @@
+import numpy as np
+from pytest import approx
+import planner
+
+class parameters:
+    max_segments_per_s = 100
+    buffer_depth = 4
+    serial_cost = 0
+    max_relaxation = 8
+
+def test_planner_model():
+    model = planner.planner_model(100, 4)
+    # segments longer than the line cost keep the queue filled
+    assert model.push([0.02] * 20) == approx(0)
+    # shorter segments drain it, until the printer waits for every line
+    assert model.predict([0.005] * 10) > 0
+    assert model.stall == approx(0) # predict() doesn't change the state
+    assert model.push([0.005] * 40) > 0
+    # once drained, every segment waits for the rest of the line cost
+    assert model.push([0.005] * 10) == approx(10 * (0.01 - 0.005))
+
+def test_decimate():
+    t = np.linspace(0, 1, 11)
+    points = np.array([t, t**2, 0*t, 0*t, t])
+    coarse = planner.decimate(points, [0.01] * 4)
+    assert coarse[:,0] == approx(points[:,0]) and coarse[:,-1] == approx(points[:,-1])
+    assert 2 < coarse.shape[1] < points.shape[1]
+    # every dropped point is within tolerance of the coarse path
+    assert np.interp(t, coarse[-1], coarse[1]) == approx(t**2, abs = 0.01 + 1e-9)
+    assert planner.decimate(points, [1] * 4).shape[1] == 2
+
+def test_capacity_control():
+    control = planner.capacity_control(parameters, [0.01] * 4)
+    t = np.linspace(0, 0.05, 11)
+    points = np.array([t, t**2, 0*t, 0*t, t])
+    for _ in range(10):
+        coarse = control.adjust(points)
+    assert coarse.shape[1] < points.shape[1]
+    assert sum(control.coarsened.values()) > 0
+    assert control.summary() is not None
+
+def test_relaxation_cap(monkeypatch):
+    class capped(parameters):
+        max_relaxation = 5
+    factors = []
+    decimate = planner.decimate
+    def record(points, tolerances):
+        factors.append(round(tolerances[0] / 0.01) + 1)
+        return decimate(points, tolerances)
+    monkeypatch.setattr(planner, 'decimate', record)
+    control = planner.capacity_control(capped, [0.01] * 4)
+    # a printer that never keeps up, so every relaxation is tried
+    monkeypatch.setattr(control.model, 'predict', lambda durations: 1)
+    t = np.linspace(0, 0.05, 11)
+    control.adjust(np.array([t, t**2, 0*t, 0*t, t]))
+    # 2x, 4x and then the cap itself, which is the relaxation reported
+    assert factors == [2, 4, 5]
+    assert control.relaxation == 5
@@ -1,3 +1,6 @@
+import numpy as np
+from math import inf
+from pytest import approx
 import polynomial as poly
 
 test_polynomials = [[0],[1],[2],[0,1],[1,0],[1,2,3],[0,1,2,3,4,5],[5,4,3,2,1,0]]
@@ -39,3 +42,52 @@ def test_shift():
             g = poly.shift(f, b)
             for x in range(-10, 10):
                 assert poly.eval(f,x) == poly.eval(g, x-b)
+
+def test_find_roots():
+    rng = np.random.default_rng(1)
+    for degree in range(1, 8):
+        for _ in range(20):
+            roots = np.sort(rng.uniform(-5, 5, degree))
+            p = list(np.polynomial.polynomial.polyfromroots(roots))
+            assert poly.find_roots(p, -6, 6) == approx(roots, abs = 1e-6)
+            assert poly.find_roots(p, -inf, inf) == approx(roots, abs = 1e-6)
+            if degree > 1:
+                assert poly.find_roots(p, (roots[0] + roots[1]) / 2, 6) == approx(roots[1:], abs = 1e-6)
+
+    # double root at a critical point, no real roots
+    assert poly.find_roots([0, 0, -2, 1], -1, 3) == [0, 2]
+    assert poly.find_roots([1, 0, 1, 0, 1], -10, 10) == []
+
+def test_find_roots_batch():
+    p = [[-6, 11, -6, 1], [-2, 1, 0, 0], [1, 0, 0, 0], [0, 0, 0, 0]]
+    roots = poly.find_roots_batch(p, [0, 0, 0, 0], [2.5, 10, 10, 10])
+    assert roots.shape == (4, 3)
+    assert roots[0,:2] == approx([1, 2])
+    assert roots[1,0] == approx(2)
+    assert np.isnan(roots[0,2]) and np.isnan(roots[1:,1:]).all() and np.isnan(roots[2:]).all()
+
+def test_minmax_batch():
+    p = [[1, 2, -3, 1], [0, 1, 0, 0]]
+    y_min, y_max = poly.minmax_batch(p, [0, -1], [2, 1])
+    for i in range(len(p)):
+        assert (y_min[i], y_max[i]) == approx(poly.minmax(p[i], [0, -1][i], [2, 1][i]))
+    xs = np.linspace(0, 2, 10001)
+    assert y_min[0] == approx(min(poly.eval(p[0], xs)), abs = 1e-6)
+
+def test_shift_batch():
+    rng = np.random.default_rng(2)
+    coeffs = rng.uniform(-1, 1, (20, 6))
+    x0 = rng.uniform(-3, 3, 20)
+    shifted = poly.shift_batch(coeffs, x0)
+    same = poly.shift_batch(coeffs, 0.5)
+    for i in range(len(coeffs)):
+        assert list(shifted[i]) == approx(list(poly.shift(coeffs[i], x0[i])), rel=1e-12, abs=1e-12)
+        assert list(same[i]) == approx(list(poly.shift(coeffs[i], 0.5)), rel=1e-12, abs=1e-12)
+        for x in [-1, 0, 0.3, 2]:
+            assert poly.eval(shifted[i], x) == approx(poly.eval(coeffs[i], x + x0[i]), rel=1e-9, abs=1e-9)
+
+def test_mul():
+    for p in test_polynomials:
+        for q in test_polynomials:
+            for x in range(-10, 10):
+                assert poly.eval(poly.mul(p, q), x) == poly.eval(p, x) * poly.eval(q, x)
@@ -0,0 +1,144 @@
+import smoothing
+import lookahead
+import move
+import numpy as np
+from math import cos, sin, radians
+from pytest import approx
+
+dynamic_model = [
+    move.spring_damper_parameters(f_n = 60, zeta = 0.05),
+    move.spring_damper_parameters(f_n = 50, zeta = 0.02),
+    move.spring_damper_parameters(),
+    move.pressure_advance_parameters(k = 0.05),
+]
+tolerances = [0.002, 0.002, 0.05, 0.1]
+
+class chain_parameters:
+    min_moves = 4
+    max_moves = 256
+    max_segment_length = 1.0
+    max_angle = 10
+    tolerance = 0.01
+    knot_spacing = 2.0
+
+# vertices of an arc of the given radius, rounded to the 3 decimals of typical G-code
+def arc(radius = 15, segment = 0.1, angle = 90):
+    steps = int(radians(angle) * radius / segment)
+    a = np.linspace(0, radians(angle), steps + 1)
+    return [[round(radius * cos(t), 3), round(radius * sin(t), 3), 0.2, round(0.04 * radius * t, 5)] for t in a]
+
+def test_natural_spline():
+    x = np.array([0, 1, 2.5, 3, 5])
+    y = np.array([1, -1, 2, 0, 1])
+    s = smoothing.natural_spline(x, y)
+    assert s.evaluate(x) == approx(y)
+    second = s.differentiate().differentiate()
+    assert second.evaluate([0, 5]) == approx([0, 0], abs=1e-12)
+    # continuous up to the second derivative
+    for c in [s, s.differentiate(), second]:
+        assert c.evaluate(x[1:-1] - 1e-9) == approx(c.evaluate(x[1:-1] + 1e-9), abs=1e-6)
+
+def test_fit_arc():
+    vertices = arc()
+    fit, deviation = smoothing.fit_chain(vertices, 0.01, 2.0)
+    assert deviation.max() <= 0.01
+    assert len(fit.knot_vertices) < len(vertices) / 5
+    # the ends are exact, e is centered
+    assert [c[0] for c in fit.curves] == approx(np.array(vertices[0]) - [0, 0, 0, vertices[0][3]])
+    assert [c[fit.length] for c in fit.curves[:3]] == approx(vertices[-1][:3])
+    assert fit.curves[3][fit.length] + fit.e_offset == approx(vertices[-1][3])
+    # the rounding of the coordinates doesn't show up as curvature (an interpolating spline shows ~0.5), the natural
+    # ends (straight) overshoot it a little next to them
+    assert 1 / 15 < fit.max_curvature() < 2 / 15
+    entry, exit = fit.directions()
+    assert entry[:2] == approx([0, 1], abs=0.03)
+    assert exit[:2] == approx([-1, 0], abs=0.03)
+
+def test_fit_refines_knots():
+    # a wiggle between the knots of the initial spacing needs more knots
+    vertices = [[x * 0.2, 0.05 * sin(x * 0.2 * 3), 0, 0] for x in range(60)]
+    coarse = smoothing.chain_fit(vertices, 2.0)
+    assert coarse.deviation().max() > 0.01
+    fit, deviation = smoothing.fit_chain(vertices, 0.01, 2.0)
+    assert deviation.max() <= 0.01
+    assert len(fit.knot_vertices) > len(coarse.knot_vertices)
+
+def test_generate_chain():
+    fit, _ = smoothing.fit_chain(arc(), 0.01, 2.0)
+    for start, end in [(0, 0), (20, 0), (20, 30)]:
+        positions = smoothing.generate_chain(fit, 50, 10000, 2000000, dynamic_model, None, tolerances, start, end)
+        knots = positions[0].knots
+        assert all(np.array_equal(p.knots, knots) for p in positions)
+        if start == 0 and end == 0:
+            # at standstill, the corrections vanish at both ends (up to the approximation of the speed)
+            assert [p[knots[0]] for p in positions] == approx([c[0] for c in fit.curves], abs=1e-5)
+            assert [p[knots[-1]] for p in positions] == approx([c[fit.length] for c in fit.curves], abs=1e-5)
+
+    # without corrections, the positions follow the path at the profile's speed
+    zero = [move.spring_damper_parameters()] * 3 + [move.pressure_advance_parameters()]
+    positions = smoothing.generate_chain(fit, 50, 10000, 2000000, zero, None, tolerances)
+    t = np.linspace(positions[0].knots[0], positions[0].knots[-1], 200)
+    x, y = positions[0].evaluate(t), positions[1].evaluate(t)
+    assert np.hypot(x, y) == approx(15, abs=0.01)
+    speed = np.hypot(positions[0].differentiate().evaluate(t), positions[1].differentiate().evaluate(t))
+    assert speed.max() == approx(50, rel=0.01)
+
+def detect(moves, parameters = chain_parameters):
+    detector = smoothing.chain_detector(parameters, dynamic_model)
+    runs = []
+    for source, destination, speed in moves:
+        runs.extend(detector.add(source, destination, speed, False, 'G1\n'))
+    return runs + detector.finish()
+
+def test_detector():
+    vertices = arc(angle = 30)
+    moves = [(a, b, 50) for a, b in zip(vertices[:-1], vertices[1:])]
+    runs = detect(moves)
+    assert len(runs) == 1 and len(runs[0][0]) == len(moves) and runs[0][1] is not None
+
+    # a sharp corner, a long move and a change in speed break the chain
+    corner = [[15, 0, 0.2, 0], [15, 0.1, 0.2, 0.1], [15, 0.2, 0.2, 0.2], [15, 0.3, 0.2, 0.3], [15, 0.4, 0.2, 0.4],
+              [14.9, 0.4, 0.2, 0.5], [14.8, 0.4, 0.2, 0.6], [14.7, 0.4, 0.2, 0.7], [14.6, 0.4, 0.2, 0.8], [4.6, 0.4, 0.2, 1.8]]
+    corner_moves = [(a, b, 50) for a, b in zip(corner[:-1], corner[1:])]
+    runs = detect(corner_moves)
+    assert [len(run) for run, _ in runs] == [4, 4, 1]
+    assert [fit is None for _, fit in runs] == [False, False, True]
+
+    runs = detect(moves[:5] + [(a, b, 60) for a, b, _ in moves[5:10]])
+    assert [len(run) for run, _ in runs] == [5, 5]
+
+    # short runs are left as single moves
+    runs = detect(moves[:3])
+    assert [len(run) for run, _ in runs] == [1, 1, 1]
+
+def test_detector_leaves_asymmetric_axes():
+    detector = smoothing.chain_detector(chain_parameters, [dynamic_model[0], move.asymmetric_spring_damper_parameters(50, 60, 0.02)] + dynamic_model[2:])
+    vertices = arc(angle = 30)
+    runs = []
+    for a, b in zip(vertices[:-1], vertices[1:]):
+        runs.extend(detector.add(a, b, 50, False, 'G1\n'))
+    runs.extend(detector.finish())
+    assert all(len(run) == 1 for run, _ in runs)
+
+def test_chain_junctions():
+    class motion_parameters:
+        max_speed = 100
+        accel = 10000
+        jerk = 2000000
+        axis_limits = None
+    motion_parameters.dynamic_model = dynamic_model
+    class curve_parameters:
+        tolerances = tolerances
+    class junction_parameters:
+        window = 8
+        max_velocity_step = [1, 1, 0.5, 1]
+
+    # a line that continues tangentially into an arc is joined at speed
+    vertices = arc()
+    fit, _ = smoothing.fit_chain(vertices, 0.01, 2.0)
+    planner = lookahead.junction_planner(motion_parameters, curve_parameters, junction_parameters, lambda z: None)
+    speeds = planner.add([15, -10, 0.2, vertices[0][3] - 0.4], vertices[0], 100)
+    speeds += planner.add_chain(fit, 100)
+    speeds += planner.finish()
+    assert len(speeds) == 2
+    assert speeds[0][1] == speeds[1][0] > 10
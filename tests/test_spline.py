@@ -2,6 +2,7 @@ import spline
 import polynomial as poly
 from pytest import approx
 import copy
+import numpy as np
 
 test_polynomials = [[0],[1],[0,1],[1,0],[1,2,3],[4,2,1]]#,[0,1,2,3,4,5],[5,4,3,2,1,0]]
 test_knots = [-5, -4.9999, -4, -1, -0.1, -0.00001, 0, 0.00001, 0.1, 1, 2, 4.99999, 5]
@@ -62,6 +63,24 @@ def test_insert_knots():
         for x in range(-10,10):
             assert s[x] == approx(t[x])
 
+def test_harmonize_knots():
+    splines = [copy.deepcopy(s) for s in test_splines()[::3]]
+    x = np.linspace(-10, 10, 401)
+    before = [s.evaluate(x) for s in splines]
+    spline.harmonize_knots(splines)
+    knots = np.unique(np.concatenate([s.knots for s in test_splines()[::3]]))
+    for s, y in zip(splines, before):
+        assert np.array_equal(s.knots, knots)
+        assert len(s.coeffs) == len(knots) + 1
+        assert list(s.evaluate(x)) == approx(list(y))
+
+    # a curve with a zero width piece keeps it
+    s = spline.curve([0, 1, 1, 2], [0, 1, 3, 4])
+    t = spline.curve(s)
+    t.insert_knots([0.5, 1, 3])
+    assert list(t.knots) == [0, 0.5, 1, 1, 2, 3]
+    assert list(t.evaluate(x)) == approx(list(s.evaluate(x)))
+
 def test_add():
     for f in test_splines():
         for g in test_splines():
@@ -104,3 +123,53 @@ def test_kinked_line():
                 y = k2 * o
             assert h[x] == approx(y)
 
+
+def test_kinked_composite():
+    splines = test_splines()
+    batch = spline.kinked_composite(splines, 0.7, 1.3)
+    for g, h in zip(splines, batch):
+        expected = spline.composite(spline.kinked_line(0.7, 1.3), g)
+        assert list(h.knots) == approx(list(expected.knots))
+        x = np.linspace(-10, 10, 401)
+        assert list(h.evaluate(x)) == approx(list(expected.evaluate(x)))
+
+    # gains per curve
+    h = spline.kinked_composite(splines[:2], [0.5, 2], 3)
+    for g, k, u in zip(splines[:2], [0.5, 2], h):
+        expected = spline.composite(spline.kinked_line(k, 3), g)
+        assert list(u.evaluate(x)) == approx(list(expected.evaluate(x)))
+
+
+def test_packed_coefficients():
+    for s in test_splines():
+        assert s.coeffs.shape[0] == len(s.knots) + 1
+        assert s.knots.dtype == np.float64
+
+def test_arithmetic():
+    for s in test_splines():
+        t = s * 2.5 + 1.0
+        u = s.shift(0.5)
+        d = s.differentiate()
+        for x in range(-10, 10):
+            assert t[x] == approx(2.5 * s[x] + 1.0)
+            assert u[x] == approx(s[x + 0.5])
+            ix = s.poly_index(x)
+            assert d[x] == approx(poly.eval(poly.differentiate(s.polys[ix]), x))
+
+def test_integrate():
+    for s in test_splines():
+        i = s.integrate()
+        for k in i.knots:
+            eps = 1e-12
+            assert i[k-eps] == approx(i[k+eps], abs=1e-9), "ensure continuity"
+        d = i.differentiate()
+        for x in range(-10, 10):
+            assert d[x] == approx(s[x])
+
+def test_evaluate():
+    xs = np.linspace(-10, 10, 101)
+    for s in test_splines():
+        ys = s.evaluate(xs)
+        for x, y in zip(xs, ys):
+            assert y == s[x]
+        assert s.evaluate(s.knots) == approx([s[k] for k in s.knots])
@@ -0,0 +1,33 @@
+import stats
+
+def test_disabled_is_noop():
+    stats.enabled = False
+    stats.totals.clear()
+    stats.count('a')
+    stats.record('b', 3)
+    with stats.stage('c'):
+        pass
+    f = lambda x: x
+    assert stats.timed('d', f) is f
+    assert not stats.totals
+
+def test_report():
+    stats.enabled = True
+    stats.totals.clear()
+    stats.maxima.clear()
+    try:
+        stats.count('moves', 2)
+        stats.record('depth', 1)
+        stats.record('depth', 5)
+        with stats.stage('parse'):
+            pass
+        stats.merge({'count.moves': 3}, {'depth': 4})
+        r = stats.report()
+        assert r['counts']['moves'] == 5
+        assert r['records']['depth'] == {'count': 2, 'sum': 6, 'mean': 3, 'max': 5}
+        assert r['stages']['parse']['calls'] == 1
+        assert 'moves' in stats.format_report(r)
+    finally:
+        stats.enabled = False
+        stats.totals.clear()
+        stats.maxima.clear()
@@ -0,0 +1,38 @@
+import process
+import config
+import io
+import pytest
+
+def test_variant_outputs(gcode, run):
+    # circles of short segments (chains), then squares (junctions), and a layer change that is throttled by the Z limits
+    lines = gcode(layers = 2, commands = False)
+    specs = ['', 'x.f_n=50 y.zeta=0.05', 'accel=800']
+    base = {}
+    variants = [process.variant(spec, base) for spec in specs]
+    outs = [io.StringIO() for spec in specs]
+    output = process.variant_outputs(outs, variants)
+    process.process(iter(lines), output)
+    output.close()
+
+    # the same as processing the input separately for every variant
+    separate = [process.ordered_output(io.StringIO(), calibration = v) for v in variants]
+    for o in separate:
+        run(lines, o)
+    for target, attribute, value in base.values():
+        setattr(target, attribute, value)
+    assert outs[0].getvalue() == run(lines).getvalue()
+    assert [out.getvalue() for out in outs] == [o.out.getvalue() for o in separate]
+    assert len(set(out.getvalue() for out in outs)) == 3
+    # and so are the counts of axis limit throttling
+    throttled = [{kind: o.counters[kind] for kind in ['throttle_speed', 'throttle_accel', 'throttle_jerk']} for o in separate]
+    assert [{kind: o.counters[kind] for kind in throttled[0]} for o in output.outputs] == throttled
+    assert throttled[0] != throttled[2]
+
+def test_variant_names():
+    base = {}
+    process.variant('x.f_n=48, e.k=0.02 jerk=1000', base)
+    assert sorted(base) == ['e.k', 'jerk', 'x.f_n']
+    assert base['x.f_n'][2] == config.motion_parameters.dynamic_model[0].f_n
+    for spec in ['w.f_n=1', 'x.spring=1', 'dynamic_model=1']:
+        with pytest.raises(ValueError):
+            process.variant(spec, base)